@@ -1,15 +1,62 @@
 from bedrock_agentcore import BedrockAgentCoreApp
-from strands import Agent
-from mcp.client.streamable_http import streamablehttp_client
-from strands import Agent
-from strands.tools.mcp.mcp_client import MCPClient
+from mcp_connection import MCPConnectionManager
+from agent_cache import AgentCache, DEFAULT_MAX_TEMPLATES
+from invocation_trace import InvocationTrace, combined_usage, token_usage, usage_attributes
+from tool_cache import DEFAULT_MAX_ENTRIES, DEFAULT_TTL_SECONDS, USAGE_KEY, ToolResultCache, usage_summary
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 import logging
+import os
+import threading
+import time
 
 # use the cloudwatch logger
 logger = logging.getLogger("bedrock_agentcore.app")
 
 app = BedrockAgentCoreApp()
 
+# with JWT_DISCOVERY_URL set, invocations need a FusionAuth access token for this agent, checked in the container,
+# for running it without AgentCore's customJWTAuthorizer (app.run() on your own host). JWT_ALLOWED_AUDIENCE is the
+# agent's client id and JWT_ALLOWED_CLIENTS the comma separated supervisor client ids, as in setup.sh.
+if os.getenv("JWT_DISCOVERY_URL"):
+    from jwt_authorizer import DEFAULT_REFRESH_SECONDS, JWKSCache, JWTAuthorizerMiddleware, TokenAuthorizer
+    jwt_keys = JWKSCache(os.getenv("JWT_DISCOVERY_URL"),
+                         refresh_seconds=int(os.getenv("JWT_KEYS_REFRESH_SECONDS", str(DEFAULT_REFRESH_SECONDS)))).start()
+    app.add_middleware(JWTAuthorizerMiddleware, authorizer=TokenAuthorizer(
+        jwt_keys,
+        os.getenv("JWT_ALLOWED_AUDIENCE"),
+        allowed_clients=[client for client in os.getenv("JWT_ALLOWED_CLIENTS", "").split(",") if client]
+    ))
+
+# documentation lookups answered from here instead of calling context7 again.
+# TOOL_CACHE_PATH also keeps them on disk, so a restarted container starts warm.
+tool_cache = ToolResultCache(
+    max_entries=int(os.getenv("TOOL_CACHE_SIZE", str(DEFAULT_MAX_ENTRIES))),
+    ttl=int(os.getenv("TOOL_CACHE_TTL", str(DEFAULT_TTL_SECONDS))),
+    directory=os.getenv("TOOL_CACHE_PATH")
+)
+
+# one warm MCP session per container, shared by every request that enables doc tools
+doc_tools = MCPConnectionManager(os.getenv("DOC_TOOLS_URL", "https://mcp.context7.com/mcp"),
+                                 result_cache=tool_cache if os.getenv("TOOL_CACHE", "true").lower() == "true" else None)
+
+# need the us prefix, per https://strandsagents.com/latest/documentation/docs/user-guide/concepts/model-providers/amazon-bedrock/#on-demand-throughput-isnt-supported
+DEFAULT_MODEL = "us.anthropic.claude-sonnet-4-5-20250929-v1:0"
+
+# built model clients, reused by every request with the same model, system prompt and tools
+agent_cache = AgentCache(max_templates=int(os.getenv("AGENT_CACHE_SIZE", str(DEFAULT_MAX_TEMPLATES))))
+
+# documents of a batched request (a payload with "documents") that are worked on at once
+BATCH_CONCURRENCY = int(os.getenv("AGENT_BATCH_CONCURRENCY", "8"))
+
+def warm_up():
+    """Build the model clients named in AGENT_WARM_MODELS (the default model unless set) before the first request"""
+    agent_cache.warm([model for model in os.getenv("AGENT_WARM_MODELS", DEFAULT_MODEL).split(",") if model])
+
+# in the background, so the container can start taking requests straight away
+if os.getenv("AGENT_WARMUP", "true").lower() == "true":
+    threading.Thread(target=warm_up, daemon=True).start()
+
 @app.entrypoint
 def invoke(payload):
     """Your AI agent function"""
@@ -21,25 +68,113 @@ def invoke(payload):
 
     if model is None or model == "":
         #model =  "anthropic.claude-3-5-sonnet-20240620-v1:0"
-        # need the us prefix, per https://strandsagents.com/latest/documentation/docs/user-guide/concepts/model-providers/amazon-bedrock/#on-demand-throughput-isnt-supported
-        model =  "us.anthropic.claude-sonnet-4-5-20250929-v1:0"
+        model = DEFAULT_MODEL
     logger.error("model: " + str(model))
 
+    # spans are reported under the supervisor's trace
+    trace = InvocationTrace(payload.get("trace"))
+
     # default to no tools
-    agent = Agent(system_prompt=system_message, model=model)
+    with trace.span("agent.tools", doc_tools_enabled=doc_tools_enabled):
+        tools = doc_tools.get_tools() if doc_tools_enabled else None
+
+    if payload.get("documents") is not None:
+        return invoke_batch(payload["documents"], system_message, tools, model, doc_tools_enabled, trace)
+
+    with trace.span("agent.build", model=model) as attributes:
+        # the tool list is replaced whenever the MCP session reconnects, so its identity keys the tool set
+        agent, cache_hit = agent_cache.agent(model, system_message, tools, id(tools) if tools else None)
+        metrics = agent_cache.metrics()
+        attributes.update(cache_hit=cache_hit, cache_templates=metrics["templates"],
+                          cache_evictions=metrics["evictions"], cache_hit_rate=metrics["hit_rate"])
+
+    # this invocation's tool cache hits and misses
+    tool_usage = Counter()
+
+    if payload.get("stream"):
+        return stream_response(agent, user_message, doc_tools_enabled, trace, model, tool_usage)
+
+    try:
+        with trace.span("agent.generation", model=model) as attributes:
+            result = agent(user_message, **{USAGE_KEY: tool_usage})
+            usage = token_usage(result)
+            attributes.update(usage_attributes(usage))
+            attributes.update(tool_cache_attributes(tool_usage))
+    except Exception:
+        if doc_tools_enabled:
+            # a broken MCP session would fail every later request too, so start a new one next time
+            doc_tools.reset()
+        raise
+    return {"result": result.message, "usage": usage, "tool_cache": tool_cache_metadata(tool_usage), "trace": trace.to_dict()}
+
+def invoke_batch(documents, system_message, tools, model, doc_tools_enabled, trace):
+    """Run each {"id", "prompt"} document as its own conversation under the shared system prompt, BATCH_CONCURRENCY at a time, and return the results keyed by id"""
+    tool_usage = Counter()
+    usage_lock = threading.Lock()
+
+    def run(document):
+        document_usage = Counter()
+        with trace.span("agent.build", model=model, document_id=document["id"]) as attributes:
+            agent, cache_hit = agent_cache.agent(model, system_message, tools, id(tools) if tools else None)
+            attributes.update(cache_hit=cache_hit)
+        with trace.span("agent.generation", model=model, document_id=document["id"]) as attributes:
+            result = agent(document["prompt"], **{USAGE_KEY: document_usage})
+            usage = token_usage(result)
+            attributes.update(usage_attributes(usage))
+            attributes.update(tool_cache_attributes(document_usage))
+        with usage_lock:
+            tool_usage.update(document_usage)
+        return {"result": result.message, "usage": usage}
+
+    results = {}
+    with trace.span("agent.batch", model=model, documents=len(documents), concurrency=BATCH_CONCURRENCY) as attributes:
+        with ThreadPoolExecutor(max_workers=max(1, min(BATCH_CONCURRENCY, len(documents)))) as executor:
+            futures = [(document["id"], executor.submit(run, document)) for document in documents]
+            for document_id, future in futures:
+                try:
+                    results[document_id] = future.result()
+                except Exception as e:
+                    # the other documents' results are still returned
+                    logger.error(f"batched document {document_id} failed: {type(e).__name__}: {e}")
+                    results[document_id] = {"error": f"{type(e).__name__}: {e}"}
+        failed = sum(1 for outcome in results.values() if "error" in outcome)
+        attributes.update(failed=failed)
+
+    if failed and doc_tools_enabled:
+        doc_tools.reset()
+    usage = combined_usage(outcome["usage"] for outcome in results.values() if "usage" in outcome)
+    return {"results": results, "usage": usage, "tool_cache": tool_cache_metadata(tool_usage), "trace": trace.to_dict()}
 
-    if doc_tools_enabled:
-        streamable_http_mcp_client = MCPClient(lambda: streamablehttp_client("https://mcp.context7.com/mcp"))
+def tool_cache_metadata(tool_usage):
+    """This invocation's tool cache hits and misses, and the container-wide totals"""
+    return dict(usage_summary(tool_usage), totals=tool_cache.metrics())
 
-        # Create an agent with MCP tools
-        with streamable_http_mcp_client:
-            # Get the tools from the MCP server
-            tools = streamable_http_mcp_client.list_tools_sync()
-    
-            agent = Agent(system_prompt=system_message, tools=tools, model=model)
+def tool_cache_attributes(tool_usage):
+    return {"tool_cache_hits": tool_usage["hits"], "tool_cache_misses": tool_usage["misses"]}
 
-    result = agent(user_message)
-    return {"result": result.message}
+async def stream_response(agent, user_message, doc_tools_enabled, trace, model, tool_usage):
+    """Yield the agent's text as it is generated; the runtime sends each item as a server-sent event"""
+    usage = None
+    try:
+        with trace.span("agent.generation", model=model, streamed=True) as attributes:
+            start = time.perf_counter()
+            first_token = True
+            async for event in agent.stream_async(user_message, **{USAGE_KEY: tool_usage}):
+                if "data" in event:
+                    if first_token:
+                        trace.record("agent.first_token", time.perf_counter() - start, model=model)
+                        first_token = False
+                    yield {"delta": event["data"]}
+                elif "result" in event:
+                    usage = token_usage(event["result"])
+                    attributes.update(usage_attributes(usage))
+            attributes.update(tool_cache_attributes(tool_usage))
+    except Exception:
+        if doc_tools_enabled:
+            doc_tools.reset()
+        raise
+    # sent after the text so the supervisor can record the usage and spans
+    yield {"usage": usage, "tool_cache": tool_cache_metadata(tool_usage), "trace": trace.to_dict()}
 
 if __name__ == "__main__":
     app.run()
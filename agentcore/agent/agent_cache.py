@@ -0,0 +1,119 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+logger = logging.getLogger("bedrock_agentcore.app")
+
+DEFAULT_MAX_TEMPLATES = 16
+DEFAULT_MAX_MODELS = 4
+
+AgentTemplate = namedtuple('AgentTemplate', ['model', 'system_prompt', 'tools'])
+
+
+def bedrock_model(model_id):
+    # strands is imported on first use, normally by the warm-up thread, so the server can start listening first
+    from strands.models import BedrockModel
+    return BedrockModel(model_id=model_id)
+
+
+class AgentCache:
+    """
+    Bounded LRU of agent templates keyed by (model id, system prompt hash, tool set).
+
+    A template holds a built model client, so a request only pays for constructing the
+    Agent itself, which gets a fresh conversation every time. Model clients are shared
+    between templates for the same model id and kept in their own, smaller LRU.
+    """
+
+    def __init__(self, max_templates=DEFAULT_MAX_TEMPLATES, max_models=DEFAULT_MAX_MODELS, model_factory=None):
+        self.max_templates = max_templates
+        self.max_models = max_models
+        self.model_factory = model_factory or bedrock_model
+        self._templates = OrderedDict()
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.model_builds = 0
+        self.model_build_seconds = 0.0
+
+    def agent(self, model_id, system_prompt, tools=None, tools_key=None):
+        """
+        A new Agent for this model, system prompt and tools, built from a cached template when there is one.
+        tools_key identifies the tool set; pass a new one whenever the tool objects change.
+        """
+        from strands import Agent
+
+        template, hit = self.template(model_id, system_prompt, tools, tools_key)
+        return Agent(model=template.model, system_prompt=template.system_prompt, tools=template.tools), hit
+
+    def template(self, model_id, system_prompt, tools=None, tools_key=None):
+        key = (model_id, hashlib.sha256(system_prompt.encode('utf-8')).hexdigest(), tools_key if tools else None)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return template, True
+            self.misses += 1
+
+        template = AgentTemplate(self.model(model_id), system_prompt, tools)
+        with self._lock:
+            # a concurrent miss may have stored one first; either is fine to use
+            self._templates[key] = template
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_templates:
+                evicted, _ = self._templates.popitem(last=False)
+                self.evictions += 1
+                logger.info(f"agent cache evicted template for model {evicted[0]}")
+        return template, False
+
+    def model(self, model_id):
+        """
+        The shared model client for a model id, building it (and resolving credentials) on first use
+        """
+        with self._lock:
+            model = self._models.get(model_id)
+            if model is not None:
+                self._models.move_to_end(model_id)
+                return model
+
+        start = time.perf_counter()
+        model = self.model_factory(model_id)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.model_builds += 1
+            self.model_build_seconds += elapsed
+            self._models[model_id] = model
+            self._models.move_to_end(model_id)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+        return model
+
+    def warm(self, model_ids):
+        """
+        Build model clients ahead of the first request, e.g. from a thread started with the container
+        """
+        for model_id in model_ids:
+            try:
+                self.model(model_id)
+                logger.info(f"agent cache warmed model {model_id}")
+            except Exception as e:
+                logger.error(f"agent cache could not warm model {model_id}: {e}")
+
+    def metrics(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "templates": len(self._templates),
+                "models": len(self._models),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0,
+                "evictions": self.evictions,
+                "model_builds": self.model_builds,
+                "model_build_seconds": self.model_build_seconds,
+            }
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Measure what the in-container JWT authorizer costs per request.
+
+Signs tokens shaped like FusionAuth's client credentials tokens with a throwaway RSA key
+served from a local discovery document and JWKS, then reports:
+
+- verify: a full check of a token not seen before (signature, claims, client and scope)
+- cached: reading the bearer token and answering from the claim cache, with --tokens
+  distinct tokens in rotation
+- load: the extra time per request JWTAuthorizerMiddleware adds in front of a bare ASGI
+  app, with --concurrency requests in flight on one event loop
+- runtime: that the BedrockAgentCoreApp with the middleware accepts a request with a
+  token, rejects one without, and keeps /ping open
+
+Exits 1 when the cached median or the added time under load is over the budget, or the runtime check fails.
+
+Usage: python benchmark_authorizer.py [--requests N] [--concurrency C] [--tokens N] [--cached-budget-us US]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import jwt
+from bedrock_agentcore import BedrockAgentCoreApp
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from jwt_authorizer import JWKSCache, JWTAuthorizerMiddleware, TokenAuthorizer, bearer_token
+
+DEFAULT_CACHED_BUDGET_US = 50
+KEY_ID = "benchmark-key"
+SUPERVISOR_CLIENT_ID = str(uuid.uuid4())
+AGENT_CLIENT_ID = str(uuid.uuid4())
+
+
+def serve_keys(public_key):
+    """
+    Serve a discovery document and JWKS for public_key; returns (server, discovery url)
+    """
+    jwk = dict(json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(public_key)), kid=KEY_ID, use="sig", alg="RS256")
+
+    class KeysHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            base = f"http://127.0.0.1:{self.server.server_port}"
+            if self.path == "/.well-known/openid-configuration":
+                body = {"issuer": base, "jwks_uri": f"{base}/.well-known/jwks.json"}
+            else:
+                body = {"keys": [jwk]}
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeysHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/.well-known/openid-configuration"
+
+
+def sign_token(private_key, issuer):
+    now = int(time.time())
+    claims = {"iss": issuer, "aud": AGENT_CLIENT_ID, "sub": SUPERVISOR_CLIENT_ID, "client_id": SUPERVISOR_CLIENT_ID,
+              "scope": f"target-entity:{AGENT_CLIENT_ID}:invoke", "iat": now, "exp": now + 3600, "jti": str(uuid.uuid4())}
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": KEY_ID})
+
+
+def measure_verify(authorizer, tokens):
+    durations = []
+    for token in tokens:
+        start = time.perf_counter()
+        authorizer.verify(token)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def measure_cached(authorizer, tokens, requests):
+    durations = []
+    for number in range(requests):
+        scope = {"headers": [(b"content-type", b"application/json"),
+                             (b"authorization", f"Bearer {tokens[number % len(tokens)]}".encode())]}
+        start = time.perf_counter()
+        authorizer.authorize(bearer_token(scope))
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+async def measure_load(app, tokens, requests, concurrency):
+    """
+    Mean seconds per request through an ASGI app, with concurrency requests interleaved on the loop
+    """
+    async def send(message):
+        # lets the other requests run between response messages, like a socket write would
+        await asyncio.sleep(0)
+
+    async def worker(index):
+        for number in range(index, requests, concurrency):
+            scope = {"type": "http", "path": "/invocations",
+                     "headers": [(b"content-type", b"application/json"),
+                                 (b"authorization", f"Bearer {tokens[number % len(tokens)]}".encode())]}
+            await app(scope, None, send)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(concurrency)))
+    return (time.perf_counter() - start) / requests
+
+
+async def check_runtime(app, token):
+    """
+    Status codes from the BedrockAgentCoreApp for /invocations with token, without a token, and for /ping
+    """
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://runtime") as client:
+        allowed = await client.post("/invocations", json={"prompt": "hello"}, headers={"Authorization": f"Bearer {token}"})
+        missing = await client.post("/invocations", json={"prompt": "hello"})
+        ping = await client.get("/ping")
+        return allowed.status_code, missing.status_code, ping.status_code
+
+
+def echo_app(authorizer=None):
+    app = BedrockAgentCoreApp()
+
+    @app.entrypoint
+    def invoke(payload):
+        return {"result": payload.get("prompt")}
+
+    if authorizer is not None:
+        app.add_middleware(JWTAuthorizerMiddleware, authorizer=authorizer)
+    return app
+
+
+def report(name, durations, budget_us=None):
+    median_us = statistics.median(durations) * 1e6
+    p99_us = sorted(durations)[int(len(durations) * 0.99)] * 1e6
+    over = budget_us is not None and median_us > budget_us
+    budget = f"  budget {budget_us:.0f} us{'  OVER BUDGET' if over else ''}" if budget_us is not None else ""
+    print(f"{name:8} median {median_us:8.1f} us  p99 {p99_us:8.1f} us  ({len(durations)} requests){budget}")
+    return over
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the per-request cost of the in-container JWT authorizer")
+    parser.add_argument('--requests', type=int, default=20000, help="requests through the cached path")
+    parser.add_argument('--concurrency', type=int, default=32, help="requests in flight at once")
+    parser.add_argument('--tokens', type=int, default=8, help="distinct tokens in rotation, e.g. one per supervisor")
+    parser.add_argument('--verify', type=int, default=500, help="tokens verified without the cache")
+    parser.add_argument('--cached-budget-us', type=float, default=DEFAULT_CACHED_BUDGET_US)
+    args = parser.parse_args()
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    server, discovery_url = serve_keys(private_key.public_key())
+    keys = JWKSCache(discovery_url)
+    keys.refresh()
+    authorizer = TokenAuthorizer(keys, AGENT_CLIENT_ID, allowed_clients=[SUPERVISOR_CLIENT_ID])
+
+    report("verify", measure_verify(authorizer, [sign_token(private_key, keys.issuer) for _ in range(args.verify)]))
+
+    tokens = [sign_token(private_key, keys.issuer) for _ in range(args.tokens)]
+    over = report("cached", measure_cached(authorizer, tokens, args.requests), args.cached_budget_us)
+
+    bare = asyncio.run(measure_load(ok_app, tokens, args.requests, args.concurrency))
+    guarded = asyncio.run(measure_load(JWTAuthorizerMiddleware(ok_app, authorizer), tokens, args.requests, args.concurrency))
+    added_us = (guarded - bare) * 1e6
+    over = over or added_us > args.cached_budget_us
+    print(f"load     {added_us:8.1f} us added per request, {args.concurrency} in flight  budget {args.cached_budget_us:.0f} us"
+          f"{'  OVER BUDGET' if added_us > args.cached_budget_us else ''}")
+    print(f"         {authorizer.metrics()}")
+
+    allowed, missing, ping = asyncio.run(check_runtime(echo_app(authorizer), tokens[0]))
+    print(f"runtime  with a token {allowed}, without one {missing}, /ping {ping}")
+    over = over or (allowed, missing, ping) != (200, 401, 200)
+    server.shutdown()
+    if over:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
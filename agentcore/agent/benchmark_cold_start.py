@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Measure the agent container's cold start, each run in a fresh process:
+
+- import: time to import agent.py
+- ready: time from starting the process until /ping answers
+- first request: time from starting the process until the first /invocations call returns
+
+Bedrock is replaced by a local stand-in that rejects every call straight away, so the
+first request covers everything the runtime does before the model starts generating.
+Exits 1 when the median of a measurement is over its budget.
+
+Usage: python benchmark_cold_start.py [--runs N] [--import-budget-ms MS] [--ready-budget-ms MS] [--first-request-budget-ms MS]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_IMPORT_BUDGET_MS = 300
+DEFAULT_READY_BUDGET_MS = 750
+DEFAULT_FIRST_REQUEST_BUDGET_MS = 1200
+READY_TIMEOUT_SECONDS = 60
+
+
+class BedrockStandIn(BaseHTTPRequestHandler):
+    """
+    Answers every Bedrock runtime call with a ValidationException, which is not retried
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"message": "stand-in for the cold start benchmark"}).encode()
+        self.send_response(400)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("x-amzn-ErrorType", "ValidationException")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def runtime_env(bedrock_url):
+    env = dict(os.environ)
+    env.update({
+        "AWS_ENDPOINT_URL_BEDROCK_RUNTIME": bedrock_url,
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "AWS_REGION": env.get("AWS_REGION", "us-west-2"),
+        "AWS_EC2_METADATA_DISABLED": "true",
+    })
+    return env
+
+
+def measure_import(env):
+    code = "import time; start = time.perf_counter(); import agent; print(time.perf_counter() - start)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=HERE, env=env, capture_output=True, text=True, check=True)
+    return float(output.stdout.strip().splitlines()[-1])
+
+
+def measure_start(env):
+    """
+    (seconds until /ping answers, seconds until the first invocation returns), both from process start
+    """
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", f"import agent; agent.app.run(port={port}, host='127.0.0.1')"],
+                               cwd=HERE, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if time.perf_counter() - start > READY_TIMEOUT_SECONDS or process.poll() is not None:
+                raise RuntimeError("agent runtime did not start")
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/ping", timeout=1).read()
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        ready = time.perf_counter() - start
+
+        request = urllib.request.Request(f"http://127.0.0.1:{port}/invocations",
+                                         data=json.dumps({"prompt": "hello", "system_prompt": "benchmark"}).encode(),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(request, timeout=READY_TIMEOUT_SECONDS).read()
+        except urllib.error.HTTPError:
+            # the stand-in rejects the model call, so the runtime answers with an error
+            pass
+        return ready, time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def report(name, values, budget_ms):
+    median_ms = statistics.median(values) * 1000
+    over = median_ms > budget_ms
+    print(f"{name:14} median {median_ms:7.1f} ms  min {min(values) * 1000:7.1f} ms  max {max(values) * 1000:7.1f} ms  "
+          f"budget {budget_ms:.0f} ms{'  OVER BUDGET' if over else ''}")
+    return over
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure agent runtime cold start against a budget")
+    parser.add_argument('--runs', type=int, default=5, help="cold starts to measure")
+    parser.add_argument('--import-budget-ms', type=float, default=DEFAULT_IMPORT_BUDGET_MS)
+    parser.add_argument('--ready-budget-ms', type=float, default=DEFAULT_READY_BUDGET_MS)
+    parser.add_argument('--first-request-budget-ms', type=float, default=DEFAULT_FIRST_REQUEST_BUDGET_MS)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), BedrockStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    env = runtime_env(f"http://127.0.0.1:{server.server_port}")
+
+    imports, readies, first_requests = [], [], []
+    for _ in range(args.runs):
+        imports.append(measure_import(env))
+        ready, first_request = measure_start(env)
+        readies.append(ready)
+        first_requests.append(first_request)
+    server.shutdown()
+
+    print(f"{args.runs} cold starts")
+    over = report("import", imports, args.import_budget_ms)
+    over = report("ready", readies, args.ready_budget_ms) or over
+    over = report("first request", first_requests, args.first_request_budget_ms) or over
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
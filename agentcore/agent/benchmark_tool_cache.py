@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Measure the documentation lookup cache against the local stand-in MCP server.
+
+Simulates validation invocations that each make the same kind of doc lookups the
+model does (resolve the library, then fetch docs for a few topics drawn from a small
+set), first straight through the MCP session and then through the ToolResultCache,
+and reports lookup time, MCP calls and the cache hit rate.
+
+Usage: python benchmark_tool_cache.py [--invocations N] [--concurrency C] [--lookups N] [--topics N] [--latency-ms MS]
+"""
+import argparse
+import asyncio
+import random
+import socket
+import time
+import uuid
+from collections import Counter
+
+import stand_in_mcp
+from mcp_connection import MCPConnectionManager
+from tool_cache import USAGE_KEY, ToolResultCache
+
+TOPICS = ["client credentials grant", "entities", "entity types", "jwt validation", "oauth scopes",
+          "tenants", "applications", "api keys", "webhooks", "refresh tokens"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def call_tool(tools, name, arguments, invocation_state):
+    tool = next(tool for tool in tools if tool.tool_name == name)
+    tool_use = {"toolUseId": uuid.uuid4().hex, "name": name, "input": arguments}
+    result = None
+    async for event in tool.stream(tool_use, invocation_state):
+        result = event
+    return result
+
+
+async def invocation(tools, lookups, topics, rng):
+    """
+    One validation's worth of lookups; returns its hit and miss counts
+    """
+    usage = Counter()
+    state = {USAGE_KEY: usage}
+    await call_tool(tools, "resolve-library-id", {"libraryName": "FusionAuth"}, state)
+    for topic in rng.sample(TOPICS[:topics], min(lookups, topics)):
+        # the model is not consistent about spacing, which the cache key normalizes away
+        await call_tool(tools, "get-library-docs", {"context7CompatibleLibraryID": "/fusionauth/docs",
+                                                    "topic": topic + rng.choice(["", " ", "  "]), "tokens": 5000}, state)
+    return usage
+
+
+async def run(tools, invocations, concurrency, lookups, topics):
+    limiter = asyncio.Semaphore(concurrency)
+    rng = random.Random(1)
+
+    async def limited():
+        async with limiter:
+            return await invocation(tools, lookups, topics, rng)
+
+    return await asyncio.gather(*(limited() for _ in range(invocations)))
+
+
+def measure(url, cache, args):
+    stand_in_mcp.calls.clear()
+    doc_tools = MCPConnectionManager(url, result_cache=cache)
+    tools = doc_tools.get_tools()
+    start = time.perf_counter()
+    usages = asyncio.run(run(tools, args.invocations, args.concurrency, args.lookups, args.topics))
+    elapsed = time.perf_counter() - start
+    doc_tools.reset()
+    return elapsed, sum(stand_in_mcp.calls.values()), sum(usages, Counter())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the MCP doc lookup cache against a local stand-in server")
+    parser.add_argument('--invocations', type=int, default=40, help="simulated validation invocations")
+    parser.add_argument('--concurrency', type=int, default=4, help="invocations running at once")
+    parser.add_argument('--lookups', type=int, default=3, help="doc lookups per invocation, after resolving the library")
+    parser.add_argument('--topics', type=int, default=6, help="distinct topics the lookups are drawn from")
+    parser.add_argument('--latency-ms', type=float, default=300, help="stand-in MCP server delay per tool call")
+    args = parser.parse_args()
+
+    url = stand_in_mcp.start(free_port(), args.latency_ms / 1000)
+
+    uncached_seconds, uncached_calls, _ = measure(url, None, args)
+    cache = ToolResultCache()
+    cached_seconds, cached_calls, usage = measure(url, cache, args)
+
+    total = usage["hits"] + usage["misses"]
+    print(f"{args.invocations} invocations, {args.concurrency} at a time, {args.lookups + 1} lookups each, "
+          f"{args.latency_ms:.0f} ms per MCP call")
+    print(f"  uncached: {uncached_seconds:6.2f}s  {uncached_calls} MCP calls")
+    print(f"  cached:   {cached_seconds:6.2f}s  {cached_calls} MCP calls  "
+          f"{usage['hits']} hits / {total} lookups ({usage['hits'] / total:.0%} hit rate)")
+    print(f"  cache:    {cache.metrics()}")
+
+
+if __name__ == "__main__":
+    main()
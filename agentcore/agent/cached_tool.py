@@ -0,0 +1,68 @@
+from strands.types.tools import AgentTool
+
+from tool_cache import USAGE_KEY, tool_cache_key
+
+
+def tool_result(event):
+    """
+    The ToolResult an event from AgentTool.stream carries, or None. strands' own tools end with an
+    event holding it under "tool_result"; any other tool ends with the ToolResult itself.
+    """
+    if not isinstance(event, dict):
+        return None
+    if isinstance(event.get("tool_result"), dict):
+        return event["tool_result"]
+    if "toolUseId" in event and "status" in event:
+        return event
+    return None
+
+
+class CachedTool(AgentTool):
+    """
+    Wraps a tool so that successful results are answered from a ToolResultCache.
+
+    A Counter under USAGE_KEY in the invocation state (agent(prompt, tool_cache_usage=Counter()))
+    collects the hits and misses of that invocation.
+    """
+
+    def __init__(self, tool, cache):
+        super().__init__()
+        self.tool = tool
+        self.cache = cache
+
+    @property
+    def tool_name(self):
+        return self.tool.tool_name
+
+    @property
+    def tool_spec(self):
+        return self.tool.tool_spec
+
+    @property
+    def tool_type(self):
+        return self.tool.tool_type
+
+    async def stream(self, tool_use, invocation_state, **kwargs):
+        key = tool_cache_key(self.tool_name, tool_use.get("input"))
+        usage = invocation_state.get(USAGE_KEY)
+        cached = self.cache.get(key)
+        if cached is not None:
+            if usage is not None:
+                usage["hits"] += 1
+            # a plain ToolResult as the last event is how any AgentTool reports its result;
+            # the model matches results to its requests by id
+            yield dict(cached, toolUseId=tool_use["toolUseId"])
+            return
+
+        if usage is not None:
+            usage["misses"] += 1
+        async for event in self.tool.stream(tool_use, invocation_state, **kwargs):
+            result = tool_result(event)
+            # stored before it is passed on, since the agent stops reading once it has the result
+            if result is not None and result.get("status") == "success":
+                self.cache.put(key, {name: value for name, value in result.items() if name != "toolUseId"})
+            yield event
+
+
+def cached_tools(tools, cache):
+    return [CachedTool(tool, cache) for tool in tools]
@@ -0,0 +1,90 @@
+import contextlib
+import json
+import logging
+import os
+import time
+from collections import Counter
+
+logger = logging.getLogger("bedrock_agentcore.app")
+
+
+class InvocationTrace:
+    """
+    Spans recorded while handling one invocation, under the trace id and parent span the
+    supervisor sent. They are logged as json and returned to the supervisor with the response.
+    """
+
+    def __init__(self, trace_context=None):
+        trace_context = trace_context or {}
+        self.trace_id = trace_context.get("trace_id") or f"{int(time.time()):08x}{os.urandom(12).hex()}"
+        self.parent_id = trace_context.get("parent_id")
+        self.spans = []
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        span = {
+            "trace_id": self.trace_id,
+            "span_id": os.urandom(8).hex(),
+            "parent_id": self.parent_id,
+            "name": name,
+            "start": time.time(),
+            "attributes": attributes,
+            "error": None,
+        }
+        start = time.perf_counter()
+        try:
+            yield span["attributes"]
+        except BaseException as e:
+            span["error"] = type(e).__name__
+            raise
+        finally:
+            span["duration"] = time.perf_counter() - start
+            self.spans.append(span)
+            logger.info(json.dumps(span))
+
+    def record(self, name, duration, **attributes):
+        self.spans.append({
+            "trace_id": self.trace_id,
+            "span_id": os.urandom(8).hex(),
+            "parent_id": self.parent_id,
+            "name": name,
+            "start": time.time() - duration,
+            "duration": duration,
+            "attributes": attributes,
+            "error": None,
+        })
+        logger.info(json.dumps(self.spans[-1]))
+
+    def to_dict(self):
+        return {"trace_id": self.trace_id, "spans": self.spans}
+
+
+def token_usage(result):
+    """
+    Token counts and model latency accumulated over every model call the agent made
+    """
+    metrics = result.metrics
+    usage = dict(metrics.accumulated_usage)
+    usage["latencyMs"] = metrics.accumulated_metrics.get("latencyMs")
+    usage["cycles"] = metrics.cycle_count
+    return usage
+
+
+def combined_usage(usages):
+    """
+    Token counts and model latency summed over the documents of a batched invocation
+    """
+    total = Counter()
+    for usage in usages:
+        total.update({name: value for name, value in usage.items() if isinstance(value, (int, float))})
+    return dict(total)
+
+
+def usage_attributes(usage):
+    return {
+        "input_tokens": usage.get("inputTokens"),
+        "output_tokens": usage.get("outputTokens"),
+        "total_tokens": usage.get("totalTokens"),
+        "model_latency_ms": usage.get("latencyMs"),
+        "cycles": usage.get("cycles"),
+    }
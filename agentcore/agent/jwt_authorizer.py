@@ -0,0 +1,262 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+
+import jwt
+
+logger = logging.getLogger("bedrock_agentcore.app")
+
+DEFAULT_REFRESH_SECONDS = 60 * 60
+# an unknown key id refetches the keys (FusionAuth rotated them), at most this often
+DEFAULT_MIN_REFRESH_SECONDS = 30
+DEFAULT_FETCH_TIMEOUT = 5
+DEFAULT_LEEWAY_SECONDS = 30
+DEFAULT_MAX_CACHED_TOKENS = 10000
+# how long the first request waits for the keys when they are still being fetched at startup
+DEFAULT_STARTUP_WAIT_SECONDS = 10
+
+
+class AuthorizationError(Exception):
+    """
+    A request is not allowed to invoke the agent. status is 401 for a missing or invalid
+    token and 403 for a valid token without the required client or scope.
+    """
+
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.status = status
+
+
+def fetch_json(url, timeout=DEFAULT_FETCH_TIMEOUT):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+class JWKSCache:
+    """
+    The issuer and signing keys named by a FusionAuth OpenID discovery document, the same
+    discoveryUrl AgentCore's customJWTAuthorizer uses. Keys are parsed once per fetch and
+    refetched every refresh_seconds on a daemon thread started by start(), so requests
+    never wait on FusionAuth after startup. A token signed with an unknown key id triggers
+    one refetch, at most every min_refresh_seconds.
+    """
+
+    def __init__(self, discovery_url, refresh_seconds=DEFAULT_REFRESH_SECONDS, min_refresh_seconds=DEFAULT_MIN_REFRESH_SECONDS, fetch=None):
+        self.discovery_url = discovery_url
+        self.issuer = None
+        self.jwks_url = None
+        self.refresh_seconds = refresh_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self.fetch = fetch or fetch_json
+        self._keys = {}
+        self._fetched_at = 0
+        self._loaded = threading.Event()
+        self._lock = threading.Lock()
+        self.refreshes = 0
+        self.failures = 0
+
+    def start(self):
+        threading.Thread(target=self._refresh_forever, daemon=True).start()
+        return self
+
+    def key(self, kid):
+        """
+        The key for a token's kid header, or None
+        """
+        if not self._loaded.is_set():
+            self._loaded.wait(DEFAULT_STARTUP_WAIT_SECONDS)
+        key = self._keys.get(kid)
+        if key is None and time.monotonic() - self._fetched_at >= self.min_refresh_seconds:
+            self.refresh(self.min_refresh_seconds)
+            key = self._keys.get(kid)
+        return key
+
+    def refresh(self, min_age=0):
+        """
+        Fetch the keys, unless a fetch finished less than min_age seconds ago (e.g. while this one waited for it)
+        """
+        with self._lock:
+            if min_age and time.monotonic() - self._fetched_at < min_age:
+                return
+            try:
+                if self.jwks_url is None:
+                    discovery = self.fetch(self.discovery_url)
+                    self.issuer, self.jwks_url = discovery["issuer"], discovery["jwks_uri"]
+                keys = {}
+                for jwk in self.fetch(self.jwks_url).get("keys", []):
+                    if jwk.get("use", "sig") != "sig" or "kid" not in jwk:
+                        continue
+                    try:
+                        keys[jwk["kid"]] = jwt.PyJWK(jwk)
+                    except jwt.PyJWKError as e:
+                        logger.error(f"skipping signing key {jwk.get('kid')}: {e}")
+            except (OSError, ValueError, KeyError) as e:
+                # the keys already loaded keep being used
+                self.failures += 1
+                logger.error(f"Could not fetch signing keys from {self.jwks_url or self.discovery_url}: {e}")
+                return
+            finally:
+                self._fetched_at = time.monotonic()
+                # requests stop waiting after the first attempt, even a failed one
+                self._loaded.set()
+            self._keys = keys
+            self.refreshes += 1
+
+    def _refresh_forever(self):
+        while True:
+            self.refresh()
+            time.sleep(self.refresh_seconds)
+
+
+class TokenAuthorizer:
+    """
+    Verifies FusionAuth client credentials access tokens for one agent: the signature against
+    the tenant's keys, exp, nbf, issuer and audience (the agent's client id), that the client_id
+    claim added by the setup lambda is one of allowed_clients, and that the scope includes
+    target-entity:<agent client id>:invoke.
+
+    Claims of tokens that passed are kept until the token expires, so a token the supervisor
+    reuses for many calls is only verified once.
+    """
+
+    def __init__(self, keys, agent_client_id, allowed_clients=None, leeway=DEFAULT_LEEWAY_SECONDS,
+                 max_cached_tokens=DEFAULT_MAX_CACHED_TOKENS):
+        if not agent_client_id:
+            raise ValueError("the agent's client id is needed to check the token's audience and scope")
+        self.keys = keys
+        self.agent_client_id = agent_client_id
+        self.required_scope = f"target-entity:{agent_client_id}:invoke"
+        self.allowed_clients = set(allowed_clients or [])
+        self.leeway = leeway
+        self.max_cached_tokens = max_cached_tokens
+        self._claims = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejections = 0
+
+    def cached(self, token):
+        """
+        The claims of token if it passed before and hasn't expired, or None
+        """
+        cached = self._claims.get(token)
+        if cached is not None and time.time() < cached[0]:
+            self.hits += 1
+            return cached[1]
+        return None
+
+    def authorize(self, token):
+        """
+        The claims of token, or raise AuthorizationError. May block while the signing keys are fetched.
+        """
+        claims = self.cached(token)
+        if claims is not None:
+            return claims
+
+        try:
+            claims = self.verify(token)
+        except AuthorizationError:
+            self.rejections += 1
+            raise
+        with self._lock:
+            self.misses += 1
+            self._claims[token] = (claims["exp"] + self.leeway, claims)
+            self._expire()
+        return claims
+
+    def verify(self, token):
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.InvalidTokenError as e:
+            raise AuthorizationError(f"malformed token: {e}")
+        key = self.keys.key(header.get("kid"))
+        if key is None:
+            raise AuthorizationError("token is signed with an unknown key")
+        try:
+            claims = jwt.decode(token, key.key, algorithms=[key.algorithm_name], audience=self.agent_client_id, issuer=self.keys.issuer,
+                                leeway=self.leeway, options={"require": ["exp", "iss", "aud"]})
+        except jwt.InvalidTokenError as e:
+            raise AuthorizationError(f"invalid token: {e}")
+
+        if self.allowed_clients and claims.get("client_id") not in self.allowed_clients:
+            raise AuthorizationError(f"client {claims.get('client_id')} may not invoke this agent", 403)
+        if self.required_scope not in str(claims.get("scope", "")).split():
+            raise AuthorizationError(f"token is missing the {self.required_scope} scope", 403)
+        return claims
+
+    def _expire(self):
+        # oldest first, so expired tokens and then the least recently verified go
+        now = time.time()
+        while self._claims:
+            token, (expires_at, _) = next(iter(self._claims.items()))
+            if expires_at > now and len(self._claims) <= self.max_cached_tokens:
+                break
+            del self._claims[token]
+
+    def metrics(self):
+        total = self.hits + self.misses
+        return {
+            "cached_tokens": len(self._claims),
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejections": self.rejections,
+            "hit_rate": self.hits / total if total else 0,
+            "key_refreshes": self.keys.refreshes,
+            "key_fetch_failures": self.keys.failures,
+        }
+
+
+class JWTAuthorizerMiddleware:
+    """
+    ASGI middleware that lets a request to one of paths through only with a bearer token the
+    authorizer accepts, answering 401 or 403 otherwise. /ping stays open for health checks.
+    The claims are put in the request state as jwt_claims.
+
+    Tokens in the authorizer's cache are answered on the event loop; others are verified on
+    a worker thread, since that may wait for the signing keys or fetch them from FusionAuth.
+    """
+
+    def __init__(self, app, authorizer, paths=("/invocations",)):
+        self.app = app
+        self.authorizer = authorizer
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            token = bearer_token(scope)
+            claims = self.authorizer.cached(token)
+            if claims is None:
+                claims = await asyncio.to_thread(self.authorizer.authorize, token)
+        except AuthorizationError as e:
+            logger.warning(f"rejected invocation: {e}")
+            await reject(send, e)
+            return
+        scope.setdefault("state", {})["jwt_claims"] = claims
+        await self.app(scope, receive, send)
+
+
+def bearer_token(scope):
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token.strip()
+            break
+    raise AuthorizationError("missing bearer token")
+
+
+async def reject(send, error):
+    body = json.dumps({"error": str(error)}).encode()
+    challenge = 'Bearer error="invalid_token"' if error.status == 401 else 'Bearer error="insufficient_scope"'
+    await send({"type": "http.response.start", "status": error.status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                            (b"www-authenticate", challenge.encode())]})
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,68 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger("bedrock_agentcore.app")
+
+DEFAULT_TOOLS_TTL_SECONDS = 300
+
+
+class MCPConnectionManager:
+    """
+    Keeps one MCP session open for the life of the container and caches its tool list.
+
+    The session is opened on first use. If listing tools or a tool call fails, call
+    reset() and the next get_tools() reconnects. With result_cache set, the tools answer
+    repeated calls from that ToolResultCache.
+    """
+
+    def __init__(self, url, tools_ttl=DEFAULT_TOOLS_TTL_SECONDS, result_cache=None):
+        self.url = url
+        self.tools_ttl = tools_ttl
+        self.result_cache = result_cache
+        self._client = None
+        self._tools = None
+        self._tools_loaded_at = 0
+        self._lock = threading.Lock()
+
+    def get_tools(self):
+        with self._lock:
+            if self._tools is not None and time.time() - self._tools_loaded_at < self.tools_ttl:
+                return self._tools
+            try:
+                self._load_tools()
+            except Exception as e:
+                # the session may have dropped since we last used it; try once more on a fresh one
+                logger.error("MCP tool discovery failed, reconnecting: " + str(e))
+                self._close()
+                self._load_tools()
+            return self._tools
+
+    def reset(self):
+        with self._lock:
+            self._close()
+
+    def _load_tools(self):
+        if self._client is None:
+            # imported on first use, so containers that never enable doc tools don't pay for the MCP stack at startup
+            from mcp.client.streamable_http import streamablehttp_client
+            from strands.tools.mcp.mcp_client import MCPClient
+            client = MCPClient(lambda: streamablehttp_client(self.url))
+            client.start()
+            self._client = client
+        tools = self._client.list_tools_sync()
+        if self.result_cache is not None:
+            from cached_tool import cached_tools
+            tools = cached_tools(tools, self.result_cache)
+        self._tools = tools
+        self._tools_loaded_at = time.time()
+
+    def _close(self):
+        client = self._client
+        self._client = None
+        self._tools = None
+        if client is not None:
+            try:
+                client.stop(None, None, None)
+            except Exception as e:
+                logger.error("Error closing MCP session: " + str(e))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Snapshot the agent runtime's import-time work as bytecode, so a cold container does not
+compile any Python before it can answer.
+
+The toolkit's Dockerfile installs dependencies with UV_COMPILE_BYTECODE=1, but the
+agent's own modules are copied in afterwards and the runtime user cannot write their
+__pycache__. Add this after the COPY line of the generated Dockerfile:
+
+    RUN python snapshot.py
+
+It compiles this directory and any installed runtime package that is missing bytecode,
+then imports the whole stack once, including the deferred strands and MCP imports, to
+check that it loads.
+"""
+import compileall
+import importlib
+import importlib.util
+import os
+import sys
+import time
+
+# everything a request can import, including what agent.py defers until first use
+RUNTIME_MODULES = [
+    "bedrock_agentcore",
+    "strands",
+    "strands.models",
+    "strands.tools.mcp.mcp_client",
+    "mcp.client.streamable_http",
+    "boto3",
+    "botocore",
+]
+
+
+def package_dir(module_name):
+    spec = importlib.util.find_spec(module_name.split(".")[0])
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return list(spec.submodule_search_locations)[0]
+
+
+def main():
+    here = os.path.dirname(os.path.abspath(__file__))
+    ok = compileall.compile_dir(here, maxlevels=0, quiet=1)
+
+    for directory in sorted({package_dir(module) for module in RUNTIME_MODULES} - {None}):
+        # only writes bytecode that is missing or stale, so this is quick when uv already compiled it
+        ok = compileall.compile_dir(directory, quiet=1, workers=0) and ok
+
+    for module in RUNTIME_MODULES:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        print(f"{module:32} {(time.perf_counter() - start) * 1000:7.1f} ms")
+
+    if not ok:
+        print("some files could not be compiled")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the context7 documentation MCP server, serving resolve-library-id
+and get-library-docs over streamable HTTP with a configurable delay, and counting the
+calls it answers.
+
+Point the agent at it with DOC_TOOLS_URL=http://127.0.0.1:PORT/mcp.
+
+Usage: python stand_in_mcp.py [--port PORT] [--latency-ms MS]
+"""
+import argparse
+import asyncio
+import socket
+import threading
+import time
+from collections import Counter
+
+from mcp.server.fastmcp import FastMCP
+
+calls = Counter()
+
+
+def create_server(port, latency_seconds=0.0):
+    server = FastMCP("stand-in-docs", host="127.0.0.1", port=port, stateless_http=True, log_level="WARNING")
+
+    @server.tool(name="resolve-library-id")
+    async def resolve_library_id(libraryName: str) -> str:
+        """Resolve a package name to a Context7-compatible library ID."""
+        calls["resolve-library-id"] += 1
+        await asyncio.sleep(latency_seconds)
+        return f"- Context7-compatible library ID: /{libraryName.lower().replace(' ', '-')}/docs"
+
+    @server.tool(name="get-library-docs")
+    async def get_library_docs(context7CompatibleLibraryID: str, topic: str = "", tokens: int = 5000) -> str:
+        """Fetch up-to-date documentation for a library."""
+        calls["get-library-docs"] += 1
+        await asyncio.sleep(latency_seconds)
+        return f"# {context7CompatibleLibraryID}: {topic or 'overview'}\n\n" + "Documentation text. " * (tokens // 50)
+
+    return server
+
+
+def start(port, latency_seconds=0.0):
+    """
+    Serve on a daemon thread and return the MCP url once it accepts connections
+    """
+    server = create_server(port, latency_seconds)
+    threading.Thread(target=server.run, kwargs={"transport": "streamable-http"}, daemon=True).start()
+    url = f"http://127.0.0.1:{port}/mcp"
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return url
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("stand-in MCP server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve stand-in documentation lookup tools over MCP")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=500, help="delay before each tool answers")
+    args = parser.parse_args()
+    create_server(args.port, args.latency_ms / 1000).run(transport="streamable-http")
+
+
+if __name__ == "__main__":
+    main()
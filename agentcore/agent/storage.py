@@ -0,0 +1,48 @@
+import json
+import os
+import threading
+
+
+def atomic_write_json(path, data):
+    """
+    Write data as json to path through a temporary file in the same directory, so
+    readers (and other containers sharing the directory) only ever see whole files
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def evict_least_recently_used(directory, max_bytes):
+    """
+    Remove the files in directory with the oldest mtime until the rest fit in max_bytes.
+    Temporary files still being written are left alone.
+    """
+    files = []
+    total = 0
+    for name in os.listdir(directory):
+        if name.endswith(".tmp"):
+            continue
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, name))
+        total += stat.st_size
+    files.sort()
+    for _, size, name in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+        total -= size
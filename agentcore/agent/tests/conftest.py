@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the agent's modules import each other by name, as they do in the runtime container
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from jwt_authorizer import AuthorizationError, JWKSCache, JWTAuthorizerMiddleware, TokenAuthorizer, bearer_token
+
+ISSUER = "https://auth.example.com"
+DISCOVERY_URL = f"{ISSUER}/.well-known/openid-configuration"
+JWKS_URL = f"{ISSUER}/.well-known/jwks.json"
+AGENT_CLIENT_ID = "agent-client"
+SUPERVISOR_CLIENT_ID = "supervisor-client"
+
+
+def new_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+SIGNING_KEY = new_key()
+
+
+class FusionAuth:
+    """
+    Serves a discovery document and JWKS through JWKSCache's fetch hook, counting key fetches
+    """
+
+    def __init__(self, *keys):
+        self.keys = dict(keys)
+        self.key_fetches = 0
+
+    def fetch(self, url):
+        if url == DISCOVERY_URL:
+            return {"issuer": ISSUER, "jwks_uri": JWKS_URL}
+        self.key_fetches += 1
+        return {"keys": [dict(json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(key.public_key())), kid=kid, use="sig", alg="RS256")
+                         for kid, key in self.keys.items()]}
+
+
+def sign(key=SIGNING_KEY, kid="current", **overrides):
+    now = int(time.time())
+    claims = {"iss": ISSUER, "aud": AGENT_CLIENT_ID, "client_id": SUPERVISOR_CLIENT_ID,
+              "scope": f"target-entity:{AGENT_CLIENT_ID}:invoke", "iat": now, "exp": now + 3600}
+    claims.update(overrides)
+    return jwt.encode({name: value for name, value in claims.items() if value is not None}, key, algorithm="RS256", headers={"kid": kid})
+
+
+def authorizer(fusionauth=None, **kwargs):
+    fusionauth = fusionauth or FusionAuth(("current", SIGNING_KEY))
+    keys = JWKSCache(DISCOVERY_URL, fetch=fusionauth.fetch, **kwargs)
+    keys.refresh()
+    return TokenAuthorizer(keys, AGENT_CLIENT_ID, allowed_clients=[SUPERVISOR_CLIENT_ID])
+
+
+def rejection(authorizer, token):
+    with pytest.raises(AuthorizationError) as error:
+        authorizer.authorize(token)
+    return error.value.status
+
+
+def test_a_valid_token_is_verified_once_then_cached():
+    checker = authorizer()
+    token = sign()
+
+    assert checker.authorize(token)["client_id"] == SUPERVISOR_CLIENT_ID
+    assert checker.cached(token)["client_id"] == SUPERVISOR_CLIENT_ID
+    checker.authorize(token)
+    assert (checker.misses, checker.hits) == (1, 2)
+
+
+def test_invalid_tokens_are_401():
+    checker = authorizer()
+    assert rejection(checker, "not a jwt") == 401
+    assert rejection(checker, sign(key=new_key())) == 401
+    assert rejection(checker, sign(exp=int(time.time()) - 3600)) == 401
+    assert rejection(checker, sign(aud="another-agent")) == 401
+    assert rejection(checker, sign(iss="https://elsewhere.example.com")) == 401
+    assert rejection(checker, sign(exp=None)) == 401
+    assert checker.rejections == 6
+    assert checker.metrics()["cached_tokens"] == 0
+
+
+def test_valid_tokens_without_permission_are_403():
+    checker = authorizer()
+    assert rejection(checker, sign(client_id="someone-else")) == 403
+    assert rejection(checker, sign(scope="target-entity:another-agent:invoke")) == 403
+    assert rejection(checker, sign(scope=None)) == 403
+
+
+def test_an_unknown_key_id_refetches_the_keys_at_most_once_per_interval():
+    fusionauth = FusionAuth(("current", SIGNING_KEY))
+    checker = authorizer(fusionauth, min_refresh_seconds=0)
+    rotated = new_key()
+    fusionauth.keys["rotated"] = rotated
+
+    assert checker.authorize(sign(key=rotated, kid="rotated"))
+    assert fusionauth.key_fetches == 2
+
+    checker = authorizer(fusionauth, min_refresh_seconds=60)
+    assert rejection(checker, sign(kid="unknown")) == 401
+    assert rejection(checker, sign(kid="unknown")) == 401
+    assert fusionauth.key_fetches == 3
+
+
+def test_the_cache_keeps_the_most_recent_tokens():
+    checker = authorizer()
+    checker.max_cached_tokens = 2
+    tokens = [sign(jti=str(number)) for number in range(3)]
+    for token in tokens:
+        checker.authorize(token)
+
+    assert checker.cached(tokens[0]) is None
+    assert checker.cached(tokens[2]) is not None
+
+
+def test_bearer_token():
+    assert bearer_token({"headers": [(b"authorization", b"Bearer abc ")]}) == "abc"
+    for headers in ([], [(b"authorization", b"Basic abc")], [(b"authorization", b"Bearer ")]):
+        with pytest.raises(AuthorizationError) as error:
+            bearer_token({"headers": headers})
+        assert error.value.status == 401
+
+
+def call(middleware, path, token=None):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    scope = {"type": "http", "path": path, "headers": headers}
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware(scope, None, send))
+    return messages[0]["status"], dict(messages[0]["headers"]), scope
+
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def test_the_middleware_guards_invocations_only():
+    middleware = JWTAuthorizerMiddleware(app, authorizer())
+
+    status, _, scope = call(middleware, "/invocations", sign())
+    assert status == 200
+    assert scope["state"]["jwt_claims"]["client_id"] == SUPERVISOR_CLIENT_ID
+
+    status, headers, _ = call(middleware, "/invocations")
+    assert (status, headers[b"www-authenticate"]) == (401, b'Bearer error="invalid_token"')
+
+    status, headers, _ = call(middleware, "/invocations", sign(client_id="someone-else"))
+    assert (status, headers[b"www-authenticate"]) == (403, b'Bearer error="insufficient_scope"')
+
+    assert call(middleware, "/ping")[0] == 200
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from storage import atomic_write_json, evict_least_recently_used
+
+logger = logging.getLogger("bedrock_agentcore.app")
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 6 * 60 * 60
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+# the invocation_state key the per-invocation hit and miss counts are kept under
+USAGE_KEY = "tool_cache_usage"
+
+
+def normalize_arguments(value):
+    """
+    Tool arguments with whitespace runs collapsed and dict keys sorted by json.dumps,
+    so lookups that differ only in formatting share an entry
+    """
+    if isinstance(value, str):
+        return re.sub(r"\s+", " ", value).strip()
+    if isinstance(value, dict):
+        return {key: normalize_arguments(item) for key, item in value.items() if item is not None}
+    if isinstance(value, list):
+        return [normalize_arguments(item) for item in value]
+    return value
+
+
+def tool_cache_key(tool_name, arguments):
+    material = json.dumps([tool_name, normalize_arguments(arguments or {})], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ToolResultCache:
+    """
+    Results of tool calls keyed by tool name and normalized arguments, shared by every
+    invocation in the container.
+
+    Entries live for ttl seconds in an LRU of at most max_entries. With directory set
+    they are also written there, one file per entry, so a restarted container starts
+    warm; the least recently used files are removed once they pass max_bytes.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL_SECONDS, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def get(self, key):
+        """
+        The cached result for key, or None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] >= self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+        entry = self._read(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._remember(key, entry)
+        return entry[1]
+
+    def put(self, key, result):
+        entry = (time.time(), result)
+        with self._lock:
+            self._remember(key, entry)
+        self._write(key, entry)
+
+    def metrics(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _read(self, key, now):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as file:
+                stored = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if now - stored["stored_at"] >= self.ttl:
+            with self._lock:
+                self.expirations += 1
+            return None
+        # mtime doubles as the last-used time for eviction
+        os.utime(self._path(key))
+        return stored["stored_at"], stored["result"]
+
+    def _write(self, key, entry):
+        if not self.directory:
+            return
+        try:
+            atomic_write_json(self._path(key), {"stored_at": entry[0], "result": entry[1]})
+            with self._lock:
+                evict_least_recently_used(self.directory, self.max_bytes)
+        except (OSError, TypeError, ValueError) as e:
+            # the in-memory entry is still there; only the disk copy is lost
+            logger.error("Could not write tool cache entry: " + str(e))
+
+
+def usage_summary(usage):
+    """
+    Hit and miss counts for one invocation, from the counter kept in its invocation_state
+    """
+    hits = usage.get("hits", 0)
+    misses = usage.get("misses", 0)
+    return {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses) if hits + misses else 0}
@@ -60,6 +60,9 @@ else:
     exit(1)
 
 # enabled models can be found in the Bedrock Console
+# optionally add "requestsperminute" (and "burst") to an agent's data to rate limit the supervisor's calls to it
+# optionally add "models", a list of {"id", "contextwindow", "maxoutputtokens", "outputtokenspersecond", "firsttokenseconds"},
+# so the supervisor can send each call to the fastest of them that fits its estimated tokens
 
 draft_content_data = {
     "agenttype": "draftcontent",
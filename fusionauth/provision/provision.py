@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+Provision Agent entities, supervisor entities and the grants between them from a json spec.
+
+Everything that already exists is found with one paged search per tenant, compared
+with the spec, and only the differences are applied, concurrently. Running it again
+with the same spec changes nothing. Entities that are not in the spec are left alone.
+
+Usage: python provision.py <spec.json> [--dry-run] [--workers N]
+"""
+import argparse
+import json
+import os
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from fusionauth.fusionauth_client import FusionAuthClient
+
+load_dotenv()
+
+DEFAULT_WORKERS = 8
+SEARCH_PAGE_SIZE = 500
+DEFAULT_PERMISSIONS = ["invoke"]
+
+# agents are matched on data.agenttype, which is how the supervisor finds them, and
+# supervisors on data.supervisorname, which this script sets
+EXISTING_QUERY = "data.agenttype:* OR data.supervisorname:*"
+
+# new entities get ids derived from their tenant and key, so two runs racing each other
+# collide on the id instead of creating duplicates
+ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://fusionauth.io/agentcore/provision")
+
+Change = namedtuple('Change', ['action', 'kind', 'key', 'detail', 'apply'])
+
+
+class SpecError(Exception):
+    pass
+
+
+def load_spec(path):
+    """
+    Read the spec, accepting either a list of tenants or a single tenant's agents and supervisors at the top level
+    """
+    with open(path, 'r') as file:
+        spec = json.load(file)
+    tenants = spec.get('tenants') or [{'agents': spec.get('agents', []), 'supervisors': spec.get('supervisors', [])}]
+
+    for tenant in tenants:
+        label = tenant.get('id') or 'default'
+        agenttypes = [agent.get('agenttype') for agent in tenant.get('agents', [])]
+        if not all(agenttypes):
+            raise SpecError(f"tenant {label}: every agent needs an agenttype")
+        if len(set(agenttypes)) != len(agenttypes):
+            raise SpecError(f"tenant {label}: agenttypes must be unique")
+        for agent in tenant.get('agents', []):
+            if not agent.get('systemprompt'):
+                raise SpecError(f"tenant {label}: agent {agent['agenttype']} needs a systemprompt")
+        names = [supervisor.get('name') for supervisor in tenant.get('supervisors', [])]
+        if not all(names) or len(set(names)) != len(names):
+            raise SpecError(f"tenant {label}: every supervisor needs a unique name")
+    return tenants
+
+
+def entity_id_for(tenant_id, kind, key):
+    return str(uuid.uuid5(ID_NAMESPACE, f"{tenant_id or 'default'}:{kind}:{key}"))
+
+
+def agent_data(agent):
+    data = {"agenttype": agent['agenttype'], "systemprompt": agent['systemprompt']}
+    if agent.get('model'):
+        data['model'] = agent['model']
+    data.update(agent.get('data', {}))
+    return data
+
+
+def grant_targets(supervisor):
+    """
+    (agenttype, permissions) for each grant, written either as an agenttype or as {"agenttype": ..., "permissions": [...]}
+    """
+    targets = []
+    for grant in supervisor.get('grants', []):
+        if isinstance(grant, str):
+            targets.append((grant, DEFAULT_PERMISSIONS))
+        else:
+            targets.append((grant['agenttype'], grant.get('permissions', DEFAULT_PERMISSIONS)))
+    return targets
+
+
+def find_agent_entity_type_id(client):
+    response = client.retrieve_entity_types()
+    if not response.was_successful():
+        print("Failed to retrieve entity types:")
+        print(response.error_response)
+        return None
+    for entity_type in response.success_response.get('entityTypes', []):
+        if entity_type.get('name') == 'Agent':
+            return entity_type.get('id')
+    print("Agent entity type not found. Please run the entity type creation script first.")
+    return None
+
+
+def search_existing(client):
+    """
+    Every agent and supervisor entity in the client's tenant, paging through one search
+    """
+    entities = []
+    while True:
+        response = client.search_entities({"search": {
+            "queryString": EXISTING_QUERY,
+            "startRow": len(entities),
+            "numberOfResults": SEARCH_PAGE_SIZE
+        }})
+        if not response.was_successful():
+            print(f"Failed to search for entities: {response.error_response}")
+            return None
+        page = response.success_response.get('entities', [])
+        entities.extend(page)
+        if len(page) < SEARCH_PAGE_SIZE or len(entities) >= response.success_response.get('total', 0):
+            return entities
+
+
+def search_grants(client, target_id):
+    """
+    {recipient entity id: permissions} for the grants on a target entity, paging through one search
+    """
+    grants = {}
+    start_row = 0
+    while True:
+        response = client.search_entity_grants({"search": {
+            "entityId": target_id,
+            "startRow": start_row,
+            "numberOfResults": SEARCH_PAGE_SIZE
+        }})
+        if not response.was_successful():
+            raise SpecError(f"Failed to search grants for entity {target_id}: {response.error_response}")
+        page = response.success_response.get('grants', [])
+        start_row += len(page)
+        for grant in page:
+            recipient_id = grant.get('recipientEntityId') or grant.get('recipientEntity', {}).get('id')
+            if recipient_id:
+                grants[recipient_id] = sorted(grant.get('permissions', []))
+        if len(page) < SEARCH_PAGE_SIZE or start_row >= response.success_response.get('total', 0):
+            return grants
+
+
+def index_existing(entities, key, label):
+    indexed = {}
+    for entity in entities:
+        value = (entity.get('data') or {}).get(key)
+        if value is None:
+            continue
+        if value in indexed:
+            # left over from scripts that created entities with random ids; the first one is managed
+            print(f"  warning: more than one entity with {label} {value}, managing {indexed[value]['id']} and ignoring {entity['id']}")
+            continue
+        indexed[value] = entity
+    return indexed
+
+
+def checked(response, description):
+    if not response.was_successful():
+        raise SpecError(f"{description} failed: {response.error_response}")
+
+
+def plan_entities(client, tenant, agent_entity_type_id, existing):
+    """
+    Changes to agent and supervisor entities, and the entity id for every agenttype and supervisor name
+    """
+    tenant_id = tenant.get('id')
+    changes = []
+    ids = {'agent': {}, 'supervisor': {}}
+    current_agents = index_existing(existing, 'agenttype', 'agenttype')
+    current_supervisors = index_existing(existing, 'supervisorname', 'supervisorname')
+
+    for entity_type in ('agent', 'supervisor'):
+        specs = tenant.get('agents' if entity_type == 'agent' else 'supervisors', [])
+        current_entities = current_agents if entity_type == 'agent' else current_supervisors
+        for spec in specs:
+            key = spec['agenttype'] if entity_type == 'agent' else spec['name']
+            name = spec.get('name') or key
+            data = agent_data(spec) if entity_type == 'agent' else {"supervisorname": key, **spec.get('data', {})}
+            current = current_entities.get(key)
+
+            if current is None:
+                entity_id = entity_id_for(tenant_id, entity_type, key)
+                request = {"entity": {"name": name, "type": {"id": agent_entity_type_id}, "data": data}}
+                changes.append(Change('create', entity_type, key, name,
+                                      lambda entity_id=entity_id, request=request: checked(client.create_entity(request, entity_id), f"creating {entity_id}")))
+            else:
+                entity_id = current['id']
+                current_data = current.get('data') or {}
+                changed = sorted(field for field, value in data.items() if current_data.get(field) != value)
+                if current.get('name') != name:
+                    changed.insert(0, 'name')
+                if changed:
+                    # PATCH merges data, so keys set elsewhere, like agentarn, are kept
+                    request = {"entity": {"name": name, "data": data}}
+                    changes.append(Change('update', entity_type, key, ", ".join(changed),
+                                          lambda entity_id=entity_id, request=request: checked(client.patch_entity(entity_id, request), f"updating {entity_id}")))
+            ids[entity_type][key] = entity_id
+    return changes, ids, current_agents
+
+
+def plan_grants(client, tenant, ids, current_agents, workers):
+    """
+    Grants to add or correct, reading the existing grants of every already existing target concurrently
+    """
+    wanted = []
+    for supervisor in tenant.get('supervisors', []):
+        for agenttype, permissions in grant_targets(supervisor):
+            target_id = ids['agent'].get(agenttype) or (current_agents.get(agenttype) or {}).get('id')
+            if target_id is None:
+                raise SpecError(f"supervisor {supervisor['name']} is granted {agenttype}, which is neither in the spec nor in FusionAuth")
+            wanted.append((supervisor['name'], ids['supervisor'][supervisor['name']], agenttype, target_id, sorted(permissions)))
+
+    existing_targets = {target_id for _, _, agenttype, target_id, _ in wanted if agenttype in current_agents}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        existing_grants = dict(zip(existing_targets, pool.map(lambda target_id: search_grants(client, target_id), existing_targets)))
+
+    changes = []
+    for supervisor_name, recipient_id, agenttype, target_id, permissions in wanted:
+        if existing_grants.get(target_id, {}).get(recipient_id) == permissions:
+            continue
+        request = {"grant": {"recipientEntityId": recipient_id, "permissions": permissions}}
+        changes.append(Change('grant', 'grant', f"{supervisor_name} -> {agenttype}", ", ".join(permissions),
+                              lambda target_id=target_id, request=request: checked(client.upsert_entity_grant(target_id, request), f"granting on {target_id}")))
+    return changes
+
+
+def apply_changes(changes, workers):
+    """
+    Apply changes on a bounded pool, returning the error for each change that failed
+    """
+    def apply(change):
+        try:
+            change.apply()
+            return None
+        except SpecError as e:
+            return str(e)
+        except Exception as e:
+            return f"Exception occurred: {e}"
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        errors = list(pool.map(apply, changes))
+    return [(change, error) for change, error in zip(changes, errors) if error]
+
+
+def print_changes(changes):
+    for change in changes:
+        label = change.kind if change.kind != 'grant' else ''
+        print(f"  {change.action:6} {label:10} {change.key} ({change.detail})")
+
+
+def provision_tenant(api_key, base_url, tenant, agent_entity_type_id, dry_run, workers):
+    """
+    Plan and, unless dry_run, apply one tenant's spec. Returns (changes, failures).
+    """
+    client = FusionAuthClient(api_key, base_url)
+    if tenant.get('id'):
+        client.set_tenant_id(tenant['id'])
+
+    print(f"tenant {tenant.get('id') or 'default'}:")
+    existing = search_existing(client)
+    if existing is None:
+        return [], [(None, "could not read the existing entities")]
+
+    entity_changes, ids, current_agents = plan_entities(client, tenant, agent_entity_type_id, existing)
+    grant_changes = plan_grants(client, tenant, ids, current_agents, workers)
+    changes = entity_changes + grant_changes
+    if not changes:
+        print("  up to date")
+    print_changes(changes)
+
+    failures = []
+    if not dry_run and changes:
+        # grants need their target and recipient entities to exist first
+        failures = apply_changes(entity_changes, workers)
+        if failures:
+            failures += [(change, "skipped because an entity change failed") for change in grant_changes]
+        else:
+            failures = apply_changes(grant_changes, workers)
+        for name, entity_id in ids['supervisor'].items():
+            print(f"  supervisor {name}: SUPERVISOR_ENTITY_ID={entity_id}")
+    return changes, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or update agents, supervisors and grants to match a spec")
+    parser.add_argument('spec', help="json spec of agents, supervisors and grants, see agents.example.json")
+    parser.add_argument('--dry-run', action='store_true', help="print the changes without making them")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="concurrent FusionAuth requests")
+    args = parser.parse_args()
+
+    api_key = os.getenv('FUSIONAUTH_API_KEY')
+    base_url = os.getenv('FUSIONAUTH_BASE_URL')
+    if not api_key or not base_url:
+        print("Error: FUSIONAUTH_API_KEY and FUSIONAUTH_BASE_URL must be set in .env file")
+        exit(1)
+
+    try:
+        tenants = load_spec(args.spec)
+    except (OSError, ValueError, SpecError) as e:
+        print(f"Error: could not load spec {args.spec}: {e}")
+        exit(1)
+
+    # entity types are global, not per tenant
+    agent_entity_type_id = find_agent_entity_type_id(FusionAuthClient(api_key, base_url))
+    if agent_entity_type_id is None:
+        exit(1)
+
+    total_changes = 0
+    all_failures = []
+    for tenant in tenants:
+        try:
+            changes, failures = provision_tenant(api_key, base_url, tenant, agent_entity_type_id, args.dry_run, args.workers)
+        except SpecError as e:
+            changes, failures = [], [(None, str(e))]
+        total_changes += len(changes)
+        all_failures.extend(failures)
+
+    if args.dry_run:
+        print(f"\n{total_changes} changes planned, none applied (dry run)")
+    else:
+        print(f"\n{total_changes - len(all_failures)}/{total_changes} changes applied")
+    for change, error in all_failures:
+        print(f"  FAILED {change.action + ' ' + change.key if change else ''}: {error}")
+    if all_failures:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
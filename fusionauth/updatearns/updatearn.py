@@ -16,12 +16,24 @@ if not api_key or not base_url:
 
 client = FusionAuthClient(api_key, base_url)
 
-if len(sys.argv) != 3:
-    print('Usage: script.py <agent-type> <agent-arn>')
+if len(sys.argv) < 3:
+    print('Usage: script.py <agent-type> <agent-arn> [<agent-arn> ...]')
     sys.exit(1)
 
 agent_type = sys.argv[1]
-agent_arn = sys.argv[2]
+agent_arns = sys.argv[2:]
+
+
+def arn_region(arn):
+    # arn:aws:bedrock-agentcore:<region>:<account>:runtime/<id>, read the same way as the supervisor's region_router
+    parts = arn.split(':')
+    return parts[3] if len(parts) > 5 and parts[0] == 'arn' and parts[3] else None
+
+
+for arn in agent_arns:
+    if not arn_region(arn):
+        print(f'Not an AgentCore runtime ARN with a region: {arn}')
+        sys.exit(1)
 
 # Search for entity
 response = client.search_entities({'search': {'queryString': f'data.agenttype:{agent_type}'}})
@@ -32,8 +44,18 @@ if not entities:
     sys.exit(1)
 
 entity = entities[0]
-entity['data']['agentarn'] = agent_arn
+
+# agentarns holds one runtime per region; ARNs for regions not given here are kept
+agent_arns_by_region = dict(entity['data'].get('agentarns') or {})
+if entity['data'].get('agentarn') and arn_region(entity['data']['agentarn']):
+    agent_arns_by_region.setdefault(arn_region(entity['data']['agentarn']), entity['data']['agentarn'])
+for arn in agent_arns:
+    agent_arns_by_region[arn_region(arn)] = arn
+
+# the first ARN given stays the primary, for anything that only reads agentarn
+entity['data']['agentarn'] = agent_arns[0]
+entity['data']['agentarns'] = agent_arns_by_region
 
 # Update entity
 client.update_entity(entity['id'], {'entity': entity})
-print(f'Updated entity {entity["id"]}')
+print(f'Updated entity {entity["id"]} with runtimes in {", ".join(sorted(agent_arns_by_region))}')
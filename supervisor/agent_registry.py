@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+import time
+from collections import namedtuple
+
+from storage import atomic_write_json
+
+DEFAULT_TTL_SECONDS = 300
+# after a failed reload the index already held is used for this long before trying again
+DEFAULT_RETRY_SECONDS = 15
+SEARCH_PAGE_SIZE = 100
+
+# every Agent entity that has an agenttype; the supervisor entity has none
+AGENT_QUERY = "data.agenttype:*"
+
+AgentConfig = namedtuple('AgentConfig', ['client_id', 'system_prompt', 'model', 'agentarn', 'data'])
+
+
+def agent_search_request(start_row):
+    return {
+        "search": {
+            "queryString": AGENT_QUERY,
+            "numberOfResults": SEARCH_PAGE_SIZE,
+            "startRow": start_row
+        }
+    }
+
+
+def index_agents(entities):
+    """
+    Build the agenttype -> AgentConfig index. The first entity of each type wins, as with find_entity_by_agenttype.
+    """
+    index = {}
+    for entity in entities:
+        data = entity.get('data') or {}
+        agenttype = data.get('agenttype')
+        if agenttype and agenttype not in index:
+            index[agenttype] = AgentConfig(entity.get('clientId'), data.get('systemprompt'), data.get('model'), data.get('agentarn'), data)
+    return index
+
+
+class AgentRegistry:
+    """
+    In-process index of Agent entities by agenttype, loaded with one paginated search.
+
+    The loader passed to get_async() returns the list of Agent entities. The index is reused
+    until ttl seconds have passed or invalidate() is called. When snapshot_path is set the
+    index is also written to disk, and a snapshot younger than ttl is used on startup
+    instead of searching FusionAuth.
+
+    An agenttype missing from an index loaded by an earlier call triggers one reload
+    before None is returned, so an agent provisioned since then is found.
+
+    If a reload raises while an index (or snapshot, however old) is held, the old index
+    keeps being served and the reload is retried after retry_seconds. Without one the
+    error is raised to the caller.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, snapshot_path=None, retry_seconds=DEFAULT_RETRY_SECONDS):
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.retry_seconds = retry_seconds
+        self._index = None
+        self._loaded_at = 0
+        self._retry_at = 0
+        self._async_lock = None
+        if self.snapshot_path:
+            self._load_snapshot()
+
+    def is_fresh(self):
+        """
+        True while the index doesn't need reloading: it is younger than ttl, or a reload just failed
+        """
+        return self._index is not None and (time.time() - self._loaded_at < self.ttl or time.time() < self._retry_at)
+
+    async def get_async(self, agenttype, load):
+        """
+        Return the AgentConfig for agenttype, or None, awaiting load if the index is stale
+        or agenttype is missing from it
+        """
+        loaded_at = self._loaded_at
+        stale = not self.is_fresh()
+        if stale:
+            await self._reload(load, lambda: not self.is_fresh())
+        agent = self._lookup(agenttype)
+        if agent is None and not stale and self._index is not None:
+            # the index predates this call, so the agent may have been provisioned since;
+            # not while a failed reload is waiting out retry_seconds
+            await self._reload(load, lambda: self._loaded_at == loaded_at and time.time() >= self._retry_at)
+            agent = self._lookup(agenttype)
+        return agent
+
+    async def _reload(self, load, needed):
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            # another caller may have reloaded while this one waited for the lock
+            if needed():
+                try:
+                    entities = await load()
+                except Exception as e:
+                    self._keep_stale(e)
+                else:
+                    self._store(entities)
+
+    def invalidate(self):
+        """
+        Force the next lookup to reload from FusionAuth, e.g. after an agent entity is updated.
+        The index already held keeps being served if the reload fails.
+        """
+        self._loaded_at = 0
+        self._retry_at = 0
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            os.remove(self.snapshot_path)
+
+    def _lookup(self, agenttype):
+        if self._index is None:
+            return None
+        return self._index.get(agenttype)
+
+    def _keep_stale(self, error):
+        if self._index is None:
+            raise error
+        self._retry_at = time.time() + self.retry_seconds
+        print(f"Agent registry reload failed, using the copy loaded {time.time() - self._loaded_at:.0f}s ago: {error}")
+
+    def _store(self, entities):
+        if entities is None:
+            # keep serving whatever we had; the next lookup will try again
+            return
+        self._index = index_agents(entities)
+        self._loaded_at = time.time()
+        self._save_snapshot()
+
+    def _load_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, 'r') as file:
+                snapshot = json.load(file)
+            index = {agenttype: AgentConfig(**agent) for agenttype, agent in snapshot['agents'].items()}
+            loaded_at = float(snapshot['loaded_at'])
+        except (OSError, ValueError, TypeError, KeyError, AttributeError) as e:
+            # unreadable, or written in another shape; the first lookup loads from FusionAuth instead
+            print(f"Ignoring unreadable agent registry snapshot {self.snapshot_path}: {e}")
+            return
+        self._index = index
+        self._loaded_at = loaded_at
+
+    def _save_snapshot(self):
+        if not self.snapshot_path:
+            return
+        snapshot = {
+            "loaded_at": self._loaded_at,
+            "agents": {agenttype: agent._asdict() for agenttype, agent in self._index.items()}
+        }
+        atomic_write_json(self.snapshot_path, snapshot)
@@ -0,0 +1,382 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import urllib.parse
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from agent_registry import SEARCH_PAGE_SIZE, agent_search_request
+from batching import batch_results
+from fusionauth_guard import AgentConfigError, FusionAuthGuard
+from transport import (AGENTCORE_ENDPOINT, DEFAULT_BACKOFF_FACTOR, DEFAULT_CONNECT_TIMEOUT, DEFAULT_MAX_RETRIES,
+                       DEFAULT_POOL_SIZE, DEFAULT_READ_TIMEOUT, RETRY_STATUS_CODES, parse_stream_event)
+from tracing import tracer, xray_trace_header
+
+# cap on how long we will honor a Retry-After header
+MAX_RETRY_AFTER_SECONDS = 60
+
+
+class AgentRuntimeNotFound(Exception):
+    """
+    AgentCore answered 404 for an agent runtime, usually because its ARN was replaced
+    """
+
+    def __init__(self, agent_arn):
+        super().__init__(f"AgentCore has no runtime {agent_arn}")
+        self.agent_arn = agent_arn
+
+
+class AgentTokenRejected(Exception):
+    """
+    AgentCore answered 401 for an access token, e.g. one issued before FusionAuth rotated its keys
+    """
+
+    def __init__(self, agent_arn):
+        super().__init__(f"AgentCore rejected the access token for {agent_arn}")
+        self.agent_arn = agent_arn
+
+
+def retry_delay(response, attempt, backoff_factor):
+    """
+    Seconds to wait before retrying, from Retry-After if present, otherwise exponential backoff
+    """
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_RETRY_AFTER_SECONDS)
+        except ValueError:
+            try:
+                delay = parsedate_to_datetime(retry_after).timestamp() - parsedate_to_datetime(response.headers.get("Date")).timestamp()
+                return min(max(delay, 0), MAX_RETRY_AFTER_SECONDS)
+            except (TypeError, ValueError):
+                pass
+    return backoff_factor * (2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def connection_trace(attempt):
+    """
+    An httpx trace extension that records an agentcore.connect span when a new connection
+    is opened and an agentcore.ttfb span from sending the request to receiving the response headers
+    """
+    timings = {}
+
+    async def trace(event, info):
+        now = time.perf_counter()
+        if event == 'connection.connect_tcp.started':
+            timings['connect_start'] = now
+        elif event in ('connection.connect_tcp.complete', 'connection.start_tls.complete'):
+            timings['connect_end'] = now
+        elif event.endswith('send_request_headers.started'):
+            timings['request_start'] = now
+            if 'connect_end' in timings:
+                tracer.record('agentcore.connect', timings['connect_end'] - timings['connect_start'], attempt=attempt)
+        elif event.endswith('receive_response_headers.complete') and 'request_start' in timings:
+            tracer.record('agentcore.ttfb', now - timings['request_start'], attempt=attempt,
+                          new_connection='connect_start' in timings)
+
+    return trace
+
+
+class AsyncAgentCoreTransport:
+    """
+    Reusable HTTP transport for AgentCore invocations.
+
+    Holds one httpx connection pool shared by every coroutine on the event loop, so
+    repeated invocations skip the TCP and TLS handshakes. 429 and 5xx responses are
+    retried with exponential backoff, honoring any Retry-After header.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_factor=DEFAULT_BACKOFF_FACTOR, endpoint=AGENTCORE_ENDPOINT, region_endpoints=None):
+        self.endpoint = endpoint
+        # per-region overrides of endpoint, e.g. a local stand-in for each region
+        self.region_endpoints = region_endpoints or {}
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout)
+        )
+
+    def base_url(self, region):
+        return self.region_endpoints.get(region, self.endpoint).format(region=region)
+
+    async def post(self, url, headers=None, content=None, stream=False, on_throttle=None):
+        """
+        POST with retries. With stream=True the body is not read; the caller must aclose() the response.
+        on_throttle is called for every 429 response, so callers can slow down.
+        """
+        attempt = 0
+        while True:
+            request = self.client.build_request("POST", url, headers=headers, content=content,
+                                                extensions={"trace": connection_trace(attempt)})
+            try:
+                response = await self.client.send(request, stream=stream)
+            except httpx.ConnectError:
+                if attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(retry_delay(None, attempt, self.backoff_factor))
+                attempt += 1
+                continue
+
+            if response.status_code == 429 and on_throttle is not None:
+                on_throttle()
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                return response
+            if stream:
+                await response.aclose()
+            await asyncio.sleep(retry_delay(response, attempt, self.backoff_factor))
+            attempt += 1
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+class AsyncFusionAuthEntityManager:
+    """
+    Async counterpart of FusionAuthEntityManager, calling the FusionAuth REST API directly.
+    Calls go through guard, so failures raise FusionAuthError subclasses.
+    """
+
+    def __init__(self, api_key, fusionauth_url, token_cache=None, client=None, guard=None):
+        self.api_key = api_key
+        self.base_url = fusionauth_url.rstrip('/')
+        self.token_cache = token_cache
+        self.client = client or httpx.AsyncClient(timeout=httpx.Timeout(30, connect=DEFAULT_CONNECT_TIMEOUT))
+        self.guard = guard or FusionAuthGuard()
+
+    async def retrieve_entity_by_id(self, entity_id):
+        """
+        Retrieve an entity by its ID and extract client_id and client_secret
+        """
+        with tracer.span('fusionauth.entity_lookup', lookup='supervisor') as span:
+            response = await self.guard.call_async('entity', lambda timeout: self.client.get(
+                f"{self.base_url}/api/entity/{entity_id}",
+                headers={"Authorization": self.api_key},
+                timeout=timeout
+            ))
+            span.set(status=response.status_code)
+        entity = response.json()['entity']
+        return entity.get('clientId'), entity.get('clientSecret')
+
+    async def search_agents(self):
+        """
+        Return every entity with an agenttype, paging through the search results
+        """
+        entities = []
+        while True:
+            with tracer.span('fusionauth.entity_lookup', lookup='agent search') as span:
+                response = await self.guard.call_async('search', lambda timeout: self.client.post(
+                    f"{self.base_url}/api/entity/search",
+                    headers={"Authorization": self.api_key},
+                    json=agent_search_request(len(entities)),
+                    timeout=timeout
+                ))
+                span.set(status=response.status_code)
+            body = response.json()
+            page = body.get('entities', [])
+            entities.extend(page)
+            if len(page) < SEARCH_PAGE_SIZE or len(entities) >= body.get('total', 0):
+                return entities
+
+    async def perform_client_credentials_grant(self, client_id, client_secret, scope='invoke'):
+        """
+        Perform a client credentials grant, reusing a cached token while it is still valid
+        """
+        if self.token_cache is None:
+            token_data = await self.request_client_credentials_token(client_id, client_secret, scope)
+            return token_data.get('access_token') if token_data else None
+
+        return await self.token_cache.get_async(
+            client_id,
+            scope,
+            lambda: self.request_client_credentials_token(client_id, client_secret, scope)
+        )
+
+    async def request_client_credentials_token(self, client_id, client_secret, scope='invoke'):
+        """
+        Perform a client credentials grant against the token endpoint and return the token response
+        """
+        with tracer.span('fusionauth.token_grant', scope=scope) as span:
+            response = await self.guard.call_async('token', lambda timeout: self.client.post(
+                f"{self.base_url}/oauth2/token",
+                data={
+                    "client_id": client_id,
+                    "client_secret": client_secret,
+                    "grant_type": "client_credentials",
+                    "scope": scope
+                },
+                timeout=timeout
+            ))
+            span.set(status=response.status_code)
+        return response.json()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+async def invoke_agent_async(agent_arn, region, system_prompt, prompt, content, session_uuid, access_token, model, transport, doc_tools_enabled=False, on_chunk=None, on_throttle=None, on_usage=None):
+    """
+    Invoke an agent and return its text. When on_chunk is given the agent streams its
+    response and on_chunk is called with each piece of text as it arrives. on_throttle
+    is called whenever the runtime answers 429, and on_usage with the token usage the
+    agent reports once it has answered. Raises AgentRuntimeNotFound when AgentCore has no
+    runtime with agent_arn, and AgentTokenRejected when it refuses access_token.
+
+    The call is recorded as an agentcore.invoke span whose trace id is sent to the agent,
+    and the spans and token usage the agent reports back are recorded under it.
+    """
+    escaped_agent_arn = urllib.parse.quote(agent_arn, safe='')
+    url = f"{transport.base_url(region)}/runtimes/{escaped_agent_arn}/invocations?qualifier=DEFAULT"
+
+    with tracer.span('agentcore.invoke', model=model, region=region, streamed=on_chunk is not None, prompt_chars=len(prompt)) as span:
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "X-Amzn-Trace-Id": xray_trace_header(span.trace_id, span.span_id),
+            "Content-Type": "application/json",
+            "X-Amzn-Bedrock-AgentCore-Runtime-Session-Id": str(session_uuid)
+        }
+
+        payload = {"system_prompt": system_prompt, "prompt": prompt, "model": model, "doc_tools_enabled": doc_tools_enabled,
+                   "trace": {"trace_id": span.trace_id, "parent_id": span.span_id}}
+
+        metadata = {}
+        result = await send_invocation(url, headers, payload, transport, on_chunk, on_throttle, metadata)
+        if metadata.get("status") == 404:
+            raise AgentRuntimeNotFound(agent_arn)
+        if metadata.get("status") == 401:
+            raise AgentTokenRejected(agent_arn)
+
+        usage = metadata.get("usage") or {}
+        span.set(status=metadata.get("status"), response_chars=len(result) if result else 0,
+                 input_tokens=usage.get("inputTokens"), output_tokens=usage.get("outputTokens"))
+        tracer.record_remote((metadata.get("trace") or {}).get("spans"), 'agent')
+        if result and on_usage is not None:
+            on_usage(usage)
+        return result
+
+
+async def send_invocation(url, headers, payload, transport, on_chunk, on_throttle, metadata):
+    """
+    Post an invocation and return the agent's text, putting the status, usage and trace it reports into metadata
+    """
+    start = time.perf_counter()
+    if on_chunk is not None:
+        payload["stream"] = True
+        headers["Accept"] = "text/event-stream"
+        invoke_response = await transport.post(url, headers=headers, content=json.dumps(payload), stream=True, on_throttle=on_throttle)
+        metadata["status"] = invoke_response.status_code
+        try:
+            if invoke_response.status_code == 200:
+                return await read_stream(invoke_response, on_chunk, metadata, start)
+            await invoke_response.aread()
+        finally:
+            await invoke_response.aclose()
+    else:
+        invoke_response = await transport.post(url, headers=headers, content=json.dumps(payload), on_throttle=on_throttle)
+        metadata["status"] = invoke_response.status_code
+
+    if invoke_response.status_code == 200:
+        response_data = invoke_response.json()
+        metadata["usage"] = response_data.get("usage")
+        metadata["trace"] = response_data.get("trace")
+        return response_data.get("result", {}).get("content", [{}])[0].get("text", "")
+    print_error_response(invoke_response)
+
+
+async def invoke_agent_batch_async(agent_arn, region, system_prompt, documents, session_uuid, access_token, model, transport, doc_tools_enabled=False, on_throttle=None):
+    """
+    Invoke an agent with several documents in one request and return {id: BatchResult}, with None
+    for documents the agent failed on, or None if the request failed. documents is a list of
+    {"id", "prompt"}; the agent runs each as its own conversation under system_prompt.
+    Raises AgentRuntimeNotFound when AgentCore has no runtime with agent_arn, and
+    AgentTokenRejected when it refuses access_token.
+    """
+    escaped_agent_arn = urllib.parse.quote(agent_arn, safe='')
+    url = f"{transport.base_url(region)}/runtimes/{escaped_agent_arn}/invocations?qualifier=DEFAULT"
+
+    with tracer.span('agentcore.invoke', model=model, region=region, streamed=False, documents=len(documents),
+                     prompt_chars=sum(len(document["prompt"]) for document in documents)) as span:
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "X-Amzn-Trace-Id": xray_trace_header(span.trace_id, span.span_id),
+            "Content-Type": "application/json",
+            "X-Amzn-Bedrock-AgentCore-Runtime-Session-Id": str(session_uuid)
+        }
+
+        payload = {"system_prompt": system_prompt, "documents": documents, "model": model, "doc_tools_enabled": doc_tools_enabled,
+                   "trace": {"trace_id": span.trace_id, "parent_id": span.span_id}}
+
+        invoke_response = await transport.post(url, headers=headers, content=json.dumps(payload), on_throttle=on_throttle)
+        span.set(status=invoke_response.status_code)
+        if invoke_response.status_code == 404:
+            raise AgentRuntimeNotFound(agent_arn)
+        if invoke_response.status_code == 401:
+            raise AgentTokenRejected(agent_arn)
+        if invoke_response.status_code != 200:
+            print_error_response(invoke_response)
+            return None
+
+        response_data = invoke_response.json()
+        usage = response_data.get("usage") or {}
+        span.set(input_tokens=usage.get("inputTokens"), output_tokens=usage.get("outputTokens"))
+        tracer.record_remote((response_data.get("trace") or {}).get("spans"), 'agent')
+        return batch_results(response_data)
+
+
+def print_error_response(invoke_response):
+    if invoke_response.status_code >= 400:
+        print(f"Error Response ({invoke_response.status_code}):")
+        try:
+            print(json.dumps(invoke_response.json(), indent=2))
+        except ValueError:
+            print(invoke_response.text[:500])
+    else:
+        print(f"Unexpected status code: {invoke_response.status_code}")
+        print("Response text:")
+        print(invoke_response.text[:500])
+
+
+async def read_stream(response, on_chunk, metadata=None, start=None):
+    """
+    Collect the text of a streamed agent response, passing each chunk to on_chunk.
+    The usage and trace the agent sends after its text are put into metadata.
+    """
+    chunks = []
+    async for line in response.aiter_lines():
+        event = parse_stream_event(line)
+        if event is None:
+            continue
+        if "error" in event:
+            print(f"Error in streamed response: {event['error']}")
+            return None
+        delta = event.get("delta")
+        if delta:
+            if not chunks and start is not None:
+                tracer.record('agentcore.first_chunk', time.perf_counter() - start)
+            chunks.append(delta)
+            on_chunk(delta)
+        if metadata is not None:
+            for key in ("usage", "trace"):
+                if key in event:
+                    metadata[key] = event[key]
+    return "".join(chunks)
+
+
+class EventLoopThread:
+    """
+    A long-lived event loop on a daemon thread, so synchronous callers (including
+    several threads at once) can share the async clients and their connection pools.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Run the draft -> validate -> polish pipeline over many outlines concurrently.
+
+The source is either a directory of outline .md files or a manifest file listing one
+outline path per line. Each document gets its own directory under the output
+directory holding outline.md, drafted.md, validated.md and polished.md.
+
+Stages whose inputs have not changed since the last run into the same output
+directory are skipped.
+
+Usage: python batch.py <outline-dir-or-manifest> [--out DIR] [--draft N] [--validate N] [--polish N] [--force]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import time
+
+import invoke
+import scheduler
+import speculative
+from tracing import tracer
+from incremental import run_incremental_async
+
+DEFAULT_STAGE_CONCURRENCY = 4
+
+
+def find_outlines(source):
+    """
+    Return (name, path) for every outline in a directory or manifest file
+    """
+    if os.path.isdir(source):
+        paths = sorted(os.path.join(source, f) for f in os.listdir(source) if f.endswith('.md'))
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, 'r') as file:
+            lines = [line.strip() for line in file]
+        paths = [os.path.join(base, line) for line in lines if line and not line.startswith('#')]
+
+    outlines = []
+    seen = set()
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0]
+        # keep per-document directories distinct when two outlines share a file name
+        unique_name = name
+        suffix = 2
+        while unique_name in seen:
+            unique_name = f"{name}-{suffix}"
+            suffix += 1
+        seen.add(unique_name)
+        outlines.append((unique_name, path))
+    return outlines
+
+
+async def run_document(name, outline_path, output_dir, limiters, force):
+    directory = os.path.join(output_dir, name)
+    os.makedirs(directory, exist_ok=True)
+    shutil.copyfile(outline_path, os.path.join(directory, 'outline.md'))
+
+    start = time.perf_counter()
+    outcomes = await run_incremental_async(directory, force=force, limiters=limiters)
+    return time.perf_counter() - start, outcomes
+
+
+async def run_batch_async(outlines, output_dir, limits, force=False):
+    # batch documents queue behind interactive runs sharing the same agents
+    scheduler.invocation_priority.set(scheduler.BATCH)
+    # each stage gets its own cap on in-flight agent calls
+    limiters = {name: asyncio.Semaphore(limit) for name, limit in limits.items()}
+
+    start = time.perf_counter()
+    completed = await asyncio.gather(
+        *(run_document(name, path, output_dir, limiters, force) for name, path in outlines),
+        return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+
+    results = {}
+    failures = {}
+    for (name, _), outcome in zip(outlines, completed):
+        if isinstance(outcome, Exception):
+            failures[name] = outcome
+        else:
+            results[name] = outcome
+    return results, failures, elapsed
+
+
+def run_batch(outlines, output_dir, limits, force=False):
+    # every stage can be full at once, so size the connection pool for that
+    invoke.configure_pool(sum(limits.values()))
+
+    results, failures, elapsed = invoke.run_async(run_batch_async(outlines, output_dir, limits, force))
+    print_summary(len(outlines), results, failures, elapsed)
+    return results, failures
+
+
+def print_summary(total, results, failures, elapsed):
+    print(f"\nProcessed {total} documents in {elapsed:.1f}s")
+    print(f"  succeeded: {len(results)}")
+    print(f"  failed:    {len(failures)}")
+    if elapsed > 0:
+        print(f"  throughput: {len(results) / elapsed * 60:.2f} documents/minute")
+    if results:
+        stages = [outcome for _, outcomes in results.values() for outcome in outcomes]
+        skipped = sum(1 for outcome in stages if outcome.action == 'skip')
+        print(f"  stages run: {len(stages) - skipped}, skipped as up to date: {skipped}")
+        durations = sorted(duration for duration, _ in results.values())
+        print(f"  per-document latency: min {durations[0]:.1f}s, median {durations[len(durations) // 2]:.1f}s, max {durations[-1]:.1f}s")
+    print(f"  {invoke.response_cache.summary()}")
+    if invoke.speculative_polish:
+        print(f"  {speculative.stats.summary()}")
+    if invoke.agent_batcher is not None and invoke.agent_batcher.summary():
+        print(f"  {invoke.agent_batcher.summary()}")
+    budget_summary = invoke.prompt_budget.summary()
+    if budget_summary:
+        for line in budget_summary.splitlines():
+            print(f"  {line}")
+    guard_summary = invoke.fusionauth_guard.summary()
+    if guard_summary:
+        print(f"  {guard_summary}")
+    agent_summary = invoke.agent_scheduler.summary()
+    if agent_summary:
+        print("  agent scheduling:")
+        for line in agent_summary.splitlines():
+            print(f"    {line}")
+    print("  stage timings (seconds):")
+    for line in tracer.summary().splitlines():
+        print(f"    {line}")
+    for name, error in sorted(failures.items()):
+        print(f"  FAILED {name}: {type(error).__name__}: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the content pipeline over many outlines")
+    parser.add_argument('source', help="directory of outline .md files, or a manifest listing one outline path per line")
+    parser.add_argument('--out', default='output', help="directory for per-document outputs")
+    parser.add_argument('--draft', type=int, default=DEFAULT_STAGE_CONCURRENCY, help="concurrent drafting calls")
+    parser.add_argument('--validate', type=int, default=DEFAULT_STAGE_CONCURRENCY, help="concurrent validation calls")
+    parser.add_argument('--polish', type=int, default=DEFAULT_STAGE_CONCURRENCY, help="concurrent polishing calls")
+    parser.add_argument('--force', action='store_true', help="run every stage, even ones whose inputs have not changed")
+    parser.add_argument('--bypass-cache', action='store_true', help="invoke every agent even when a cached response exists")
+    args = parser.parse_args()
+
+    outlines = find_outlines(args.source)
+    if not outlines:
+        print(f"No outlines found in {args.source}")
+        exit(1)
+
+    if args.bypass_cache:
+        invoke.response_cache.bypass = True
+
+    limits = {'draft': args.draft, 'validate': args.validate, 'polish': args.polish}
+    _, failures = run_batch(outlines, args.out, limits, args.force)
+    if failures:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
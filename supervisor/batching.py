@@ -0,0 +1,152 @@
+import asyncio
+import itertools
+from collections import namedtuple
+
+# rough characters per token, for sizing batches before anything is sent
+CHARS_PER_TOKEN = 4
+# estimated prompt tokens per batched request, documents per request, and the largest prompt that is batched at all
+DEFAULT_TOKEN_BUDGET = 16000
+DEFAULT_MAX_DOCUMENTS = 8
+DEFAULT_MAX_DOCUMENT_TOKENS = 4000
+# how long a prompt waits for others to the same agent before its batch is sent
+DEFAULT_WINDOW_SECONDS = 0.05
+
+QueuedDocument = namedtuple('QueuedDocument', ['id', 'prompt', 'future'])
+
+BatchResult = namedtuple('BatchResult', ['text', 'usage'])
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def pack_batches(documents, token_budget=DEFAULT_TOKEN_BUDGET, max_documents=DEFAULT_MAX_DOCUMENTS):
+    """
+    Split (id, prompt, ...) tuples into batches in arrival order, each of at most token_budget
+    estimated prompt tokens and max_documents documents. A document over the budget gets a batch of its own.
+    """
+    batches = []
+    batch = []
+    tokens = 0
+    for document in documents:
+        size = estimate_tokens(document[1])
+        if batch and (tokens + size > token_budget or len(batch) >= max_documents):
+            batches.append(batch)
+            batch = []
+            tokens = 0
+        batch.append(document)
+        tokens += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def batch_results(response_data):
+    """
+    {id: BatchResult} from a batched invocation response; documents the agent failed on map to None
+    """
+    results = {}
+    for document_id, outcome in (response_data.get("results") or {}).items():
+        if "error" in outcome:
+            print(f"Error for batched document {document_id}: {outcome['error']}")
+            results[document_id] = None
+        else:
+            results[document_id] = BatchResult(outcome.get("result", {}).get("content", [{}])[0].get("text", ""), outcome.get("usage"))
+    return results
+
+
+class PendingBatch:
+    def __init__(self, send_batch):
+        self.send_batch = send_batch
+        self.documents = []
+        self.tokens = 0
+        self.timer = None
+
+
+class AgentBatcher:
+    """
+    Coalesces invocations of the same agent, system prompt and model into batched requests.
+
+    submit() holds a prompt for up to window_seconds while others with the same key
+    arrive, then every waiting prompt is packed by pack_batches and each batch is sent
+    with one send_batch call, so the request and runtime session overhead is paid once
+    per batch instead of once per document. A batch that reaches token_budget or
+    max_documents is sent straight away.
+    """
+
+    def __init__(self, token_budget=DEFAULT_TOKEN_BUDGET, max_documents=DEFAULT_MAX_DOCUMENTS,
+                 max_document_tokens=DEFAULT_MAX_DOCUMENT_TOKENS, window_seconds=DEFAULT_WINDOW_SECONDS):
+        self.token_budget = token_budget
+        self.max_documents = max_documents
+        self.max_document_tokens = max_document_tokens
+        self.window_seconds = window_seconds
+        self._pending = {}
+        self._sending = set()
+        self._ids = itertools.count(1)
+        self.requests = 0
+        self.documents = 0
+
+    def accepts(self, prompt):
+        """
+        Whether prompt is small enough to be batched
+        """
+        return estimate_tokens(prompt) <= self.max_document_tokens
+
+    async def submit(self, key, prompt, send_batch):
+        """
+        Queue prompt under key and return its result once its batch is answered. send_batch is
+        awaited with [{"id", "prompt"}] and returns {id: result}; the batch uses the send_batch
+        of the prompt that opened it. A failed send_batch raises in every caller of the batch.
+        """
+        loop = asyncio.get_running_loop()
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = PendingBatch(send_batch)
+        document = QueuedDocument(str(next(self._ids)), prompt, loop.create_future())
+        pending.documents.append(document)
+        pending.tokens += estimate_tokens(prompt)
+
+        if pending.tokens >= self.token_budget or len(pending.documents) >= self.max_documents:
+            self._flush(key)
+        elif pending.timer is None:
+            pending.timer = loop.call_later(self.window_seconds, self._flush, key)
+        return await document.future
+
+    def _flush(self, key):
+        pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+        if pending.timer is not None:
+            pending.timer.cancel()
+        for batch in pack_batches(pending.documents, self.token_budget, self.max_documents):
+            task = asyncio.ensure_future(self._send(pending.send_batch, batch))
+            # the loop only keeps weak references to tasks
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, send_batch, batch):
+        self.requests += 1
+        self.documents += len(batch)
+        try:
+            results = await send_batch([{"id": document.id, "prompt": document.prompt} for document in batch])
+        except Exception as e:
+            for document in batch:
+                if not document.future.done():
+                    document.future.set_exception(e)
+            return
+        for document in batch:
+            # a caller that was cancelled while waiting has already given up on its future
+            if not document.future.done():
+                document.future.set_result((results or {}).get(document.id))
+
+    def metrics(self):
+        return {
+            "requests": self.requests,
+            "documents": self.documents,
+            "documents_per_request": self.documents / self.requests if self.requests else 0,
+        }
+
+    def summary(self):
+        if not self.requests:
+            return None
+        return f"batching: {self.documents} documents in {self.requests} requests ({self.documents / self.requests:.1f} per request)"
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Load test the draft -> validate -> polish pipeline against local stand-ins for
+FusionAuth and AgentCore, so hot path regressions show up without live services.
+
+Runs run_pipeline_async for N documents, C at a time, and reports throughput,
+per-document latency percentiles and FusionAuth and agent calls per document.
+--save writes the results as json; --baseline compares against saved results and
+exits 1 if throughput, p95 latency or calls per document regressed by more than
+--tolerance.
+
+--batch packs small agent calls into batched requests (AGENTCORE_BATCH); --session-ms
+makes each new runtime session cost what starting one does, which batching pays once
+per batch, and --agent-rpm rate limits every agent, which batching counts once per batch.
+
+--regions gives every agent a runtime in each of the listed regions, each served by
+its own stand-in, to exercise region routing; --slow-region and --failing-region
+degrade one of them, and --hedge sends slow calls to a second region (AGENTCORE_HEDGING).
+
+Usage: python benchmark_pipeline.py [--documents N] [--concurrency C] [--stream] [--batch] [--session-ms MS] [--agent-rpm RPM]
+       [--first-token-ms MS] [--ms-per-kchar MS] [--error-rate R] [--throttle-rate R] [--fusionauth-error-rate R]
+       [--regions R1,R2 [--slow-region R --slow-region-ms MS] [--failing-region R] [--hedge]]
+       [--save FILE] [--baseline FILE]
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+
+# measure a cold process: no token, registry or response caches carried over from earlier runs
+os.environ.update(TOKEN_CACHE_PATH='', AGENT_REGISTRY_PATH='', RESPONSE_CACHE_PATH='', RESPONSE_CACHE_BYPASS='true')
+
+import invoke
+import stand_in_servers
+from batching import AgentBatcher
+from tracing import percentile, tracer
+
+OUTLINE = "# {title}\n\n## Why it matters\n\n- point one\n- point two\n\n## How it works\n\n- detail one\n- detail two\n\n## Wrapping up\n\n- summary\n"
+
+# results where a higher value is a regression; the rest regress when they drop
+HIGHER_IS_WORSE = ('p50_seconds', 'p95_seconds', 'p99_seconds', 'fusionauth_calls_per_document', 'agent_calls_per_document')
+COMPARED = ('documents_per_minute',) + HIGHER_IS_WORSE
+
+
+async def run_documents(directories, concurrency):
+    limiter = asyncio.Semaphore(concurrency)
+
+    async def run_document(directory):
+        async with limiter:
+            start = time.perf_counter()
+            result = await invoke.run_pipeline_async(directory)
+            if not result:
+                raise RuntimeError(f"pipeline returned no content for {directory}")
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*(run_document(directory) for directory in directories), return_exceptions=True)
+
+
+def run_load(documents, concurrency, stream, fusionauth, agentcores, batch=False):
+    """
+    Run the pipeline over generated outlines and return the results as a dict.
+    agentcores maps each region to the stand-in serving it.
+    """
+    invoke.fusionauth_api_key = 'stand-in-key'
+    invoke.fusionauth_base_url = fusionauth.url
+    invoke.supervisor_entity_id = stand_in_servers.SUPERVISOR_ENTITY_ID
+    invoke.agentcore_region_endpoints = {region: agentcore.url for region, agentcore in agentcores.items()}
+    invoke.stream_responses = stream
+    invoke.agent_batcher = AgentBatcher() if batch else None
+    invoke.response_cache.bypass = True
+    # every document in flight can have a call open
+    invoke.configure_pool(concurrency)
+
+    workspace = tempfile.mkdtemp(prefix='benchmark_pipeline_')
+    try:
+        directories = []
+        for index in range(documents):
+            directory = os.path.join(workspace, f"document-{index}")
+            os.makedirs(directory)
+            with open(os.path.join(directory, 'outline.md'), 'w') as file:
+                file.write(OUTLINE.format(title=f"Benchmark document {index}"))
+            directories.append(directory)
+
+        start = time.perf_counter()
+        completed = invoke.run_async(run_documents(directories, concurrency))
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    latencies = sorted(result for result in completed if not isinstance(result, BaseException))
+    failures = [result for result in completed if isinstance(result, BaseException)]
+    fusionauth_calls = sum(fusionauth.calls.values())
+    agent_calls = sum((agentcore.calls for agentcore in agentcores.values()), Counter())
+    return {
+        'documents': documents,
+        'concurrency': concurrency,
+        'stream': stream,
+        'batch': batch,
+        'succeeded': len(latencies),
+        'failed': len(failures),
+        'elapsed_seconds': elapsed,
+        'documents_per_minute': len(latencies) / elapsed * 60 if elapsed else 0,
+        'p50_seconds': percentile(latencies, 0.50),
+        'p95_seconds': percentile(latencies, 0.95),
+        'p99_seconds': percentile(latencies, 0.99),
+        'fusionauth_calls': dict(fusionauth.calls),
+        'fusionauth_calls_per_document': fusionauth_calls / documents,
+        # batched documents arrive inside an invocation, so they aren't calls of their own
+        'agent_calls_per_document': sum(count for name, count in agent_calls.items() if name != 'batched_documents') / documents,
+        'agent_calls': dict(agent_calls),
+        'regions': {region: dict(agentcore.calls) for region, agentcore in agentcores.items()} if len(agentcores) > 1 else None,
+        'routing': invoke.region_router.metrics() if len(agentcores) > 1 else None,
+        'batching': invoke.agent_batcher.metrics() if batch else None,
+        'fusionauth_guard': invoke.fusionauth_guard.summary(),
+        'first_failure': f"{type(failures[0]).__name__}: {failures[0]}" if failures else None,
+    }
+
+
+def print_results(results):
+    print(f"{results['documents']} documents, {results['concurrency']} at a time"
+          f"{', streaming' if results['stream'] else ''}{', batched' if results.get('batch') else ''}: {results['succeeded']} succeeded, {results['failed']} failed")
+    print(f"  elapsed:     {results['elapsed_seconds']:.2f}s")
+    print(f"  throughput:  {results['documents_per_minute']:.1f} documents/minute")
+    print(f"  latency:     p50 {results['p50_seconds']:.3f}s  p95 {results['p95_seconds']:.3f}s  p99 {results['p99_seconds']:.3f}s")
+    print(f"  fusionauth:  {results['fusionauth_calls_per_document']:.2f} calls/document {results['fusionauth_calls']}")
+    print(f"  agentcore:   {results['agent_calls_per_document']:.2f} calls/document {results['agent_calls']}")
+    if results.get('batching'):
+        batching = results['batching']
+        print(f"  batching:    {batching['documents']} documents in {batching['requests']} requests ({batching['documents_per_request']:.1f} per request)")
+    if results.get('regions'):
+        for region, calls in results['regions'].items():
+            print(f"    {region}: {calls}")
+        routing = results['routing']
+        print(f"  routing:     wins {routing['wins']}, {routing['hedges']} hedges, {routing['failovers']} failovers, {routing['probes']} probes")
+    if results.get('fusionauth_guard'):
+        print(f"  {results['fusionauth_guard']}")
+    if results['first_failure']:
+        print(f"  first failure: {results['first_failure']}")
+
+
+def regressions(results, baseline, tolerance):
+    """
+    Describe every compared result that is more than tolerance worse than the baseline
+    """
+    found = []
+    for key in COMPARED:
+        if key not in baseline or not baseline[key]:
+            continue
+        change = (results[key] - baseline[key]) / baseline[key]
+        worse = change if key in HIGHER_IS_WORSE else -change
+        if worse > tolerance:
+            found.append(f"{key}: {baseline[key]:.3f} -> {results[key]:.3f} ({change:+.0%})")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the content pipeline against local FusionAuth and AgentCore stand-ins")
+    parser.add_argument('--documents', type=int, default=50, help="documents to run through the pipeline")
+    parser.add_argument('--concurrency', type=int, default=10, help="documents in flight at once")
+    parser.add_argument('--stream', action='store_true', help="stream agent responses")
+    parser.add_argument('--batch', action='store_true', help="pack small agent calls into batched requests")
+    parser.add_argument('--session-ms', type=float, default=0, help="delay the first time the agent stand-in sees a runtime session")
+    parser.add_argument('--agent-rpm', type=float, help="requestsperminute in every agent entity's data")
+    parser.add_argument('--first-token-ms', type=float, default=200, help="agent latency before the first text")
+    parser.add_argument('--ms-per-kchar', type=float, default=50, help="agent generation time per 1000 characters")
+    parser.add_argument('--handshake-ms', type=float, default=20, help="delay per new connection to the agent stand-in")
+    parser.add_argument('--fusionauth-ms', type=float, default=5, help="latency of each FusionAuth request")
+    parser.add_argument('--fusionauth-error-rate', type=float, default=0, help="fraction of FusionAuth requests answered 503")
+    parser.add_argument('--error-rate', type=float, default=0, help="fraction of agent calls answered 500")
+    parser.add_argument('--throttle-rate', type=float, default=0, help="fraction of agent calls answered 429")
+    parser.add_argument('--regions', help="comma separated regions to give every agent a runtime in, each with its own stand-in")
+    parser.add_argument('--slow-region', help="region whose stand-in is slower to send its first text")
+    parser.add_argument('--slow-region-ms', type=float, default=1000, help="extra latency before the first text in --slow-region")
+    parser.add_argument('--failing-region', help="region whose stand-in answers every call 500")
+    parser.add_argument('--hedge', action='store_true', help="hedge slow calls to the next region")
+    parser.add_argument('--spans', action='store_true', help="also print per-stage span timings")
+    parser.add_argument('--save', help="write the results to this json file")
+    parser.add_argument('--baseline', help="json results from an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed fractional regression against the baseline")
+    args = parser.parse_args()
+
+    regions = args.regions.split(',') if args.regions else [stand_in_servers.STAND_IN_REGION]
+    invoke.region_router.max_hedges = 1 if args.hedge else 0
+    agent_data = {agenttype: {"requestsperminute": args.agent_rpm} for agenttype in stand_in_servers.AGENT_TYPES} if args.agent_rpm else {}
+    fusionauth = stand_in_servers.start_fusionauth(latency_seconds=args.fusionauth_ms / 1000, error_rate=args.fusionauth_error_rate,
+                                                  regions=regions, agent_data=agent_data)
+    agentcores = {}
+    for region in regions:
+        agentcores[region] = stand_in_servers.start_agentcore(
+            first_token_seconds=(args.first_token_ms + (args.slow_region_ms if region == args.slow_region else 0)) / 1000,
+            seconds_per_kchar=args.ms_per_kchar / 1000,
+            handshake_seconds=args.handshake_ms / 1000,
+            session_seconds=args.session_ms / 1000,
+            error_rate=1 if region == args.failing_region else args.error_rate,
+            throttle_rate=args.throttle_rate
+        )
+    try:
+        results = run_load(args.documents, args.concurrency, args.stream, fusionauth, agentcores, args.batch)
+    finally:
+        fusionauth.stop()
+        for agentcore in agentcores.values():
+            agentcore.stop()
+
+    print_results(results)
+    if invoke.prompt_budget.summary():
+        print(invoke.prompt_budget.summary())
+    if args.spans:
+        print(tracer.summary())
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        found = regressions(results, baseline, args.tolerance)
+        if found:
+            print(f"regressed by more than {args.tolerance:.0%} against {args.baseline}:")
+            for regression in found:
+                print(f"  - {regression}")
+            exit(1)
+        print(f"no regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
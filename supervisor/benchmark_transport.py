@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Compare per-call latency of invoke_agent_async with and without connection pooling.
+
+Starts the local AgentCore stand-in from stand_in_servers. It sleeps once per new connection to approximate the TCP/TLS handshake cost of a real
+regional endpoint.
+
+Usage: python benchmark_transport.py [calls] [handshake-ms]
+"""
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+
+import httpx
+
+from async_client import AsyncAgentCoreTransport, invoke_agent_async
+from stand_in_servers import start_agentcore
+
+
+class UnpooledTransport(AsyncAgentCoreTransport):
+    """
+    Same interface, but a fresh connection for every call
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.client = httpx.AsyncClient(limits=httpx.Limits(max_keepalive_connections=0), timeout=self.client.timeout)
+
+
+async def run(transport, calls):
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await invoke_agent_async("arn:aws:bedrock-agentcore:local:0:runtime/bench", "local", "system", "prompt", "",
+                                 uuid.uuid4(), "token", None, transport)
+        latencies.append((time.perf_counter() - start) * 1000)
+    await transport.aclose()
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:10} mean {statistics.mean(latencies):7.2f} ms  p50 {statistics.median(latencies):7.2f} ms  p95 {p95:7.2f} ms")
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    handshake_seconds = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+
+    server = start_agentcore(handshake_seconds=handshake_seconds)
+    endpoint = server.url
+
+    print(f"{calls} calls, {handshake_seconds * 1000:.0f} ms simulated handshake")
+    unpooled = asyncio.run(run(UnpooledTransport(endpoint=endpoint), calls))
+    pooled = asyncio.run(run(AsyncAgentCoreTransport(endpoint=endpoint), calls))
+    report("unpooled", unpooled)
+    report("pooled", pooled)
+
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import json
+import math
+import os
+import threading
+from collections import Counter, defaultdict, namedtuple
+
+from batching import CHARS_PER_TOKEN
+from storage import atomic_write_json
+
+# share of a context window the estimated input and output may fill, leaving room for estimation error
+DEFAULT_HEADROOM = 0.9
+# weight of each new observation in the learned corrections
+DEFAULT_LEARNING_RATE = 0.3
+# corrections are kept within these bounds, so one odd call can't throw the estimates far off
+MIN_CORRECTION = 0.1
+MAX_CORRECTION = 10
+# throughput assumed for models whose entry has none
+DEFAULT_OUTPUT_TOKENS_PER_SECOND = 50
+DEFAULT_FIRST_TOKEN_SECONDS = 1.0
+
+ModelProfile = namedtuple('ModelProfile', ['id', 'context_window', 'max_output_tokens', 'output_tokens_per_second', 'first_token_seconds'])
+
+# the output a kind of call is expected to produce: floor tokens plus ratio times the document's tokens.
+# chunkable calls return the document rewritten, so they can be split into sections when no model fits.
+OutputShape = namedtuple('OutputShape', ['kind', 'floor', 'ratio', 'chunkable'])
+
+Plan = namedtuple('Plan', ['kind', 'model', 'input_tokens', 'output_tokens', 'seconds', 'chunks', 'fits'])
+
+# the estimates a Plan makes, in the order record() and summary() compare them
+MEASURES = ('input tokens', 'output tokens', 'seconds')
+
+
+def model_profile(entry):
+    return ModelProfile(entry.get('id'), entry.get('contextwindow'), entry.get('maxoutputtokens'),
+                        entry.get('outputtokenspersecond') or DEFAULT_OUTPUT_TOKENS_PER_SECOND,
+                        entry.get('firsttokenseconds') or DEFAULT_FIRST_TOKEN_SECONDS)
+
+
+def model_profiles(data, default_model):
+    """
+    The models an agent may use, from "models" in its entity data: a list of {"id", "contextwindow",
+    "maxoutputtokens", "outputtokenspersecond", "firsttokenseconds"}. The entity's own model is
+    first; without a "models" entry for it, it is used with no known limits.
+    """
+    profiles = [model_profile(entry) for entry in (data or {}).get('models') or [] if entry.get('id')]
+    ids = [profile.id for profile in profiles]
+    if default_model in ids:
+        profiles.insert(0, profiles.pop(ids.index(default_model)))
+    elif default_model or not profiles:
+        profiles.insert(0, model_profile({'id': default_model}))
+    return profiles
+
+
+class PromptBudget:
+    """
+    Estimates the input and output tokens and latency of each agent call before it is made,
+    and picks the fastest of the agent's models that fits them, or the number of sections to
+    split the document into when none does.
+
+    Input tokens are estimated from characters, output tokens from the call's OutputShape,
+    and latency from the model's first token time and output throughput. After each call
+    record() compares the estimates with the tokens and time it actually took, and moves a
+    correction factor per model (input, latency) and per kind of call (output) toward the
+    observed ratio. With stats_path set the corrections are kept on disk between runs.
+    Predictions and actuals are kept as running totals per kind of call and model, so
+    a long-running supervisor holds a fixed amount however many calls it makes.
+    """
+
+    def __init__(self, headroom=DEFAULT_HEADROOM, learning_rate=DEFAULT_LEARNING_RATE, stats_path=None):
+        self.headroom = headroom
+        self.learning_rate = learning_rate
+        self.stats_path = stats_path
+        self.corrections = {}
+        self.totals = defaultdict(Counter)
+        self._lock = threading.Lock()
+        if stats_path:
+            self._load()
+
+    def correction(self, name):
+        return self.corrections.get(name, 1.0)
+
+    def plan(self, data, default_model, system_prompt, prompt, content, shape, adaptive=True):
+        """
+        A Plan for sending prompt (which ends with content) to an agent with this entity data.
+        With adaptive False only the entity's own model is considered.
+        """
+        profiles = model_profiles(data, default_model)
+        if not adaptive:
+            profiles = [profile for profile in profiles if profile.id == default_model] or [model_profile({'id': default_model})]
+
+        content_tokens = len(content) / CHARS_PER_TOKEN
+        estimates = []
+        for profile in profiles:
+            input_tokens = (len(system_prompt or '') + len(prompt)) / CHARS_PER_TOKEN * self.correction(f"input/{profile.id}")
+            output_tokens = (shape.floor + shape.ratio * content_tokens) * self.correction(f"output/{shape.kind}")
+            chunks = self.chunks_needed(profile, input_tokens, output_tokens)
+            seconds = self.seconds(profile, output_tokens / chunks)
+            estimates.append((chunks, seconds, profile, input_tokens, output_tokens))
+
+        fitting = [estimate for estimate in estimates if estimate[0] == 1]
+        if fitting:
+            # the entity's own model wins ties, since min keeps the first of equals
+            _, seconds, profile, input_tokens, output_tokens = min(fitting, key=lambda estimate: estimate[1])
+            return Plan(shape.kind, profile.id, round(input_tokens), round(output_tokens), seconds, 1, True)
+        # fewest sections first, then the fastest per section, which all run at once
+        chunks, seconds, profile, input_tokens, output_tokens = min(estimates, key=lambda estimate: (estimate[0], estimate[1]))
+        return Plan(shape.kind, profile.id, round(input_tokens), round(output_tokens), seconds, chunks, False)
+
+    def chunks_needed(self, profile, input_tokens, output_tokens):
+        """
+        Sections the call has to be split into for each to fit the model's limits; 1 when it fits whole
+        """
+        chunks = 1
+        if profile.context_window:
+            chunks = max(chunks, math.ceil((input_tokens + output_tokens) / (profile.context_window * self.headroom)))
+        if profile.max_output_tokens:
+            chunks = max(chunks, math.ceil(output_tokens / (profile.max_output_tokens * self.headroom)))
+        return chunks
+
+    def seconds(self, profile, output_tokens):
+        return (profile.first_token_seconds + output_tokens / profile.output_tokens_per_second) * self.correction(f"latency/{profile.id}")
+
+    def record(self, plan, usage, seconds):
+        """
+        Compare a plan with the usage the agent reported and the seconds the call took, and learn from the difference
+        """
+        usage = usage or {}
+        predicted = (plan.input_tokens, plan.output_tokens, plan.seconds)
+        # the agent reports input summed over every model call; after a tool call the conversation is
+        # sent again with the tool results, which the plan doesn't estimate, so only one-call input is compared
+        input_tokens = usage.get('inputTokens') if (usage.get('cycles') or 1) <= 1 else None
+        actual = (input_tokens, usage.get('outputTokens'), seconds)
+        with self._lock:
+            totals = self.totals[(plan.kind, str(plan.model))]
+            totals['calls'] += 1
+            for measure, predicted_value, actual_value in zip(MEASURES, predicted, actual):
+                # calls without an actual value (e.g. batched calls have no latency of their own) aren't compared
+                if actual_value:
+                    totals[f"{measure} count"] += 1
+                    totals[f"{measure} predicted"] += predicted_value
+                    totals[f"{measure} actual"] += actual_value
+            self._learn(f"input/{plan.model}", predicted[0], actual[0])
+            self._learn(f"output/{plan.kind}", predicted[1], actual[1])
+            self._learn(f"latency/{plan.model}", predicted[2], actual[2])
+        self._save()
+
+    def _learn(self, name, predicted, actual):
+        if not predicted or not actual:
+            return
+        # the prediction already includes the current correction, so scale it by how far off it was
+        observed = self.correction(name) * actual / predicted
+        corrected = self.correction(name) * (1 - self.learning_rate) + observed * self.learning_rate
+        self.corrections[name] = min(MAX_CORRECTION, max(MIN_CORRECTION, corrected))
+
+    def summary(self):
+        """
+        Mean predicted/actual input tokens, output tokens and seconds per kind of call and model, or None before any call
+        """
+        with self._lock:
+            totals = {key: Counter(counts) for key, counts in self.totals.items()}
+        if not totals:
+            return None
+        lines = [f"{'call':16} {'model':44} {'count':>5}  {'input tokens':>19}  {'output tokens':>19}  {'seconds':>15}"]
+        for (kind, model), counts in sorted(totals.items()):
+            cells = []
+            for measure in MEASURES:
+                count = counts[f"{measure} count"]
+                if count:
+                    cells.append(f"{counts[f'{measure} predicted'] / count:.1f}/{counts[f'{measure} actual'] / count:.1f}")
+                else:
+                    cells.append("-")
+            lines.append(f"{kind:16} {model:44} {counts['calls']:5}  {cells[0]:>19}  {cells[1]:>19}  {cells[2]:>15}")
+        return "predicted/actual per call:\n" + "\n".join(lines)
+
+    def _load(self):
+        if not os.path.exists(self.stats_path):
+            return
+        try:
+            with open(self.stats_path, 'r') as file:
+                self.corrections = json.load(file).get('corrections', {})
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable prompt budget stats {self.stats_path}: {e}")
+
+    def _save(self):
+        if not self.stats_path:
+            return
+        with self._lock:
+            stats = {'corrections': dict(self.corrections)}
+        atomic_write_json(self.stats_path, stats, indent=2)
@@ -0,0 +1,206 @@
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+
+import httpx
+
+from transport import RETRY_STATUS_CODES
+from tracing import tracer
+
+# seconds each kind of FusionAuth call may take; searches scan every agent entity
+DEFAULT_TIMEOUTS = {'entity': 5, 'search': 15, 'token': 5}
+DEFAULT_TIMEOUT = 10
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_BACKOFF_SECONDS = 0.25
+MAX_BACKOFF_SECONDS = 5
+# consecutive failed attempts that open an endpoint's circuit, and how long it stays open before a trial call
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_SECONDS = 30
+
+
+class AgentConfigError(Exception):
+    """
+    Raised when an agent's configuration or access token cannot be loaded from FusionAuth
+    """
+
+
+class FusionAuthError(AgentConfigError):
+    """
+    A FusionAuth call failed. endpoint names the kind of call and status is the HTTP
+    status of the last attempt, or None if FusionAuth could not be reached.
+    """
+
+    def __init__(self, message, endpoint=None, status=None):
+        super().__init__(message)
+        self.endpoint = endpoint
+        self.status = status
+
+
+class FusionAuthUnavailable(FusionAuthError):
+    """
+    FusionAuth could not be reached or kept failing after retries; the same call may work later
+    """
+
+
+class CircuitOpenError(FusionAuthUnavailable):
+    """
+    The call was not attempted because the endpoint's circuit is open after repeated failures
+    """
+
+
+class FusionAuthRequestError(FusionAuthError):
+    """
+    FusionAuth answered with a client error, such as an unknown entity or bad credentials; retrying won't help
+    """
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures, rejecting calls for reset_seconds.
+    Then one trial call is let through: success closes the circuit, failure opens it again,
+    and a trial that ends without an answer (cancelled, say) lets the next call try instead.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_seconds=DEFAULT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half-open' if time.monotonic() - self.opened_at >= self.reset_seconds else 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def succeeded(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def abandoned(self):
+        """
+        Record an attempt that ended without telling whether FusionAuth is up
+        """
+        with self._lock:
+            self.trial_running = False
+
+    def failed(self):
+        """
+        Record a failure; returns True when it opened the circuit
+        """
+        with self._lock:
+            self.failures += 1
+            reopened = self.trial_running
+            self.trial_running = False
+            if reopened or (self.opened_at is None and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+
+def backoff_delay(attempt, backoff_seconds):
+    # full jitter, so callers that failed together don't retry together
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, backoff_seconds * (2 ** attempt)))
+
+
+class FusionAuthGuard:
+    """
+    Timeouts, jittered retries and a circuit breaker for calls to FusionAuth.
+
+    Each kind of call (entity, search, token) has its own timeout and circuit, so a
+    failing search doesn't stop tokens from being issued. Network errors, 429 and 5xx
+    are retried up to max_retries times; other 4xx raise FusionAuthRequestError
+    straight away. A call that can't succeed raises FusionAuthUnavailable, or
+    CircuitOpenError without calling FusionAuth while its circuit is open.
+    """
+
+    def __init__(self, timeouts=None, max_retries=DEFAULT_MAX_RETRIES, backoff_seconds=DEFAULT_BACKOFF_SECONDS,
+                 failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_seconds=DEFAULT_RESET_SECONDS):
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.counts = Counter()
+
+    def breaker(self, endpoint):
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_seconds)
+            return self._breakers[endpoint]
+
+    def timeout(self, endpoint):
+        return self.timeouts.get(endpoint, DEFAULT_TIMEOUT)
+
+    async def call_async(self, endpoint, send):
+        """
+        Await send(timeout), which makes one httpx request, and return the successful response
+        """
+        attempt = 0
+        while True:
+            self._admit(endpoint)
+            try:
+                response = await send(self.timeout(endpoint))
+                status, detail = response.status_code, response.text[:200]
+            except httpx.TransportError as e:
+                status, detail = None, f"{type(e).__name__}: {e}"
+            except BaseException:
+                # cancelled by a hedge or timeout, or a bug in send; either way the trial slot must be freed
+                self.breaker(endpoint).abandoned()
+                raise
+            delay = self._outcome(endpoint, attempt, status, detail)
+            if delay is None:
+                return response
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _admit(self, endpoint):
+        if not self.breaker(endpoint).allow():
+            self.counts['rejected'] += 1
+            raise CircuitOpenError(f"FusionAuth {endpoint} calls are paused after repeated failures", endpoint)
+
+    def _outcome(self, endpoint, attempt, status, detail):
+        """
+        Record an attempt. Returns None on success, the seconds to wait before retrying, or raises
+        """
+        breaker = self.breaker(endpoint)
+        if status is not None and status not in RETRY_STATUS_CODES:
+            # FusionAuth answered, so it is up even if it refused the request
+            breaker.succeeded()
+            if 200 <= status <= 299:
+                return None
+            raise FusionAuthRequestError(f"FusionAuth {endpoint} call failed ({status}): {detail}", endpoint, status)
+
+        if breaker.failed():
+            self.counts['opened'] += 1
+            print(f"FusionAuth {endpoint} circuit opened for {self.reset_seconds}s after repeated failures")
+        if attempt >= self.max_retries:
+            raise FusionAuthUnavailable(f"FusionAuth {endpoint} call failed after {attempt + 1} attempts ({status or 'no response'}): {detail}",
+                                        endpoint, status)
+        self.counts['retries'] += 1
+        delay = backoff_delay(attempt, self.backoff_seconds)
+        tracer.record('fusionauth.retry_wait', delay, endpoint=endpoint, status=status)
+        return delay
+
+    def summary(self):
+        if not self.counts:
+            return None
+        return f"fusionauth: {self.counts['retries']} retries, {self.counts['opened']} circuit opens, {self.counts['rejected']} calls rejected while open"
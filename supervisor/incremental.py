@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Draft, validate and polish outline.md, re-running only the stages whose input file or agent
+definition changed since they last ran.
+
+This is the supervisor's command line. python invoke.py still works and runs it with the same
+arguments; invoke.py holds the stages and clients it imports.
+
+Usage: python incremental.py [--directory DIR] [--force] [--dry-run]
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+
+import invoke
+import speculative
+from tracing import tracer
+
+STATE_FILE = '.pipeline_state.json'
+
+Stage = namedtuple('Stage', ['name', 'agenttype', 'input', 'output', 'prompts', 'handler'])
+
+STAGES = [
+    Stage('draft', 'draftcontent', 'outline.md', 'drafted.md', [invoke.DRAFT_PROMPT], invoke.handle_drafting_async),
+    Stage('validate', 'validatecontent', 'drafted.md', 'validated.md', [invoke.STRUCTURED_VALIDATE_PROMPT, invoke.STRUCTURED_VALIDATE_PATCH_PROMPT, invoke.VALIDATE_CHECK_PROMPT, invoke.REWRITE_PROMPT], invoke.handle_validation_async),
+    Stage('polish', 'polishcontent', 'validated.md', 'polished.md', [invoke.POLISH_PROMPT, invoke.PATCH_POLISH_PROMPT, invoke.POLISH_SECTION_INSTRUCTIONS], invoke.handle_polishing_async),
+]
+
+StageOutcome = namedtuple('StageOutcome', ['stage', 'action', 'reason', 'seconds'])
+
+
+class PipelineError(Exception):
+    pass
+
+
+def file_digest(path):
+    try:
+        with open(path, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def agent_digest(stage, agent):
+    """
+    Digest of what about the agent and stage prompts shapes the stage output: the system prompt, the
+    model, the runtime ARN it resolves to and the stage prompts. Rate limits and extra regions in the
+    entity data only change how calls are sent, so editing them doesn't re-run the stage.
+    """
+    material = json.dumps([agent.system_prompt, agent.model, agent.agentarn, stage.prompts])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def load_state(directory):
+    try:
+        with open(os.path.join(directory, STATE_FILE), 'r') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_state(directory, state):
+    with open(os.path.join(directory, STATE_FILE), 'w') as file:
+        json.dump(state, file, indent=2)
+
+
+def stale_reason(directory, stage, agent, state):
+    """
+    Why a stage has to run, or None when its recorded inputs still match
+    """
+    record = state.get(stage.name)
+    if record is None:
+        return "no previous run"
+    if not os.path.exists(os.path.join(directory, stage.output)):
+        return f"{stage.output} missing"
+    if record.get('input') != file_digest(os.path.join(directory, stage.input)):
+        return f"{stage.input} changed"
+    if record.get('agent') != agent_digest(stage, agent):
+        return f"{stage.agenttype} agent changed"
+    return None
+
+
+async def run_incremental_async(directory='.', force=False, dry_run=False, limiters=None):
+    """
+    Run only the stages whose input file or agent definition changed since they last ran.
+
+    With dry_run nothing is invoked; a stage after one that would run is assumed to
+    need running too. limiters maps stage names to async context managers, such as
+    semaphores, held while that stage runs. Returns a StageOutcome per stage.
+    """
+    # each document's run is one trace
+    with tracer.span('pipeline', directory=directory):
+        return await run_stages(directory, force, dry_run, limiters)
+
+
+async def run_stages(directory, force, dry_run, limiters):
+    state = load_state(directory)
+    outcomes = []
+    upstream_runs = False
+
+    for stage in STAGES:
+        agent = await invoke.get_agent_async(stage.agenttype)
+        if force:
+            reason = "forced"
+        elif dry_run and upstream_runs:
+            reason = "upstream stage will run"
+        else:
+            reason = stale_reason(directory, stage, agent, state)
+
+        if reason is None:
+            outcomes.append(StageOutcome(stage.name, 'skip', 'up to date', 0))
+            continue
+
+        upstream_runs = True
+        if dry_run:
+            outcomes.append(StageOutcome(stage.name, 'run', reason, 0))
+            continue
+
+        if stage.name == 'validate' and invoke.speculative_polish:
+            outcomes.extend(await run_speculatively(directory, stage, agent, state, reason, limiters))
+            break
+
+        start = time.perf_counter()
+        input_digest = file_digest(os.path.join(directory, stage.input))
+        limiter = (limiters or {}).get(stage.name) or contextlib.nullcontext()
+        async with limiter:
+            result = await stage.handler(directory)
+        if not result:
+            raise PipelineError(f"{stage.name} stage returned no content")
+
+        state[stage.name] = {'input': input_digest, 'agent': agent_digest(stage, agent)}
+        save_state(directory, state)
+        outcomes.append(StageOutcome(stage.name, 'run', reason, time.perf_counter() - start))
+
+    return outcomes
+
+
+async def run_speculatively(directory, validate_stage, validate_agent, state, reason, limiters):
+    """
+    Run validation and polishing together through the speculative scheduler
+    """
+    polish_stage = STAGES[-1]
+    polish_agent = await invoke.get_agent_async(polish_stage.agenttype)
+
+    start = time.perf_counter()
+    input_digest = file_digest(os.path.join(directory, validate_stage.input))
+    validated, polished = await speculative.validate_and_polish(directory, limiters)
+    if not validated:
+        raise PipelineError(f"{validate_stage.name} stage returned no content")
+    state[validate_stage.name] = {'input': input_digest, 'agent': agent_digest(validate_stage, validate_agent)}
+    save_state(directory, state)
+    if not polished:
+        raise PipelineError(f"{polish_stage.name} stage returned no content")
+    state[polish_stage.name] = {'input': file_digest(os.path.join(directory, polish_stage.input)), 'agent': agent_digest(polish_stage, polish_agent)}
+    save_state(directory, state)
+
+    seconds = time.perf_counter() - start
+    return [
+        StageOutcome(validate_stage.name, 'run', reason, seconds),
+        StageOutcome(polish_stage.name, 'run', "run speculatively alongside validation", seconds),
+    ]
+
+
+def print_plan(outcomes):
+    for outcome in outcomes:
+        timing = f" ({outcome.seconds:.1f}s)" if outcome.action == 'run' and outcome.seconds else ""
+        print(f"  {outcome.stage:9} {outcome.action:5} {outcome.reason}{timing}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Draft, validate and polish outline.md, re-running only stages whose inputs changed")
+    parser.add_argument('--directory', default='.', help="directory holding outline.md and the stage outputs")
+    parser.add_argument('--force', action='store_true', help="run every stage")
+    parser.add_argument('--dry-run', action='store_true', help="print the plan without invoking any agents")
+    args = parser.parse_args(argv)
+
+    try:
+        outcomes = invoke.run_stage(run_incremental_async(args.directory, args.force, args.dry_run))
+    except PipelineError as e:
+        print(e)
+        exit(1)
+    print("plan:" if args.dry_run else "stages:")
+    print_plan(outcomes)
+    print(invoke.response_cache.summary())
+    if invoke.speculative_polish:
+        print(speculative.stats.summary())
+    if invoke.prompt_budget.summary():
+        print(invoke.prompt_budget.summary())
+    if tracer.exporting:
+        print(tracer.summary())
+
+
+if __name__ == "__main__":
+    main()
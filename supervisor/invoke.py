@@ -1,252 +1,606 @@
-import requests
-import urllib.parse
-import json
+import asyncio
+import functools
+import time
 import os
+import sys
 import uuid
 import logging
-from fusionauth.fusionauth_client import FusionAuthClient
 from dotenv import load_dotenv
+from token_cache import TokenCache
+from validation_result import parse_validation_result
+from patches import apply_edits, parse_edits
+from sections import process_in_sections, split_sections
+from prompts import (DRAFT_PROMPT, PATCH_POLISH_PROMPT, POLISH_PROMPT, POLISH_SECTION_INSTRUCTIONS, REWRITE_PROMPT,
+                     STRUCTURED_VALIDATE_PATCH_PROMPT, STRUCTURED_VALIDATE_PROMPT, VALIDATE_CHECK_PROMPT)
+from budget import OutputShape, PromptBudget
+from scheduler import AgentScheduler
+from response_cache import DiskBackend, MemoryBackend, ResponseCache, response_cache_key
+from agent_registry import AgentRegistry, DEFAULT_TTL_SECONDS, SEARCH_PAGE_SIZE, agent_search_request
+from transport import AGENTCORE_ENDPOINT
+from region_router import RegionRouter, agent_routes, parse_region_endpoints
+from tracing import exporters_from_env, tracer
+from fusionauth_guard import AgentConfigError, FusionAuthGuard
+from batching import (AgentBatcher, DEFAULT_MAX_DOCUMENT_TOKENS, DEFAULT_MAX_DOCUMENTS, DEFAULT_TOKEN_BUDGET,
+                      DEFAULT_WINDOW_SECONDS)
+from async_client import (AgentRuntimeNotFound, AgentTokenRejected, AsyncAgentCoreTransport, AsyncFusionAuthEntityManager,
+                          EventLoopThread, invoke_agent_async, invoke_agent_batch_async)
 
 load_dotenv()
 
-REGION_NAME = "us-west-2"
-
-class FusionAuthEntityManager:
-    def __init__(self, api_key, fusionauth_url):
-        self.client = FusionAuthClient(api_key, fusionauth_url)
-        self.base_url = fusionauth_url
-    
-    def retrieve_entity_by_id(self, entity_id):
-        """
-        Retrieve an entity by its ID and extract client_id and client_secret
-        """
-        try:
-            # Use the direct API call since the Python client may not have a specific method
-            response = self.client.retrieve_entity(entity_id)
-            
-            if response.was_successful():
-                entity = response.success_response['entity']
-                client_id = entity.get('clientId')
-                client_secret = entity.get('clientSecret')
-                return client_id, client_secret
-            else:
-                print(f"Error retrieving entity by ID: {response.error_response}")
-                return None, None
-        except Exception as e:
-            print(f"Exception occurred: {e}")
-            return None, None
-    
-    def find_entity_by_agenttype(self, entity_agenttype_name):
-        """
-        Find an entity by type field in the data object and return its client_id
-        """
-        try:
-            # Search entities by type using the search API
-            search_request = {
-                "search": {
-                    "queryString": f"data.agenttype:{entity_agenttype_name}"
-                }
-            }
-            
-            # Use the generic request method for entity search
-            response = self.client.search_entities(search_request)
-            
-            if response.was_successful():
-                entities = response.success_response.get('entities', [])
-                if entities:
-                    # Return the client_id, systemprompt of the first matching entity
-                    first_entity = entities[0]
-                    model = None
-                    if first_entity.get('data').get('model'):
-                        model = first_entity.get('data').get('model')
-                    return first_entity.get('clientId'), first_entity.get('data').get('systemprompt'), model, first_entity.get('data').get('agentarn'),
-                else:
-                    print(f"No entities found with type: {entity_agenttype_name}")
-                    return None
-            else:
-                print(f"Error searching entities by type: {response.error_response}")
-                return None
-        except Exception as e:
-            print(f"Exception occurred: {e}")
-            return None
-    
-    def perform_client_credentials_grant(self, client_id, client_secret, scope='invoke'):
-        """
-        Perform a client credentials grant using the FusionAuth client library method
-        """
-        try:
-            response = self.client.client_credentials_grant(
-                client_id=client_id,
-                client_secret=client_secret,
-                scope=scope
-            )
-            
-            if response.was_successful():
-                token_data = response.success_response
-                access_token = token_data.get('access_token')
-                return access_token
-            else:
-                print(f"Error performing client credentials grant: {response.error_response}")
-                return None
-        except Exception as e:
-            print(f"Exception occurred during client credentials grant: {e}")
-            return None
-
-
-def invoke_agent(agent_arn, region, system_prompt, prompt, content, session_uuid, access_token, model, doc_tools_enabled=False):
-
-    # print(f"Using Agent ARN from environment: {invoke_agent_arn}")
-
-    # URL encode the agent ARN
-    escaped_agent_arn = urllib.parse.quote(agent_arn, safe='')
-
-    # Construct the URL
-    url = f"https://bedrock-agentcore.{region}.amazonaws.com/runtimes/{escaped_agent_arn}/invocations?qualifier=DEFAULT"
-
-    trace_uuid = uuid.uuid4()
+# region of agents whose ARN doesn't name one
+default_region = os.getenv('AWS_REGION', 'us-west-2')
+
+# the output each call is expected to produce, for the prompt budget: a floor of tokens plus a multiple of the
+# document's tokens, and whether it returns the document rewritten so it can be split into sections
+DRAFT_SHAPE = OutputShape('draft', 4000, 0.0, False)
+VALIDATE_CHECK_SHAPE = OutputShape('validate check', 5, 0.0, False)
+VALIDATE_SHAPE = OutputShape('validate', 200, 1.0, False)
+VALIDATE_EDITS_SHAPE = OutputShape('validate edits', 200, 0.3, False)
+REWRITE_SHAPE = OutputShape('rewrite', 0, 1.0, True)
+POLISH_SHAPE = OutputShape('polish', 0, 1.0, True)
+POLISH_EDITS_SHAPE = OutputShape('polish edits', 100, 0.3, False)
+# one part of a document processed in sections
+SECTION_SHAPE = OutputShape('section', 0, 1.0, False)
+
+# shared across stages so each target entity only needs one grant per token lifetime.
+# set TOKEN_CACHE_PATH to keep tokens on disk between runs.
+token_cache = TokenCache(os.getenv('TOKEN_CACHE_PATH'))
+
+# all Agent entities, loaded with one search and shared by every stage.
+# set AGENT_REGISTRY_PATH to snapshot it on disk so short runs can skip the search.
+agent_registry = AgentRegistry(
+    ttl=int(os.getenv('AGENT_REGISTRY_TTL', str(DEFAULT_TTL_SECONDS))),
+    snapshot_path=os.getenv('AGENT_REGISTRY_PATH')
+)
+
+# timeouts, retries and a circuit breaker per kind of FusionAuth call. failed calls raise FusionAuthError
+# subclasses; while a circuit is open the registry and tokens already loaded keep being used.
+fusionauth_guard = FusionAuthGuard(
+    max_retries=int(os.getenv('FUSIONAUTH_MAX_RETRIES', '2')),
+    failure_threshold=int(os.getenv('FUSIONAUTH_CIRCUIT_THRESHOLD', '5')),
+    reset_seconds=float(os.getenv('FUSIONAUTH_CIRCUIT_RESET_SECONDS', '30'))
+)
+
+# the FusionAuth instance holding the agent entities, and the supervisor's entity in it
+fusionauth_api_key = os.getenv('FUSIONAUTH_API_KEY')
+fusionauth_base_url = os.getenv('FUSIONAUTH_BASE_URL')
+supervisor_entity_id = os.getenv('SUPERVISOR_ENTITY_ID')
+
+# the supervisor's own client credentials, retrieved once per process
+_supervisor_credentials = None
+_supervisor_lock = asyncio.Lock()
+
+# one pooled, keep-alive transport for every agent invocation.
+# AGENTCORE_ENDPOINT sends invocations somewhere other than the regional endpoint, such as the local stand-ins;
+# AGENTCORE_REGION_ENDPOINTS=region=url,... does the same for individual regions.
+agentcore_pool_size = int(os.getenv('AGENTCORE_POOL_SIZE', '10'))
+agentcore_endpoint = os.getenv('AGENTCORE_ENDPOINT', AGENTCORE_ENDPOINT)
+agentcore_region_endpoints = parse_region_endpoints(os.getenv('AGENTCORE_REGION_ENDPOINTS'))
+
+# picks a region for agents with runtimes in more than one (agentarns in the entity data), by rolling latency and health.
+# calls only fail over on errors unless AGENTCORE_HEDGING=true, which also sends a slow call to the next region
+# once a region has latency samples, or after AGENTCORE_HEDGE_SECONDS before that. a hedge is a second full
+# generation, so it costs as much as the call it hedges and waits for the agent's rate limit like any other call.
+region_router = RegionRouter(
+    hedge_seconds=float(os.getenv('AGENTCORE_HEDGE_SECONDS')) if os.getenv('AGENTCORE_HEDGE_SECONDS') else None,
+    max_hedges=1 if os.getenv('AGENTCORE_HEDGING', 'false').lower() == 'true' else 0
+)
+
+# stage outputs keyed by a hash of their inputs, so unchanged stages are skipped.
+# RESPONSE_CACHE_PATH switches from in-memory to on-disk; RESPONSE_CACHE_BYPASS=true forces fresh calls.
+if os.getenv('RESPONSE_CACHE_PATH'):
+    _response_cache_backend = DiskBackend(os.getenv('RESPONSE_CACHE_PATH'), int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(100 * 1024 * 1024))))
+else:
+    _response_cache_backend = MemoryBackend()
+response_cache = ResponseCache(_response_cache_backend, bypass=os.getenv('RESPONSE_CACHE_BYPASS', 'false').lower() == 'true')
+
+# VALIDATION_MODE=structured asks the validation agent for a single json verdict (and rewrite) instead of
+# separate validate and rewrite calls, falling back to the separate calls if the reply doesn't parse
+structured_validation = os.getenv('VALIDATION_MODE', 'two-call') == 'structured'
+
+# REWRITE_MODE=patch asks agents for section-level edits that are applied locally,
+# instead of regenerating the whole document, falling back to a full rewrite if an edit doesn't apply
+patch_rewrites = os.getenv('REWRITE_MODE', 'full') == 'patch'
+
+# CHUNK_FANOUT=N polishes a document's sections concurrently, in up to N parts
+chunk_fanout = int(os.getenv('CHUNK_FANOUT', '0'))
+
+# rate limits agent calls per agent type and model, from requestsperminute/burst in the agent entity's data.
+# AGENT_DEFAULT_RPM applies to agents without a limit; 0 leaves them unlimited.
+agent_scheduler = AgentScheduler(default_rpm=float(os.getenv('AGENT_DEFAULT_RPM', '0')))
+
+# estimates each call's tokens and latency and reports them against the actual usage. with ADAPTIVE_MODELS=true
+# each call goes to the fastest of the models, limits and throughput listed under "models" in the agent entity's
+# data that fits, and a rewrite that fits none is split into sections; otherwise every call keeps the entity's
+# model. PROMPT_BUDGET_PATH keeps what the estimates learn from actual usage between runs.
+prompt_budget = PromptBudget(stats_path=os.getenv('PROMPT_BUDGET_PATH'))
+adaptive_models = os.getenv('ADAPTIVE_MODELS', 'false').lower() == 'true'
+
+# timing spans for every stage; TRACE_PATH and OTLP_ENDPOINT choose where they are exported
+tracer.exporters = exporters_from_env()
+
+# SPECULATIVE_POLISH=true starts polishing the draft while it is still being validated
+speculative_polish = os.getenv('SPECULATIVE_POLISH', 'false').lower() == 'true'
+
+# stream agent responses, writing output files as the text arrives
+stream_responses = os.getenv('AGENTCORE_STREAM', 'false').lower() == 'true'
+
+# AGENTCORE_BATCH=true sends small calls to the same agent, system prompt and model made within
+# AGENTCORE_BATCH_WINDOW_MS of each other as one request, of up to AGENTCORE_BATCH_TOKENS estimated prompt
+# tokens and AGENTCORE_BATCH_DOCUMENTS documents, which the agent works through side by side.
+# prompts over AGENTCORE_BATCH_MAX_DOCUMENT_TOKENS and streamed calls are always sent on their own.
+if os.getenv('AGENTCORE_BATCH', 'false').lower() == 'true':
+    agent_batcher = AgentBatcher(
+        token_budget=int(os.getenv('AGENTCORE_BATCH_TOKENS', str(DEFAULT_TOKEN_BUDGET))),
+        max_documents=int(os.getenv('AGENTCORE_BATCH_DOCUMENTS', str(DEFAULT_MAX_DOCUMENTS))),
+        max_document_tokens=int(os.getenv('AGENTCORE_BATCH_MAX_DOCUMENT_TOKENS', str(DEFAULT_MAX_DOCUMENT_TOKENS))),
+        window_seconds=float(os.getenv('AGENTCORE_BATCH_WINDOW_MS', str(DEFAULT_WINDOW_SECONDS * 1000))) / 1000
+    )
+else:
+    agent_batcher = None
+
+# the async clients live on one background event loop, created on first use, so the
+# synchronous handle_* wrappers share their connection pools across stages and threads
+_event_loop = None
+_async_transport = None
+_async_entity_manager = None
+
+
+def configure_pool(pool_size):
+    """
+    Resize the agent connection pools, e.g. to match the number of calls a batch keeps in flight.
+    Call it from synchronous code between runs: the current transport's connections are closed.
+    """
+    global agentcore_pool_size, _async_transport
+    agentcore_pool_size = pool_size
+    # picked up the next time the async transport is created
+    old_transport, _async_transport = _async_transport, None
+    if old_transport is not None and _event_loop is not None:
+        # close it on the loop its connections were opened on
+        run_async(old_transport.aclose())
+
+
+def run_async(coro):
+    """
+    Run a coroutine on the shared background event loop and return its result
+    """
+    global _event_loop
+    if _event_loop is None:
+        _event_loop = EventLoopThread()
+    return _event_loop.run(coro)
+
+
+def get_async_transport():
+    global _async_transport
+    if _async_transport is None:
+        _async_transport = AsyncAgentCoreTransport(pool_size=agentcore_pool_size, endpoint=agentcore_endpoint,
+                                                   region_endpoints=agentcore_region_endpoints)
+    return _async_transport
+
+
+def get_async_entity_manager():
+    global _async_entity_manager
+    if _async_entity_manager is None:
+        if not fusionauth_api_key or not fusionauth_base_url or not supervisor_entity_id:
+            raise AgentConfigError("FUSIONAUTH_API_KEY, SUPERVISOR_ENTITY_ID, and FUSIONAUTH_BASE_URL must be set in .env file")
+        _async_entity_manager = AsyncFusionAuthEntityManager(fusionauth_api_key, fusionauth_base_url, token_cache, guard=fusionauth_guard)
+    return _async_entity_manager
+
+
+async def get_agent_async(entity_agenttype):
+    """
+    Return the AgentConfig for an agent type from the registry. Raises AgentConfigError if there is none.
+    """
+    agent = await agent_registry.get_async(entity_agenttype, get_async_entity_manager().search_agents)
+
+    if agent is None or agent.client_id is None or agent.system_prompt is None:
+        # model has a default
+        raise AgentConfigError(f"Failed to obtain target client id or system prompt for {entity_agenttype}")
+    return agent
+
+
+async def get_config_async(entity_agenttype):
+    """
+    Return (access_token, system_prompt, model, agentarn) for an agent type. Raises AgentConfigError,
+    or a FusionAuthError subclass when FusionAuth can't be reached, so callers can carry on with other work.
+    """
+    global _supervisor_credentials
+    entity_manager = get_async_entity_manager()
+
+    if _supervisor_credentials is None:
+        # concurrent stages starting together should share one lookup
+        async with _supervisor_lock:
+            if _supervisor_credentials is None:
+                supervisor_client_id, supervisor_client_secret = await entity_manager.retrieve_entity_by_id(supervisor_entity_id)
+                if supervisor_client_id is None or supervisor_client_secret is None:
+                    raise AgentConfigError("Failed to retrieve client credentials from entity by ID")
+                _supervisor_credentials = (supervisor_client_id, supervisor_client_secret)
+    supervisor_client_id, supervisor_client_secret = _supervisor_credentials
+
+    agent = await get_agent_async(entity_agenttype)
+
+    access_token = await entity_manager.perform_client_credentials_grant(
+            supervisor_client_id,
+            supervisor_client_secret,
+            scope='target-entity:'+agent.client_id+':invoke'
+        )
+
+    if access_token is None:
+        raise AgentConfigError("Failed to obtain access token")
+    return access_token, agent.system_prompt, agent.model, agent.agentarn
+
+
+async def invoke_agent_cached(agent_type, agent_arn, region, system_prompt, prompt, content, session_uuid, access_token, model, transport, doc_tools_enabled=False, on_chunk=None, *, shape, accept=None):
+    """
+    invoke_agent_async, returning the stored response instead when the same inputs were seen before.
+    region is used for an agent ARN that doesn't name its region; agents with runtimes in several
+    regions are routed between them by region_router. shape is the OutputShape the prompt budget
+    expects the call to produce. A response accept returns False for, such as a structured reply
+    that doesn't parse, is returned but never stored or served from the cache.
+    """
+    agent = await get_agent_async(agent_type)
+    plan = prompt_budget.plan(agent.data, model, system_prompt, prompt, content, shape, adaptive_models)
+    if not plan.fits:
+        if adaptive_models and shape.chunkable and prompt.endswith(content) and len(split_sections(content)) > 1:
+            return await invoke_in_sections(plan, agent_type, agent_arn, region, system_prompt, prompt, content, access_token, model, transport, doc_tools_enabled, on_chunk)
+        print(f"{shape.kind} call of about {plan.input_tokens} input and {plan.output_tokens} output tokens may not fit {plan.model}")
+    model = plan.model
+
+    key = response_cache_key(agent_type, model, system_prompt, prompt, content)
+    result = response_cache.get(key)
+    if result is not None and (accept is None or accept(result)):
+        if on_chunk is not None:
+            on_chunk(result)
+        return result
 
-    # Set up headers
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "X-Amzn-Trace-Id": str(trace_uuid), 
-        "Content-Type": "application/json",
-        "X-Amzn-Bedrock-AgentCore-Runtime-Session-Id": str(session_uuid)
-    }
+    routes = agent_routes(agent_arn, agent.data, region)
+    if not routes:
+        raise AgentConfigError(f"{agent_type} has no agentarn or agentarns in its entity data")
+
+    if agent_batcher is not None and on_chunk is None and agent_batcher.accepts(prompt):
+        async def send_batch(documents):
+            return await invoke_batch_routed(agent_type, agent, region, routes, system_prompt, documents, access_token, model, transport, doc_tools_enabled)
+        batched = await agent_batcher.submit((agent_type, model, system_prompt, doc_tools_enabled), prompt, send_batch)
+        result = batched.text if batched else None
+        if result:
+            # the request's time is shared by the whole batch, so only the document's tokens are learned from
+            prompt_budget.record(plan, batched.usage, None)
+        if result and (accept is None or accept(result)):
+            response_cache.put(key, result)
+        return result
 
-    invoke_response = requests.post(
-        url,
-        headers=headers,
-        data=json.dumps({"system_prompt": system_prompt, "prompt": prompt, "model": model, doc_tools_enabled: doc_tools_enabled})
-    )
+    waited = await agent_scheduler.acquire(agent_type, model, agent.data)
+    tracer.record('scheduler.wait', waited)
+    bucket = agent_scheduler.bucket(agent_type, model)
+    retry = retry_acquirer(agent_type, model, agent.data)
+
+    observed = {}
+
+    async def invoke_in_region(route_region, route_arn, route_on_chunk):
+        async def send(token):
+            await retry()
+            start = time.perf_counter()
+
+            def on_usage(usage):
+                observed.update(usage=usage, seconds=time.perf_counter() - start)
+            return await invoke_agent_async(route_arn, route_region, system_prompt, prompt, content, session_uuid, token, model, transport, doc_tools_enabled, route_on_chunk, bucket.throttled, on_usage)
+        return await with_renewed_token(agent_type, access_token, send)
+
+    result = await invoke_routed(agent_type, region, (agent_type, on_chunk is not None), routes, invoke_in_region, on_chunk)
+    if result:
+        bucket.succeeded()
+        prompt_budget.record(plan, observed.get('usage'), observed.get('seconds'))
+    if result and (accept is None or accept(result)):
+        response_cache.put(key, result)
+    return result
+
+
+async def invoke_routed(agent_type, region, kind, routes, call, on_chunk=None):
+    """
+    region_router.invoke, except that when AgentCore no longer has a runtime the agent registry
+    is reloaded, since its ARN was probably replaced (updatearn.py, provision.py), and the call
+    is tried once more against the agent's current runtimes
+    """
+    try:
+        return await region_router.invoke(kind, routes, call, on_chunk)
+    except AgentRuntimeNotFound as e:
+        agent_registry.invalidate()
+        agent = await get_agent_async(agent_type)
+        current = agent_routes(agent.agentarn, agent.data, region)
+        if not current or current == routes:
+            raise
+        print(f"{e}, retrying with {agent_type}'s current runtime")
+        return await region_router.invoke(kind, current, call, on_chunk)
+
+
+async def with_renewed_token(agent_type, access_token, send):
+    """
+    Await send(access_token). When AgentCore rejects the token, e.g. because FusionAuth rotated its
+    keys, it is dropped from the token cache and send is awaited once more with a newly granted one
+    """
+    try:
+        return await send(access_token)
+    except AgentTokenRejected as e:
+        token_cache.discard(access_token)
+        renewed, _, _, _ = await get_config_async(agent_type)
+        if renewed == access_token:
+            raise
+        print(f"{e}, retrying with a new token")
+        return await send(renewed)
+
+
+def retry_acquirer(agent_type, model, data):
+    """
+    A coroutine function to await before each attempt region_router makes. The first attempt's slot
+    is acquired before routing, so its wait isn't counted as region latency; hedges and failovers
+    are requests to the agent too, so each waits for a slot of its own.
+    """
+    attempts = 0
+
+    async def acquire():
+        nonlocal attempts
+        attempts += 1
+        if attempts > 1:
+            tracer.record('scheduler.wait', await agent_scheduler.acquire(agent_type, model, data))
+    return acquire
+
+
+async def invoke_in_sections(plan, agent_type, agent_arn, region, system_prompt, prompt, content, access_token, model, transport, doc_tools_enabled=False, on_chunk=None):
+    """
+    Send a rewrite that fits none of the agent's models as plan.chunks sections, each budgeted on its own
+    """
+    print(f"{plan.kind} call of about {plan.input_tokens} input and {plan.output_tokens} output tokens fits none of {agent_type}'s models, "
+          f"sending it in {plan.chunks} sections")
+
+    async def invoke_chunk(chunk_prompt, chunk):
+        return await invoke_agent_cached(agent_type, agent_arn, region, system_prompt, chunk_prompt, chunk, uuid.uuid4(), access_token, model, transport, doc_tools_enabled, shape=SECTION_SHAPE)
+
+    instructions = prompt[:len(prompt) - len(content)].strip() + ' '
+    result, problems = await process_in_sections(content, instructions, invoke_chunk, plan.chunks)
+    for problem in problems:
+        print(f"{plan.kind} section: {problem}")
+    if on_chunk is not None:
+        on_chunk(result)
+    return result
+
+
+async def invoke_batch_routed(agent_type, agent, region, routes, system_prompt, documents, access_token, model, transport, doc_tools_enabled=False):
+    """
+    Send one batch from agent_batcher as a single rate limited, region routed request in a runtime session of its own
+    """
+    waited = await agent_scheduler.acquire(agent_type, model, agent.data)
+    tracer.record('scheduler.wait', waited)
+    bucket = agent_scheduler.bucket(agent_type, model)
+    retry = retry_acquirer(agent_type, model, agent.data)
+    session_uuid = uuid.uuid4()
 
-    # Print response in a safe manner
-    #print(f"Status Code: {invoke_response.status_code}")
-    #print(f"Response Headers: {dict(invoke_response.headers)}")
-    
-    # Handle response based on status code
-    if invoke_response.status_code == 200:
-        response_data = invoke_response.json()
-        # print("Response JSON:")
-        # print(json.dumps(response_data, indent=2))  
-        result = response_data.get("result", {}).get("content", [{}])[0].get("text", "")
+    async def invoke_in_region(route_region, route_arn, _):
+        async def send(token):
+            await retry()
+            return await invoke_agent_batch_async(route_arn, route_region, system_prompt, documents, session_uuid, token, model, transport, doc_tools_enabled, bucket.throttled)
+        return await with_renewed_token(agent_type, access_token, send)
+
+    # batches take longer than single calls, so their latency is tracked separately for hedging
+    results = await invoke_routed(agent_type, region, (agent_type, 'batch'), routes, invoke_in_region)
+    if results:
+        bucket.succeeded()
+    return results
+
+
+def read_document(path):
+    with tracer.span('file.read', path=os.path.basename(path)) as span:
+        with open(path, 'r') as file:
+            content = file.read()
+        span.set(chars=len(content))
+    return content
+
+
+def write_document(path, content):
+    with tracer.span('file.write', path=os.path.basename(path), chars=len(content)):
+        with open(path, 'w') as file:
+            file.write(content)
+
+
+def traced_stage(stage):
+    """
+    Run a stage handler inside a span; every span recorded while it runs is attributed to the stage
+    """
+    def decorate(handler):
+        @functools.wraps(handler)
+        async def run(*args, **kwargs):
+            with tracer.span('stage', stage=stage):
+                return await handler(*args, **kwargs)
+        return run
+    return decorate
+
+
+async def invoke_agent_to_file(path, agent_type, *args, **kwargs):
+    """
+    Invoke an agent and write its response to path. When streaming, chunks are written as they arrive.
+    """
+    if not stream_responses:
+        result = await invoke_agent_cached(agent_type, *args, **kwargs)
+        if result:
+            write_document(path, result)
         return result
-    elif invoke_response.status_code >= 400:
-        print(f"Error Response ({invoke_response.status_code}):")
-        error_data = invoke_response.json()
-        print(json.dumps(error_data, indent=2))
-    else:
-        print(f"Unexpected status code: {invoke_response.status_code}")
-        print("Response text:")
-        print(invoke_response.text[:500])
-
-
-def get_config(entity_agenttype):
-   api_key = os.getenv('FUSIONAUTH_API_KEY')
-   base_url = os.getenv('FUSIONAUTH_BASE_URL')
-   supervisor_entity_id = os.getenv('SUPERVISOR_ENTITY_ID')
-   
-   if not api_key or not base_url or not supervisor_entity_id:
-       print("Error: FUSIONAUTH_API_KEY, SUPERVISOR_ENTITY_ID, and FUSIONAUTH_BASE_URL must be set in .env file")
-       exit(1)
-   
-   entity_manager = FusionAuthEntityManager(api_key, base_url)
-   
-   supervisor_client_id, supervisor_client_secret = entity_manager.retrieve_entity_by_id(supervisor_entity_id)
-   
-   if supervisor_client_id is None or supervisor_client_secret is None:
-       print("Failed to retrieve client credentials from entity by ID")
-       exit(1)
-   
-   client_id, system_prompt, model, agentarn = entity_manager.find_entity_by_agenttype(entity_agenttype)
-   
-   if client_id is None or system_prompt is None:
-       # model has a default
-       print("Failed to obtain target client id or system prompt")
-       exit(1)
-   
-   access_token = entity_manager.perform_client_credentials_grant(
-           supervisor_client_id, 
-           supervisor_client_secret, 
-           scope='target-entity:'+client_id+':invoke'
-       )
-       
-   if access_token is None:
-       print("Failed to obtain access token")
-       exit(1)
-   return access_token, system_prompt, model, agentarn
-
-def handle_validation():
+
+    write_seconds = 0.0
+    with open(path, 'w') as file:
+        def write_chunk(chunk):
+            nonlocal write_seconds
+            start = time.perf_counter()
+            file.write(chunk)
+            file.flush()
+            write_seconds += time.perf_counter() - start
+        result = await invoke_agent_cached(agent_type, *args, on_chunk=write_chunk, **kwargs)
+    # the chunk writes are spread across the generation, so they are recorded as one span of their total time
+    tracer.record('file.write', write_seconds, path=os.path.basename(path), chars=len(result) if result else 0, streamed=True)
+    if not result:
+        # don't leave a partial response behind for the next stage to pick up
+        os.remove(path)
+    return result
+
+
+def print_patch_failures(failures):
+    print(f"{len(failures)} edits did not apply cleanly, falling back to a full rewrite:")
+    for failure in failures:
+        print(f"  - {failure}")
+
+
+@traced_stage('validate')
+async def handle_validation_async(directory='.', content=None):
     validate_content_entity_type = 'validatecontent'
 
-    access_token, validate_content_system_prompt, model, invoke_agent_arn = get_config(validate_content_entity_type)
+    access_token, validate_content_system_prompt, model, invoke_agent_arn = await get_config_async(validate_content_entity_type)
 
-    content = "this is a blog post placeholder"
-    with open('drafted.md', 'r') as file:
-        content = file.read()
-        #print(content)
+    if content is None:
+        content = read_document(os.path.join(directory, 'drafted.md'))
 
-    validate_check_prompt = "please validate this blog post from a technical point of view. please return the single string 'valid' if it is a valid blog post, or the single string 'invalid' if there are any technical errors or inconsistencies that would require rewriting. Please do not return any other text. ignore any typos or grammar errors in your evaluation.\n\n"+content
+    validate_check_prompt = VALIDATE_CHECK_PROMPT+content
 
-    rewrite_prompt = "please validate this blog post from a technical point of view. if it has incorrect statements, please rewrite it. Please return only the content, no preface or other commentary.\n\n"+content
+    rewrite_prompt = REWRITE_PROMPT+content
 
     session_uuid = uuid.uuid4()
+    transport = get_async_transport()
+    doc_tools_enabled = True
+
+    if structured_validation:
+        structured_prompt, structured_shape = (STRUCTURED_VALIDATE_PATCH_PROMPT, VALIDATE_EDITS_SHAPE) if patch_rewrites else (STRUCTURED_VALIDATE_PROMPT, VALIDATE_SHAPE)
+        structured_reply = await invoke_agent_cached(validate_content_entity_type, invoke_agent_arn, default_region, validate_content_system_prompt, structured_prompt+content, content, session_uuid, access_token, model, transport, doc_tools_enabled, shape=structured_shape,
+                                                     accept=lambda reply: parse_validation_result(reply) is not None)
+        if not structured_reply:
+            # the agent never answered, asking again in two separate calls would only fail the same way
+            print("validation agent did not reply")
+            return None
+        validation = parse_validation_result(structured_reply)
+        if validation is not None:
+            if validation.verdict == 'valid':
+                print("content looks valid")
+                result_content = content
+            else:
+                print(f"blog post had {len(validation.issues)} invalid claims:")
+                for issue in validation.issues:
+                    print(f"  - {issue}")
+                result_content = validation.corrected_content
+                if validation.edits:
+                    result_content, failures = apply_edits(content, validation.edits)
+                    if failures:
+                        print_patch_failures(failures)
+                        return await invoke_agent_to_file(os.path.join(directory, 'validated.md'), validate_content_entity_type, invoke_agent_arn, default_region, validate_content_system_prompt, rewrite_prompt, content, session_uuid, access_token, model, transport, doc_tools_enabled, shape=REWRITE_SHAPE)
+            write_document(os.path.join(directory, 'validated.md'), result_content)
+            return result_content
+        print("could not parse the structured validation result, falling back to separate validate and rewrite calls")
 
     # first validate the blog post, then rewrite if needed
     result_content = ""
-    doc_tools_enabled = True
-    validate_result = invoke_agent(invoke_agent_arn, REGION_NAME, validate_content_system_prompt, validate_check_prompt, content, session_uuid, access_token, model, doc_tools_enabled)
+    validate_result = await invoke_agent_cached(validate_content_entity_type, invoke_agent_arn, default_region, validate_content_system_prompt, validate_check_prompt, content, session_uuid, access_token, model, transport, doc_tools_enabled, shape=VALIDATE_CHECK_SHAPE)
+    if not validate_result:
+        print("validation agent did not reply")
+        return None
     if validate_result != "valid":
         print("blog post had some invalid claims")
-        rewrite_result = invoke_agent(invoke_agent_arn, REGION_NAME, validate_content_system_prompt, rewrite_prompt, content, session_uuid, access_token, model, doc_tools_enabled)
-        result_content = rewrite_result
-    else: 
+        result_content = await invoke_agent_to_file(os.path.join(directory, 'validated.md'), validate_content_entity_type, invoke_agent_arn, default_region, validate_content_system_prompt, rewrite_prompt, content, session_uuid, access_token, model, transport, doc_tools_enabled, shape=REWRITE_SHAPE)
+    else:
         print("content looks valid")
         result_content = content
-
-    if result_content:
-        with open('validated.md', 'w') as file:
-            file.write(result_content)
+        write_document(os.path.join(directory, 'validated.md'), result_content)
+    return result_content
 
 
-def handle_polishing():
+@traced_stage('polish')
+async def handle_polishing_async(directory='.', content=None, output_name='polished.md'):
     polish_content_entity_type = 'polishcontent'
 
-    access_token, polish_content_system_prompt, model, invoke_agent_arn = get_config(polish_content_entity_type)
+    access_token, polish_content_system_prompt, model, invoke_agent_arn = await get_config_async(polish_content_entity_type)
 
-    with open('validated.md', 'r') as file:
-        content = file.read()
-        #print(content)
+    if content is None:
+        content = read_document(os.path.join(directory, 'validated.md'))
 
-    polish_prompt = "please polish this content to make sure it meets with the voice and content guidelines that FusionAuth upholds. You can find those here: https://github.com/FusionAuth/fusionauth-site/blob/main/DocsDevREADME.md . Please return just the content, not the outline or any other commentary.\n\n"+content
+    polish_prompt = POLISH_PROMPT+content
 
     session_uuid = uuid.uuid4()
 
-    polished_result = invoke_agent(invoke_agent_arn, REGION_NAME, polish_content_system_prompt, polish_prompt, content, session_uuid, access_token, model)
-    if polished_result:
-        with open('polished.md', 'w') as file:
-           file.write(polished_result)
-
-def handle_drafting():
+    if chunk_fanout > 1 and len(split_sections(content)) > 1:
+        transport = get_async_transport()
+
+        async def polish_chunk(prompt, chunk):
+            # each part gets its own runtime session so they can run side by side
+            return await invoke_agent_cached(polish_content_entity_type, invoke_agent_arn, default_region, polish_content_system_prompt, prompt, chunk, uuid.uuid4(), access_token, model, transport, shape=SECTION_SHAPE)
+
+        polished_result, problems = await process_in_sections(content, POLISH_SECTION_INSTRUCTIONS, polish_chunk, chunk_fanout)
+        for problem in problems:
+            print(f"section polish: {problem}")
+        write_document(os.path.join(directory, output_name), polished_result)
+        return polished_result
+
+    if patch_rewrites:
+        patch_reply = await invoke_agent_cached(polish_content_entity_type, invoke_agent_arn, default_region, polish_content_system_prompt, PATCH_POLISH_PROMPT+content, content, session_uuid, access_token, model, get_async_transport(), shape=POLISH_EDITS_SHAPE,
+                                                accept=lambda reply: parse_edits(reply) is not None)
+        edits = parse_edits(patch_reply) if patch_reply else None
+        if edits is not None:
+            polished_result, failures = apply_edits(content, edits)
+            if not failures:
+                write_document(os.path.join(directory, output_name), polished_result)
+                return polished_result
+            print_patch_failures(failures)
+        else:
+            print("could not parse the polish edits, falling back to a full polish")
+
+    return await invoke_agent_to_file(os.path.join(directory, output_name), polish_content_entity_type, invoke_agent_arn, default_region, polish_content_system_prompt, polish_prompt, content, session_uuid, access_token, model, get_async_transport(), shape=POLISH_SHAPE)
+
+
+@traced_stage('draft')
+async def handle_drafting_async(directory='.'):
     draft_content_entity_type = 'draftcontent'
 
-    access_token, draft_content_system_prompt, model, invoke_agent_arn = get_config(draft_content_entity_type)
+    access_token, draft_content_system_prompt, model, invoke_agent_arn = await get_config_async(draft_content_entity_type)
 
-    with open('outline.md', 'r') as file:
-        content = file.read()
+    content = read_document(os.path.join(directory, 'outline.md'))
 
-    write_prompt = "please write a blog post based on the following outline. Target 1500-3000 words. Please mimic the style found on https://fusionauth.io/blog, which is friendly and precise. The audience is engineering leaders. Please return just the content, not the outline or any other commentary.\n\n"+content
+    write_prompt = DRAFT_PROMPT+content
 
     session_uuid = uuid.uuid4()
 
-    draft_result = invoke_agent(invoke_agent_arn, REGION_NAME, draft_content_system_prompt, write_prompt, content, session_uuid, access_token, model)
-    if draft_result:
-        with open('drafted.md', 'w') as file:
-            file.write(draft_result)
+    return await invoke_agent_to_file(os.path.join(directory, 'drafted.md'), draft_content_entity_type, invoke_agent_arn, default_region, draft_content_system_prompt, write_prompt, content, session_uuid, access_token, model, get_async_transport(), shape=DRAFT_SHAPE)
+
+
+async def run_pipeline_async(directory='.'):
+    """
+    Draft, validate and polish one document, handing each stage's output straight to the next
+    """
+    with tracer.span('pipeline', directory=directory):
+        drafted = await handle_drafting_async(directory)
+        if not drafted:
+            return None
+        validated = await handle_validation_async(directory, drafted)
+        if not validated:
+            return None
+        return await handle_polishing_async(directory, validated)
+
+
+def run_stage(stage_coroutine):
+    """
+    Run a stage on the shared event loop, exiting when the agent config can't be loaded
+    """
+    try:
+        return run_async(stage_coroutine)
+    except (AgentConfigError, FileNotFoundError) as e:
+        print(e)
+        exit(1)
+
+def handle_validation(directory='.'):
+    return run_stage(handle_validation_async(directory))
+
+def handle_polishing(directory='.'):
+    return run_stage(handle_polishing_async(directory))
+
+def handle_drafting(directory='.'):
+    return run_stage(handle_drafting_async(directory))
 
-def main():
-   handle_drafting()
-   handle_validation()
-   handle_polishing()
 
 if __name__ == "__main__":
-    main()
+    # the command line lives in incremental.py. it imports this module as invoke, so register
+    # this run under that name first; otherwise a second copy with its own clients is loaded
+    sys.modules['invoke'] = sys.modules[__name__]
+    import incremental
+    incremental.main()
@@ -0,0 +1,60 @@
+import json
+import re
+from collections import namedtuple
+
+Edit = namedtuple('Edit', ['anchor', 'replacement'])
+
+# models sometimes wrap json in a markdown code fence despite being asked not to
+FENCE_PATTERN = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL)
+
+
+def strip_code_fence(text):
+    text = text.strip()
+    match = FENCE_PATTERN.match(text)
+    return match.group(1) if match else text
+
+
+def parse_edits(value):
+    """
+    Turn a list of {"anchor": ..., "replacement": ...} objects (or the json text of one)
+    into Edits. Returns None if the shape is wrong.
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(strip_code_fence(value))
+        except ValueError:
+            return None
+    if isinstance(value, dict):
+        value = value.get('edits')
+    if not isinstance(value, list):
+        return None
+
+    edits = []
+    for item in value:
+        if not isinstance(item, dict):
+            return None
+        anchor = item.get('anchor')
+        replacement = item.get('replacement')
+        if not isinstance(anchor, str) or not anchor or not isinstance(replacement, str):
+            return None
+        edits.append(Edit(anchor, replacement))
+    return edits
+
+
+def apply_edits(document, edits):
+    """
+    Apply edits in order. Each anchor must appear exactly once in the document as it
+    stands when the edit is applied.
+
+    Returns (patched_document, failures) where failures describes every edit that did
+    not apply cleanly. The document is only usable when failures is empty.
+    """
+    failures = []
+    for index, edit in enumerate(edits):
+        count = document.count(edit.anchor)
+        if count != 1:
+            preview = edit.anchor[:60].replace('\n', ' ')
+            failures.append(f"edit {index + 1}: anchor found {count} times: {preview!r}")
+            continue
+        document = document.replace(edit.anchor, edit.replacement, 1)
+    return document, failures
@@ -0,0 +1,10 @@
+# stage prompts; the document being worked on is appended to each
+DRAFT_PROMPT = "please write a blog post based on the following outline. Target 1500-3000 words. Please mimic the style found on https://fusionauth.io/blog, which is friendly and precise. The audience is engineering leaders. Please return just the content, not the outline or any other commentary.\n\n"
+VALIDATE_CHECK_PROMPT = "please validate this blog post from a technical point of view. please return the single string 'valid' if it is a valid blog post, or the single string 'invalid' if there are any technical errors or inconsistencies that would require rewriting. Please do not return any other text. ignore any typos or grammar errors in your evaluation.\n\n"
+REWRITE_PROMPT = "please validate this blog post from a technical point of view. if it has incorrect statements, please rewrite it. Please return only the content, no preface or other commentary.\n\n"
+STRUCTURED_VALIDATE_PROMPT = "please validate this blog post from a technical point of view. ignore any typos or grammar errors in your evaluation. respond with only a json object, no code fence or other text, with these fields: \"verdict\": the string \"valid\" if there are no technical errors or inconsistencies, otherwise \"invalid\"; \"issues\": a list of strings, one per technical problem found (empty if valid); \"corrected_content\": if the verdict is \"invalid\", the full blog post rewritten to fix the problems, otherwise null.\n\n"
+PATCH_INSTRUCTIONS = "each edit is a json object with \"anchor\": the exact, complete text of one paragraph or section of the post to replace, copied character for character, and \"replacement\": the new text for it. only include edits for the parts that need to change."
+STRUCTURED_VALIDATE_PATCH_PROMPT = "please validate this blog post from a technical point of view. ignore any typos or grammar errors in your evaluation. respond with only a json object, no code fence or other text, with these fields: \"verdict\": the string \"valid\" if there are no technical errors or inconsistencies, otherwise \"invalid\"; \"issues\": a list of strings, one per technical problem found (empty if valid); \"edits\": if the verdict is \"invalid\", a list of edits that fix the problems, otherwise an empty list. "+PATCH_INSTRUCTIONS+"\n\n"
+PATCH_POLISH_PROMPT = "please polish this content to make sure it meets with the voice and content guidelines that FusionAuth upholds. You can find those here: https://github.com/FusionAuth/fusionauth-site/blob/main/DocsDevREADME.md . respond with only a json object, no code fence or other text, with a single field \"edits\": a list of edits. "+PATCH_INSTRUCTIONS+"\n\n"
+POLISH_SECTION_INSTRUCTIONS = "please polish it to make sure it meets with the voice and content guidelines that FusionAuth upholds. You can find those here: https://github.com/FusionAuth/fusionauth-site/blob/main/DocsDevREADME.md . "
+POLISH_PROMPT = "please polish this content to make sure it meets with the voice and content guidelines that FusionAuth upholds. You can find those here: https://github.com/FusionAuth/fusionauth-site/blob/main/DocsDevREADME.md . Please return just the content, not the outline or any other commentary.\n\n"
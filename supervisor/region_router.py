@@ -0,0 +1,252 @@
+import asyncio
+import statistics
+import time
+from collections import Counter, deque
+
+from tracing import percentile, tracer
+
+DEFAULT_WINDOW = 50
+# latency samples a region needs before its own p95 sets the hedge delay
+DEFAULT_MIN_SAMPLES = 5
+DEFAULT_HEDGE_PERCENTILE = 0.95
+# consecutive failures before a region is tried last, and for how long
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN_SECONDS = 30
+# every Nth call of a kind goes to the least measured other region first, so a region that
+# has become faster is noticed; hedging bounds what a probe of a slow region costs
+DEFAULT_PROBE_EVERY = 10
+
+
+def arn_region(arn):
+    """
+    The region of an AgentCore runtime ARN (arn:aws:bedrock-agentcore:<region>:<account>:runtime/<id>), or None
+    """
+    parts = (arn or '').split(':')
+    return parts[3] if len(parts) > 5 and parts[0] == 'arn' and parts[3] else None
+
+
+def agent_routes(agentarn, data, default_region):
+    """
+    [(region, arn)] for every runtime an agent has, primary first. agentarns in the
+    entity data maps region to ARN; agents with only agentarn get a single route.
+    """
+    routes = []
+    if agentarn:
+        routes.append((arn_region(agentarn) or default_region, agentarn))
+    for region, arn in ((data or {}).get('agentarns') or {}).items():
+        if arn != agentarn and region not in (route[0] for route in routes):
+            routes.append((region, arn))
+    return routes
+
+
+def parse_region_endpoints(value):
+    """
+    Parse "us-west-2=http://host:port,us-east-1=http://host:port" into a dict of endpoint overrides per region
+    """
+    endpoints = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            region, endpoint = item.split('=', 1)
+            endpoints[region.strip()] = endpoint.strip()
+    return endpoints
+
+
+class RegionStats:
+    """
+    Rolling latency window and health of one region for one kind of call
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0
+
+    def succeeded(self, latency):
+        self.latencies.append(latency)
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0
+
+    def failed(self, threshold, cooldown):
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= threshold:
+            self.unhealthy_until = time.monotonic() + cooldown
+
+    def healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+
+    def median(self):
+        return statistics.median(self.latencies) if self.latencies else None
+
+    def percentile(self, fraction):
+        return percentile(sorted(self.latencies), fraction)
+
+
+class RegionRouter:
+    """
+    Sends each agent invocation to the healthiest, lowest-latency region the agent runs in.
+
+    Latency is tracked per region and per kind of call (agent type, and whether the
+    response is streamed, where it is the time to the first chunk). Healthy regions are
+    tried in order of their rolling median, and regions without samples yet keep the
+    entity's order after them; every probe_every-th call tries the least measured other
+    region first. A region that fails failure_threshold times in a row is tried last for
+    cooldown seconds.
+
+    When the chosen region has not answered by the hedge_percentile latency of the fastest
+    region with min_samples (or after hedge_seconds until there is one), the call is hedged
+    to the next region and whichever answers first is used; a streamed call commits to the
+    first region that sends text. A region that fails is failed over to the next one
+    straight away.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, min_samples=DEFAULT_MIN_SAMPLES, hedge_percentile=DEFAULT_HEDGE_PERCENTILE,
+                 hedge_seconds=None, max_hedges=1, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 cooldown=DEFAULT_COOLDOWN_SECONDS, probe_every=DEFAULT_PROBE_EVERY):
+        self.window = window
+        self.min_samples = min_samples
+        self.hedge_percentile = hedge_percentile
+        self.hedge_seconds = hedge_seconds
+        self.max_hedges = max_hedges
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.probe_every = probe_every
+        self._stats = {}
+        self._kind_calls = Counter()
+        self.calls = Counter()
+        self.wins = Counter()
+        self.hedges = 0
+        self.failovers = 0
+        self.probes = 0
+
+    def stats(self, kind, region):
+        key = (kind, region)
+        if key not in self._stats:
+            self._stats[key] = RegionStats(self.window)
+        return self._stats[key]
+
+    def order(self, kind, routes):
+        """
+        routes sorted best first, with the least measured healthy region moved to the front on probe calls
+        """
+        def rank(indexed_route):
+            index, (region, _) = indexed_route
+            stats = self.stats(kind, region)
+            median = stats.median()
+            return (not stats.healthy(), median is None, median or 0, index)
+        ordered = [route for _, route in sorted(enumerate(routes), key=rank)]
+
+        self._kind_calls[kind] += 1
+        if self.probe_every and len(ordered) > 1 and self._kind_calls[kind] % self.probe_every == 0:
+            candidates = [route for route in ordered[1:] if self.stats(kind, route[0]).healthy()]
+            if candidates:
+                probe = min(candidates, key=lambda route: len(self.stats(kind, route[0]).latencies))
+                ordered.remove(probe)
+                ordered.insert(0, probe)
+                self.probes += 1
+        return ordered
+
+    def hedge_delay(self, kind, routes):
+        """
+        Seconds to wait for a region before hedging: the hedge_percentile latency of the fastest measured healthy region
+        """
+        delays = [stats.percentile(self.hedge_percentile) for stats in (self.stats(kind, region) for region, _ in routes)
+                  if stats.healthy() and len(stats.latencies) >= self.min_samples]
+        return min(delays) if delays else self.hedge_seconds
+
+    async def invoke(self, kind, routes, call, on_chunk=None):
+        """
+        Run call(region, arn, on_chunk) against the best of routes, hedging and failing over
+        as described above, and return the first non-empty result. If every region fails the
+        last exception is raised, or None is returned when they only returned nothing.
+        """
+        if not routes:
+            raise ValueError(f"no runtime to invoke for {kind}")
+        ordered = self.order(kind, routes)
+        attempts = {}
+        started = {}
+        first_chunk = {}
+        committed = None
+        hedges = 0
+        error = None
+
+        def forward(region):
+            def on_region_chunk(chunk):
+                nonlocal committed
+                if committed is None:
+                    committed = region
+                    first_chunk[region] = time.perf_counter() - started[region]
+                    for attempt, attempt_region in attempts.items():
+                        if attempt_region != region:
+                            attempt.cancel()
+                if committed == region:
+                    on_chunk(chunk)
+            return on_region_chunk
+
+        def launch():
+            region, arn = ordered[len(started)]
+            started[region] = time.perf_counter()
+            self.calls[region] += 1
+            attempts[asyncio.ensure_future(call(region, arn, forward(region) if on_chunk else None))] = region
+
+        launch()
+        try:
+            while attempts:
+                timeout = None
+                latest = ordered[len(started) - 1][0]
+                delay = self.hedge_delay(kind, ordered)
+                if delay is not None and committed is None and hedges < self.max_hedges and len(started) < len(ordered):
+                    timeout = max(0, started[latest] + delay - time.perf_counter())
+                done, _ = await asyncio.wait(attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedges += 1
+                    self.hedges += 1
+                    tracer.record('agentcore.hedge', delay, slow_region=latest)
+                    launch()
+                    continue
+
+                for attempt in done:
+                    region = attempts.pop(attempt)
+                    if attempt.cancelled():
+                        continue
+                    try:
+                        result, attempt_error = attempt.result(), None
+                    except Exception as e:
+                        result, attempt_error = None, e
+                    if result:
+                        # only the winner's latency is known; a cancelled loser says nothing about how long it would have taken
+                        latency = first_chunk.get(region, time.perf_counter() - started[region])
+                        self.stats(kind, region).succeeded(latency)
+                        self.wins[region] += 1
+                        return result
+                    self.stats(kind, region).failed(self.failure_threshold, self.cooldown)
+                    error = attempt_error or error
+                    if region == committed:
+                        # its text has already been passed on, so another region can't take over
+                        if attempt_error is not None:
+                            raise attempt_error
+                        return None
+
+                if not attempts and len(started) < len(ordered):
+                    self.failovers += 1
+                    tracer.record('agentcore.failover', 0, failed_region=region)
+                    launch()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+            if attempts:
+                await asyncio.gather(*attempts, return_exceptions=True)
+
+        if error is not None:
+            raise error
+        return None
+
+    def metrics(self):
+        return {
+            "calls": dict(self.calls),
+            "wins": dict(self.wins),
+            "hedges": self.hedges,
+            "failovers": self.failovers,
+            "probes": self.probes,
+            "median_seconds": {f"{kind}/{region}": stats.median() for (kind, region), stats in self._stats.items()},
+        }
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from storage import atomic_write, evict_least_recently_used
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+
+
+def response_cache_key(agent_type, model, system_prompt, prompt, content):
+    """
+    Content hash of everything that determines an agent's response
+    """
+    material = json.dumps([agent_type, model, system_prompt, prompt, content], ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class MemoryBackend:
+    """
+    In-memory LRU holding at most max_entries responses
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class DiskBackend:
+    """
+    One file per response under directory, evicting the least recently used files once
+    the total size passes max_bytes
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                value = file.read()
+        except FileNotFoundError:
+            return None
+        # mtime doubles as the last-used time for eviction
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted by another process since it was read; a miss, like any evicted entry
+            return None
+        return value
+
+    def put(self, key, value):
+        atomic_write(self._path(key), value)
+        with self._lock:
+            evict_least_recently_used(self.directory, self.max_bytes)
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of agent responses, so unchanged stages are not re-invoked.
+
+    With bypass set, lookups always miss but fresh responses are still stored.
+    """
+
+    def __init__(self, backend, bypass=False):
+        self.backend = backend
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        if self.bypass:
+            self.misses += 1
+            return None
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if value:
+            self.backend.put(key, value)
+
+    def summary(self):
+        total = self.hits + self.misses
+        rate = self.hits / total * 100 if total else 0
+        return f"response cache: {self.hits} hits, {self.misses} misses ({rate:.0f}% hit rate)"
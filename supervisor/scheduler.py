@@ -0,0 +1,164 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from collections import deque
+
+INTERACTIVE = 0
+BATCH = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BATCH: 'batch'}
+
+# callers set this (e.g. the batch runner sets BATCH) and every invocation made from that context inherits it
+invocation_priority = contextvars.ContextVar('invocation_priority', default=INTERACTIVE)
+
+# on a 429 the rate is cut by this factor, and each success wins back this fraction of the configured rate
+THROTTLE_BACKOFF = 0.5
+RECOVERY_STEP = 0.05
+MIN_RATE_FRACTION = 0.05
+
+WAIT_SAMPLES = 1000
+
+
+class TokenBucket:
+    """
+    Token bucket whose waiters are served in priority order, then arrival order.
+
+    A rate of None means unlimited. The rate adapts to throttling: throttled() cuts it
+    and succeeded() slowly restores it to the configured rate. burst is at least 1, since
+    a bucket that can't hold a whole token never lets a call through.
+    """
+
+    def __init__(self, rate_per_second, burst):
+        self.configured_rate = rate_per_second
+        self.rate = rate_per_second
+        self.burst = max(1, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.throttles = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._dispatcher = None
+
+    def queue_depth(self):
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority=INTERACTIVE):
+        if self.rate is None:
+            return
+        self._refill()
+        if not self._waiters and self.tokens >= 1:
+            self.tokens -= 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    def throttled(self):
+        self.throttles += 1
+        if self.rate is None:
+            return
+        self.rate = max(self.configured_rate * MIN_RATE_FRACTION, self.rate * THROTTLE_BACKOFF)
+        self.tokens = 0
+
+    def succeeded(self):
+        if self.rate is None:
+            return
+        self.rate = min(self.configured_rate, self.rate + self.configured_rate * RECOVERY_STEP)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def _dispatch(self):
+        while self._waiters:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            # skip callers that gave up while queued
+            if not future.done():
+                self.tokens -= 1
+                future.set_result(None)
+
+
+class AgentScheduler:
+    """
+    Rate limits agent invocations with one token bucket per (agent type, model).
+
+    Limits come from the agent entity's data: requestsperminute and, optionally, burst.
+    Agents without a limit fall back to default_rpm, where 0 means unlimited. When the
+    data passed in sets different limits than the bucket was built with, the bucket is
+    rebuilt, so edits to the entity apply once the registry reloads it.
+    """
+
+    def __init__(self, default_rpm=0):
+        self.default_rpm = default_rpm
+        self.buckets = {}
+        self.limits = {}
+        self.waits = {}
+
+    def bucket(self, agent_type, model, data=None):
+        key = (agent_type, model)
+        if key in self.buckets and data is None:
+            return self.buckets[key]
+        limits = self.agent_limits(data or {})
+        if self.limits.get(key) != limits:
+            rpm, burst = limits
+            self.buckets[key] = TokenBucket(rpm / 60, burst) if rpm > 0 else TokenBucket(None, 0)
+            self.limits[key] = limits
+            self.waits.setdefault(key, deque(maxlen=WAIT_SAMPLES))
+        return self.buckets[key]
+
+    def agent_limits(self, data):
+        """
+        (requests per minute, burst) from an agent's entity data
+        """
+        rpm = float(data.get('requestsperminute') or self.default_rpm)
+        if rpm <= 0:
+            return 0, 0
+        return rpm, max(1, float(data.get('burst') or rpm / 60))
+
+    async def acquire(self, agent_type, model, data=None, priority=None):
+        """
+        Wait for a slot for this agent, returning the seconds spent waiting
+        """
+        bucket = self.bucket(agent_type, model, data)
+        priority = invocation_priority.get() if priority is None else priority
+        start = time.perf_counter()
+        await bucket.acquire(priority)
+        waited = time.perf_counter() - start
+        self.waits[(agent_type, model)].append(waited)
+        return waited
+
+    def metrics(self):
+        """
+        Queue depth, wait times and current rate for each agent
+        """
+        metrics = {}
+        for key, bucket in self.buckets.items():
+            waits = sorted(self.waits[key])
+            metrics[key] = {
+                'queue_depth': bucket.queue_depth(),
+                'requests': len(waits),
+                'mean_wait': sum(waits) / len(waits) if waits else 0,
+                'p95_wait': waits[int(len(waits) * 0.95) - 1] if waits else 0,
+                'max_wait': waits[-1] if waits else 0,
+                'rate_per_minute': bucket.rate * 60 if bucket.rate is not None else None,
+                'throttles': bucket.throttles,
+            }
+        return metrics
+
+    def summary(self):
+        lines = []
+        for (agent_type, model), metric in self.metrics().items():
+            rate = f"{metric['rate_per_minute']:.1f}/min" if metric['rate_per_minute'] is not None else "unlimited"
+            lines.append(f"{agent_type} ({model or 'default model'}): {metric['requests']} requests, "
+                         f"queue {metric['queue_depth']}, wait mean {metric['mean_wait']:.2f}s "
+                         f"p95 {metric['p95_wait']:.2f}s max {metric['max_wait']:.2f}s, "
+                         f"rate {rate}, {metric['throttles']} throttled")
+        return "\n".join(lines)
@@ -0,0 +1,111 @@
+import asyncio
+import re
+
+HEADING_PATTERN = re.compile(r"^#{1,6}\s")
+FENCE_PATTERN = re.compile(r"^(```|~~~)")
+
+DEFAULT_MAX_FANOUT = 4
+
+# added on the retry, which also keeps the retry from being answered out of the response cache
+SECTION_RETRY_NOTE = "a previous attempt at this part changed its first heading or included text from another part; make sure to avoid both. "
+
+SECTION_PREAMBLE = "this is part {index} of {count} of a longer markdown document. it is being processed in parts, so keep its headings exactly as they are, do not add an introduction or conclusion that is not already there, and do not add text from other parts. {instructions}Please return just this part, not any other commentary.\n\n"
+
+
+def split_sections(markdown):
+    """
+    Split markdown into sections, each starting at a heading. Headings inside code
+    fences are ignored. Text before the first heading is its own section.
+    """
+    sections = []
+    current = []
+    in_fence = False
+    for line in markdown.splitlines(keepends=True):
+        if FENCE_PATTERN.match(line):
+            in_fence = not in_fence
+        if not in_fence and HEADING_PATTERN.match(line) and current:
+            sections.append(''.join(current))
+            current = []
+        current.append(line)
+    if current:
+        sections.append(''.join(current))
+    return sections
+
+
+def group_sections(sections, max_fanout):
+    """
+    Join neighbouring sections into at most max_fanout chunks of roughly equal size
+    """
+    if len(sections) <= max_fanout:
+        return list(sections)
+    target = sum(len(section) for section in sections) / max_fanout
+    chunks = []
+    current = ''
+    for section in sections:
+        if current and len(current) >= target and len(chunks) < max_fanout - 1:
+            chunks.append(current)
+            current = ''
+        current += section
+    chunks.append(current)
+    return chunks
+
+
+def first_heading(text):
+    for line in text.splitlines():
+        if HEADING_PATTERN.match(line):
+            return line.strip()
+        if line.strip():
+            return None
+    return None
+
+
+def seam_problems(original, processed, next_original):
+    """
+    Check the edges of a processed chunk: it must keep its own leading heading and must
+    not run on into the heading that starts the next chunk
+    """
+    problems = []
+    if not processed or not processed.strip():
+        return ["came back empty"]
+    heading = first_heading(original)
+    if heading and first_heading(processed) != heading:
+        problems.append(f"lost its leading heading {heading!r}")
+    next_heading = first_heading(next_original) if next_original else None
+    if next_heading and next_heading in processed:
+        problems.append(f"ran on into the next part's heading {next_heading!r}")
+    return problems
+
+
+def join_chunks(chunks):
+    """
+    Reassemble chunks in order with exactly one blank line at each seam
+    """
+    return '\n\n'.join(chunk.strip('\n') for chunk in chunks) + '\n'
+
+
+async def process_in_sections(content, instructions, invoke_chunk, max_fanout=DEFAULT_MAX_FANOUT):
+    """
+    Split content at headings into at most max_fanout chunks, run invoke_chunk(prompt, chunk)
+    on them concurrently, and reassemble the results in order.
+
+    invoke_chunk is any coroutine that sends a prompt to an agent and returns its text,
+    so this works for any agent type. A chunk whose result fails the seam checks is
+    retried once, then kept as it was. Returns (content, problems).
+    """
+    chunks = group_sections(split_sections(content), max_fanout)
+    count = len(chunks)
+
+    async def run_chunk(index):
+        preamble = SECTION_PREAMBLE.format(index=index + 1, count=count, instructions=instructions)
+        next_original = chunks[index + 1] if index + 1 < count else None
+        problems = []
+        for retry_note in ("", SECTION_RETRY_NOTE):
+            result = await invoke_chunk(retry_note + preamble + chunks[index], chunks[index])
+            problems = seam_problems(chunks[index], result, next_original)
+            if not problems:
+                return result, []
+        return chunks[index], [f"part {index + 1} {problem}, kept it unchanged" for problem in problems]
+
+    results = await asyncio.gather(*(run_chunk(index) for index in range(count)))
+    problems = [problem for _, chunk_problems in results for problem in chunk_problems]
+    return join_chunks([result for result, _ in results]), problems
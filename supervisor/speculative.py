@@ -0,0 +1,96 @@
+import asyncio
+import contextlib
+import os
+import time
+
+import invoke
+
+SPECULATIVE_OUTPUT = 'polished.speculative.md'
+
+
+class SpeculationStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.seconds_saved = 0.0
+        self.seconds_wasted = 0.0
+
+    def summary(self):
+        total = self.hits + self.misses + self.failures
+        rate = self.hits / total * 100 if total else 0
+        return (f"speculative polish: {self.hits}/{total} committed ({rate:.0f}% hit rate, {self.failures} failed), "
+                f"{self.seconds_saved:.1f}s saved, {self.seconds_wasted:.1f}s of discarded polishing")
+
+
+stats = SpeculationStats()
+
+
+async def timed(coroutine, limiter):
+    async with limiter:
+        start = time.perf_counter()
+        result = await coroutine
+        return result, time.perf_counter() - start
+
+
+def discard(directory):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(os.path.join(directory, SPECULATIVE_OUTPUT))
+
+
+async def validate_and_polish(directory='.', limiters=None):
+    """
+    Validate drafted.md while polishing it speculatively.
+
+    If validation leaves the draft unchanged the speculative polish is committed as
+    polished.md. Otherwise it is cancelled and the rewritten content is polished
+    instead, as it is when the speculative polish fails. Returns (validated, polished).
+    """
+    limiters = limiters or {}
+    validate_limiter = limiters.get('validate') or contextlib.nullcontext()
+    polish_limiter = limiters.get('polish') or contextlib.nullcontext()
+
+    drafted = invoke.read_document(os.path.join(directory, 'drafted.md'))
+
+    speculation_start = time.perf_counter()
+    speculative = asyncio.create_task(
+        timed(invoke.handle_polishing_async(directory, drafted, output_name=SPECULATIVE_OUTPUT), polish_limiter)
+    )
+    try:
+        validated, validate_seconds = await timed(invoke.handle_validation_async(directory, drafted), validate_limiter)
+    except BaseException:
+        speculative.cancel()
+        discard(directory)
+        raise
+
+    if validated and validated == drafted:
+        try:
+            polished, polish_seconds = await speculative
+        except Exception as e:
+            print(f"speculative polish failed: {e}")
+            polished, polish_seconds = None, time.perf_counter() - speculation_start
+        if polished:
+            os.replace(os.path.join(directory, SPECULATIVE_OUTPUT), os.path.join(directory, 'polished.md'))
+            stats.hits += 1
+            # run one after the other, the polish would have started after validation finished
+            stats.seconds_saved += min(validate_seconds, polish_seconds)
+            return validated, polished
+        stats.seconds_wasted += polish_seconds
+        stats.failures += 1
+        discard(directory)
+    else:
+        if speculative.done() and not speculative.cancelled() and speculative.exception() is None:
+            stats.seconds_wasted += speculative.result()[1]
+        else:
+            stats.seconds_wasted += time.perf_counter() - speculation_start
+        speculative.cancel()
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await speculative
+        discard(directory)
+        stats.misses += 1
+        if not validated:
+            return validated, None
+
+    async with polish_limiter:
+        polished = await invoke.handle_polishing_async(directory, validated)
+    return validated, polished
@@ -0,0 +1,296 @@
+"""
+Local stand-ins for FusionAuth and the AgentCore runtime, for benchmarks that should not
+need live services.
+
+The FusionAuth stand-in serves entity retrieve and search and the client credentials
+token endpoint. The AgentCore stand-in serves /runtimes/{arn}/invocations with
+configurable latency, streaming, and injected errors and throttling. Both count the
+requests they serve.
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import prompts
+
+AGENT_TYPES = ('draftcontent', 'validatecontent', 'polishcontent')
+SUPERVISOR_ENTITY_ID = 'stand-in-supervisor'
+AGENT_ARN = "arn:aws:bedrock-agentcore:{region}:000000000000:runtime/{agenttype}"
+STAND_IN_REGION = 'local'
+
+# rough characters per token, for the usage the agent stand-in reports
+CHARS_PER_TOKEN = 4
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    A threaded local HTTP server on a free port. settings are read by the handler on
+    every request, so they can be changed while it runs.
+    """
+    daemon_threads = True
+
+    def __init__(self, handler, **settings):
+        super().__init__(("127.0.0.1", 0), handler)
+        self.settings = settings
+        self.calls = Counter()
+        self.sessions = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def count(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+    def reset_counts(self):
+        with self._lock:
+            self.calls.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # clients hang up on purpose, e.g. when a hedged call to another region answered first
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        # approximates the TCP and TLS handshake of a real regional endpoint, paid once per connection
+        handshake_seconds = self.server.settings.get('handshake_seconds', 0)
+        if handshake_seconds:
+            time.sleep(handshake_seconds)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def send_json(self, data, status=200, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def agent_entity(agenttype, settings):
+    regions = settings.get('regions') or [STAND_IN_REGION]
+    data = {
+        "agenttype": agenttype,
+        "systemprompt": f"You are the {agenttype} agent.",
+        "model": settings.get('model'),
+        "agentarn": AGENT_ARN.format(region=regions[0], agenttype=agenttype),
+    }
+    if len(regions) > 1:
+        data["agentarns"] = {region: AGENT_ARN.format(region=region, agenttype=agenttype) for region in regions}
+    data.update(settings.get('agent_data', {}).get(agenttype, {}))
+    return {"id": agenttype, "clientId": agenttype, "name": agenttype, "data": data}
+
+
+class FusionAuthStandIn(StandInHandler):
+    """
+    Serves GET /api/entity/{id}, POST /api/entity/search and POST /oauth2/token.
+
+    settings: latency_seconds per request, error_rate (fraction of requests answered
+    503), agent_types to serve, model, regions each agent has a runtime in (the first is
+    its agentarn), and agent_data mapping an agent type to extra entity data such as
+    requestsperminute.
+    """
+
+    def pause(self):
+        latency = self.server.settings.get('latency_seconds', 0)
+        if latency:
+            time.sleep(latency)
+
+    def unavailable(self):
+        """
+        Answer 503 for the configured fraction of requests; returns True when it did
+        """
+        if random.random() < self.server.settings.get('error_rate', 0):
+            self.server.count('errors')
+            self.send_json({"message": "Service unavailable"}, 503)
+            return True
+        return False
+
+    def do_GET(self):
+        self.pause()
+        if self.unavailable():
+            return
+        match = re.fullmatch(r"/api/entity/([^/?]+)", self.path)
+        if not match:
+            self.send_json({"message": "not found"}, 404)
+            return
+        self.server.count('entity_retrieve')
+        entity_id = urllib.parse.unquote(match.group(1))
+        if entity_id == SUPERVISOR_ENTITY_ID:
+            self.send_json({"entity": {"id": entity_id, "clientId": entity_id, "clientSecret": "stand-in-secret"}})
+        elif entity_id in self.server.settings.get('agent_types', AGENT_TYPES):
+            self.send_json({"entity": agent_entity(entity_id, self.server.settings)})
+        else:
+            self.send_json({"message": "not found"}, 404)
+
+    def do_POST(self):
+        body = self.read_body()
+        self.pause()
+        if self.unavailable():
+            return
+        if self.path.startswith("/api/entity/search"):
+            self.server.count('entity_search')
+            search = json.loads(body).get("search", {})
+            agenttype = search.get("queryString", "").split(":", 1)[-1].strip()
+            agent_types = self.server.settings.get('agent_types', AGENT_TYPES)
+            matching = list(agent_types) if agenttype == "*" else [t for t in agent_types if t == agenttype]
+            start = search.get("startRow", 0)
+            count = search.get("numberOfResults", 25)
+            self.send_json({"total": len(matching),
+                            "entities": [agent_entity(t, self.server.settings) for t in matching[start:start + count]]})
+        elif self.path.startswith("/oauth2/token"):
+            self.server.count('token')
+            form = urllib.parse.parse_qs(body.decode())
+            self.send_json({"access_token": os.urandom(16).hex(), "token_type": "Bearer", "expires_in": 3600,
+                            "scope": form.get("scope", [""])[0]})
+        else:
+            self.send_json({"message": "not found"}, 404)
+
+
+def stand_in_reply(prompt):
+    """
+    A plausible reply for each of the supervisor's stage prompts: validation passes,
+    polish edits are empty and everything else echoes the document it was given
+    """
+    if prompt.startswith(prompts.VALIDATE_CHECK_PROMPT):
+        return "valid"
+    if prompt.startswith((prompts.STRUCTURED_VALIDATE_PROMPT, prompts.STRUCTURED_VALIDATE_PATCH_PROMPT)):
+        return json.dumps({"verdict": "valid", "issues": [], "corrected_content": None, "edits": []})
+    if prompt.startswith(prompts.PATCH_POLISH_PROMPT):
+        return json.dumps({"edits": []})
+    # every prompt ends with a blank line before the document
+    return prompt.split("\n\n", 1)[-1]
+
+
+class AgentCoreStandIn(StandInHandler):
+    """
+    Serves POST /runtimes/{arn}/invocations.
+
+    settings: first_token_seconds before any text, seconds_per_kchar of generated text,
+    stream_chunk_chars per streamed event, error_rate and throttle_rate (fractions of
+    requests answered 500 and 429), retry_after for the 429s, session_seconds paid the
+    first time a runtime session id is seen, and batch_concurrency, the documents of a
+    batched request worked on at once.
+    """
+
+    def do_POST(self):
+        payload = json.loads(self.read_body() or b"{}")
+        settings = self.server.settings
+        if not re.fullmatch(r"/runtimes/[^/]+/invocations(\?.*)?", self.path):
+            self.send_json({"message": "not found"}, 404)
+            return
+
+        roll = random.random()
+        if roll < settings.get('throttle_rate', 0):
+            self.server.count('throttled')
+            self.send_json({"message": "Too many requests"}, 429, {"Retry-After": str(settings.get('retry_after', 0.1))})
+            return
+        if roll < settings.get('throttle_rate', 0) + settings.get('error_rate', 0):
+            self.server.count('errors')
+            self.send_json({"message": "Internal server error"}, 500)
+            return
+        self.server.count('invocations')
+        self.start_session()
+
+        if payload.get("documents") is not None:
+            self.answer_batch(payload)
+            return
+
+        prompt = payload.get("prompt", "")
+        text = stand_in_reply(prompt)
+        usage = {"inputTokens": len(prompt) // CHARS_PER_TOKEN, "outputTokens": len(text) // CHARS_PER_TOKEN}
+        usage["totalTokens"] = usage["inputTokens"] + usage["outputTokens"]
+        trace = {"trace_id": (payload.get("trace") or {}).get("trace_id"), "spans": []}
+        generation_seconds = len(text) / 1000 * settings.get('seconds_per_kchar', 0)
+
+        time.sleep(settings.get('first_token_seconds', 0))
+        if payload.get("stream"):
+            self.stream(text, generation_seconds, usage, trace)
+            return
+        time.sleep(generation_seconds)
+        self.send_json({"result": {"role": "assistant", "content": [{"text": text}]}, "usage": usage, "trace": trace})
+
+    def start_session(self):
+        # a new session id gets a new microVM in the real runtime
+        session_id = self.headers.get("X-Amzn-Bedrock-AgentCore-Runtime-Session-Id")
+        with self.server._lock:
+            new_session = session_id not in self.server.sessions
+            self.server.sessions.add(session_id)
+        if new_session:
+            time.sleep(self.server.settings.get('session_seconds', 0))
+
+    def answer_batch(self, payload):
+        settings = self.server.settings
+        results = {}
+        # each worker takes the next document when it is free, like the agent's thread pool
+        workers = [0.0] * max(1, settings.get('batch_concurrency', 8))
+        for document in payload["documents"]:
+            self.server.count('batched_documents')
+            text = stand_in_reply(document["prompt"])
+            usage = {"inputTokens": len(document["prompt"]) // CHARS_PER_TOKEN, "outputTokens": len(text) // CHARS_PER_TOKEN}
+            usage["totalTokens"] = usage["inputTokens"] + usage["outputTokens"]
+            results[document["id"]] = {"result": {"role": "assistant", "content": [{"text": text}]}, "usage": usage}
+            workers.sort()
+            workers[0] += settings.get('first_token_seconds', 0) + len(text) / 1000 * settings.get('seconds_per_kchar', 0)
+        time.sleep(max(workers))
+        usage = {name: sum(outcome["usage"][name] for outcome in results.values()) for name in ("inputTokens", "outputTokens", "totalTokens")}
+        self.send_json({"results": results, "usage": usage,
+                        "trace": {"trace_id": (payload.get("trace") or {}).get("trace_id"), "spans": []}})
+
+    def stream(self, text, generation_seconds, usage, trace):
+        chunk_chars = self.server.settings.get('stream_chunk_chars', 200)
+        chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or [""]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in chunks:
+            self.write_event({"delta": chunk})
+            time.sleep(generation_seconds / len(chunks))
+        self.write_event({"usage": usage, "trace": trace})
+        self.wfile.write(b"0\r\n\r\n")
+
+    def write_event(self, event):
+        data = f"data: {json.dumps(event)}\n\n".encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+
+def start_fusionauth(**settings):
+    return StandInServer(FusionAuthStandIn, **settings).start()
+
+
+def start_agentcore(**settings):
+    return StandInServer(AgentCoreStandIn, **settings).start()
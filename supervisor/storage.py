@@ -0,0 +1,54 @@
+import json
+import os
+import threading
+
+
+def atomic_write(path, text, private=False):
+    """
+    Write text to path through a temporary file in the same directory, so readers (and
+    other processes sharing the file) only ever see the old or the new contents. private
+    keeps the file readable by the current user only.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600 if private else 0o666)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def atomic_write_json(path, data, private=False, **dump_options):
+    atomic_write(path, json.dumps(data, **dump_options), private)
+
+
+def evict_least_recently_used(directory, max_bytes):
+    """
+    Remove the files in directory with the oldest mtime until the rest fit in max_bytes.
+    Temporary files still being written are left alone.
+    """
+    files = []
+    total = 0
+    for name in os.listdir(directory):
+        if name.endswith('.tmp'):
+            continue
+        try:
+            stat = os.stat(os.path.join(directory, name))
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, name))
+        total += stat.st_size
+    files.sort()
+    for _, size, name in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+from agent_registry import AgentRegistry
+
+
+def entity(agenttype, client_id):
+    return {'clientId': client_id, 'data': {'agenttype': agenttype, 'systemprompt': 'prompt', 'model': 'model', 'agentarn': 'arn'}}
+
+
+def loader(*results):
+    """
+    A load() returning each of results in turn, repeating the last; an exception is raised
+    """
+    results = list(results)
+    calls = []
+
+    async def load():
+        calls.append(1)
+        result = results.pop(0) if len(results) > 1 else results[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+    load.calls = calls
+    return load
+
+
+def test_the_index_is_reused_while_fresh():
+    registry = AgentRegistry()
+    load = loader([entity('draftcontent', 'draft')])
+
+    assert asyncio.run(registry.get_async('draftcontent', load)).client_id == 'draft'
+    assert asyncio.run(registry.get_async('draftcontent', load)).client_id == 'draft'
+    assert len(load.calls) == 1
+
+
+def test_a_missing_agenttype_reloads_once():
+    registry = AgentRegistry()
+    load = loader([entity('draftcontent', 'draft')], [entity('draftcontent', 'draft'), entity('polishcontent', 'polish')])
+    asyncio.run(registry.get_async('draftcontent', load))
+
+    assert asyncio.run(registry.get_async('polishcontent', load)).client_id == 'polish'
+    assert asyncio.run(registry.get_async('unknown', load)) is None
+    # one reload for polishcontent, one for unknown, none more for unknown within the same call
+    assert len(load.calls) == 3
+
+
+def test_a_missing_agenttype_does_not_reload_while_a_failed_reload_waits():
+    registry = AgentRegistry(ttl=0, retry_seconds=60)
+    load = loader([entity('draftcontent', 'draft')], OSError('FusionAuth down'))
+    asyncio.run(registry.get_async('draftcontent', load))
+
+    assert asyncio.run(registry.get_async('draftcontent', load)).client_id == 'draft'
+    assert asyncio.run(registry.get_async('unknown', load)) is None
+    assert len(load.calls) == 2
+
+
+def test_a_snapshot_in_another_shape_is_ignored(tmp_path):
+    path = tmp_path / 'registry.json'
+    for snapshot in ({'agents': {'draftcontent': {'client_id': 'draft'}}, 'loaded_at': 0},
+                     {'agents': {}},
+                     {'agents': [], 'loaded_at': 0},
+                     ['not', 'a', 'snapshot']):
+        path.write_text(json.dumps(snapshot))
+        registry = AgentRegistry(snapshot_path=str(path))
+        load = loader([entity('draftcontent', 'draft')])
+
+        assert asyncio.run(registry.get_async('draftcontent', load)).client_id == 'draft'
+        assert len(load.calls) == 1
+
+
+def test_a_fresh_snapshot_is_used_on_startup(tmp_path):
+    path = str(tmp_path / 'registry.json')
+    asyncio.run(AgentRegistry(snapshot_path=path).get_async('draftcontent', loader([entity('draftcontent', 'draft')])))
+    load = loader(OSError('not called'))
+
+    assert asyncio.run(AgentRegistry(snapshot_path=path).get_async('draftcontent', load)).client_id == 'draft'
+    assert load.calls == []
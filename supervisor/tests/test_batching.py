@@ -0,0 +1,87 @@
+import asyncio
+
+from batching import AgentBatcher, BatchResult, batch_results, estimate_tokens, pack_batches
+
+
+def documents(*sizes):
+    return [(str(index), 'x' * size) for index, size in enumerate(sizes)]
+
+
+def test_pack_batches_respects_the_token_budget_and_document_count():
+    batches = pack_batches(documents(38, 38, 38, 38), token_budget=20, max_documents=3)
+    assert [[document[0] for document in batch] for batch in batches] == [['0', '1'], ['2', '3']]
+
+    batches = pack_batches(documents(0, 0, 0, 0, 0), token_budget=100, max_documents=2)
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+
+def test_a_document_over_the_budget_gets_a_batch_of_its_own():
+    batches = pack_batches(documents(4, 400, 4), token_budget=10)
+    assert [[document[0] for document in batch] for batch in batches] == [['0'], ['1'], ['2']]
+
+
+def test_batch_results_maps_errors_to_none():
+    response = {'results': {
+        '1': {'result': {'content': [{'text': 'done'}]}, 'usage': {'outputTokens': 3}},
+        '2': {'error': 'model refused'},
+    }}
+    assert batch_results(response) == {'1': BatchResult('done', {'outputTokens': 3}), '2': None}
+    assert batch_results({}) == {}
+
+
+def echo_batches(sent):
+    async def send_batch(batch):
+        sent.append([document['prompt'] for document in batch])
+        return {document['id']: document['prompt'].upper() for document in batch}
+    return send_batch
+
+
+def test_prompts_for_the_same_key_share_one_request():
+    async def run():
+        sent = []
+        batcher = AgentBatcher(window_seconds=0.01)
+        results = await asyncio.gather(*(batcher.submit('draft', prompt, echo_batches(sent)) for prompt in ['a', 'b', 'c']))
+        return results, sent, batcher.metrics()
+
+    results, sent, metrics = asyncio.run(run())
+    assert results == ['A', 'B', 'C']
+    assert sent == [['a', 'b', 'c']]
+    assert metrics['documents_per_request'] == 3
+
+
+def test_different_keys_are_sent_separately():
+    async def run():
+        sent = []
+        batcher = AgentBatcher(window_seconds=0.01)
+        await asyncio.gather(batcher.submit('draft', 'a', echo_batches(sent)), batcher.submit('polish', 'b', echo_batches(sent)))
+        return sorted(sent)
+
+    assert asyncio.run(run()) == [['a'], ['b']]
+
+
+def test_a_full_batch_is_sent_without_waiting_for_the_window():
+    async def run():
+        sent = []
+        batcher = AgentBatcher(max_documents=2, window_seconds=60)
+        return await asyncio.wait_for(asyncio.gather(batcher.submit('draft', 'a', echo_batches(sent)),
+                                                     batcher.submit('draft', 'b', echo_batches(sent))), 1)
+
+    assert asyncio.run(run()) == ['A', 'B']
+
+
+def test_only_small_prompts_are_batched():
+    batcher = AgentBatcher(max_document_tokens=10)
+    assert batcher.accepts('x' * 36)
+    assert not batcher.accepts('x' * 40)
+    assert estimate_tokens('x' * 40) == 11
+
+
+def test_a_failed_request_raises_in_every_caller():
+    async def run():
+        async def fail(batch):
+            raise OSError('runtime unreachable')
+        batcher = AgentBatcher(window_seconds=0.01)
+        return await asyncio.gather(batcher.submit('draft', 'a', fail), batcher.submit('draft', 'b', fail), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert [type(result) for result in results] == [OSError, OSError]
@@ -0,0 +1,99 @@
+import pytest
+
+from budget import OutputShape, PromptBudget, model_profiles
+
+SHAPE = OutputShape('draft', 100, 1.0, True)
+CONTENT = 'x' * 400
+MODELS = {'models': [
+    {'id': 'slow', 'outputtokenspersecond': 10, 'firsttokenseconds': 1},
+    {'id': 'fast', 'outputtokenspersecond': 100, 'firsttokenseconds': 1},
+]}
+
+
+def test_the_entity_model_comes_first():
+    assert [profile.id for profile in model_profiles(MODELS, 'fast')] == ['fast', 'slow']
+    assert [profile.id for profile in model_profiles(MODELS, 'other')] == ['other', 'slow', 'fast']
+    assert [profile.id for profile in model_profiles({}, None)] == [None]
+
+
+def test_plan_estimates_tokens_and_seconds():
+    plan = PromptBudget().plan(MODELS, 'slow', 'system', CONTENT, CONTENT, SHAPE, adaptive=False)
+    assert (plan.model, plan.input_tokens, plan.output_tokens, plan.chunks, plan.fits) == ('slow', 102, 200, 1, True)
+    assert plan.seconds == pytest.approx(1 + 200 / 10)
+
+
+def test_plan_picks_the_fastest_model_that_fits():
+    assert PromptBudget().plan(MODELS, 'slow', '', CONTENT, CONTENT, SHAPE).model == 'fast'
+
+
+def test_the_entity_model_wins_ties():
+    data = {'models': [{'id': 'a'}, {'id': 'b'}]}
+    assert PromptBudget().plan(data, 'b', '', CONTENT, CONTENT, SHAPE).model == 'b'
+
+
+def test_a_model_whose_limits_are_too_small_is_skipped():
+    data = {'models': [
+        {'id': 'fast', 'outputtokenspersecond': 100, 'maxoutputtokens': 100},
+        {'id': 'roomy', 'outputtokenspersecond': 10, 'maxoutputtokens': 1000},
+    ]}
+    assert PromptBudget().plan(data, 'fast', '', CONTENT, CONTENT, SHAPE).model == 'roomy'
+
+
+def test_plan_splits_the_document_when_no_model_fits():
+    data = {'models': [{'id': 'small', 'contextwindow': 200}, {'id': 'smaller', 'contextwindow': 100}]}
+    plan = PromptBudget(headroom=1).plan(data, 'smaller', '', CONTENT, CONTENT, SHAPE)
+    # 100 input and 200 output tokens take two sections of the larger window
+    assert (plan.model, plan.chunks, plan.fits) == ('small', 2, False)
+
+
+def test_record_moves_the_corrections_toward_what_happened():
+    budget = PromptBudget(learning_rate=0.5)
+    plan = budget.plan(MODELS, 'slow', '', CONTENT, CONTENT, SHAPE, adaptive=False)
+    budget.record(plan, {'inputTokens': plan.input_tokens, 'outputTokens': plan.output_tokens * 3}, None)
+
+    assert budget.correction('output/draft') == pytest.approx(2)
+    assert budget.correction('input/slow') == pytest.approx(1)
+    # a call without a measured latency leaves the latency correction alone
+    assert 'latency/slow' not in budget.corrections
+    assert budget.plan(MODELS, 'slow', '', CONTENT, CONTENT, SHAPE, adaptive=False).output_tokens == 400
+
+
+def test_input_is_only_learned_from_calls_with_one_model_call():
+    budget = PromptBudget(learning_rate=0.5)
+    plan = budget.plan(MODELS, 'slow', '', CONTENT, CONTENT, SHAPE, adaptive=False)
+    budget.record(plan, {'inputTokens': plan.input_tokens * 5, 'outputTokens': plan.output_tokens, 'cycles': 3}, None)
+
+    # the tool cycles resent the conversation, so the summed input says nothing about the prompt estimate
+    assert 'input/slow' not in budget.corrections
+    assert budget.correction('output/draft') == pytest.approx(1)
+
+    budget.record(plan, {'inputTokens': plan.input_tokens * 3, 'outputTokens': plan.output_tokens, 'cycles': 1}, None)
+    assert budget.correction('input/slow') == pytest.approx(2)
+
+
+def test_corrections_are_bounded():
+    budget = PromptBudget(learning_rate=1)
+    plan = budget.plan(MODELS, 'slow', '', CONTENT, CONTENT, SHAPE, adaptive=False)
+    budget.record(plan, {'outputTokens': plan.output_tokens * 1000}, plan.seconds / 1000)
+    assert budget.correction('output/draft') == 10
+    assert budget.correction('latency/slow') == pytest.approx(0.1)
+
+
+def test_summary_compares_predictions_with_actuals():
+    budget = PromptBudget()
+    assert budget.summary() is None
+    plan = budget.plan(MODELS, 'slow', '', CONTENT, CONTENT, SHAPE, adaptive=False)
+    budget.record(plan, {'inputTokens': 50, 'outputTokens': 100}, 2.0)
+    budget.record(plan, None, None)
+
+    row = budget.summary().splitlines()[2].split()
+    assert row == ['draft', 'slow', '2', '100.0/50.0', '200.0/100.0', '21.0/2.0']
+
+
+def test_corrections_are_kept_between_runs(tmp_path):
+    path = str(tmp_path / 'budget.json')
+    budget = PromptBudget(stats_path=path)
+    plan = budget.plan(MODELS, 'slow', '', CONTENT, CONTENT, SHAPE, adaptive=False)
+    budget.record(plan, {'outputTokens': plan.output_tokens * 2}, None)
+
+    assert PromptBudget(stats_path=path).correction('output/draft') == budget.correction('output/draft')
@@ -0,0 +1,136 @@
+import asyncio
+
+import httpx
+import pytest
+
+from fusionauth_guard import (CircuitBreaker, CircuitOpenError, FusionAuthGuard, FusionAuthRequestError,
+                              FusionAuthUnavailable)
+
+
+def open_breaker(reset_seconds):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=reset_seconds)
+    assert breaker.failed() is False
+    assert breaker.failed() is True
+    return breaker
+
+
+def test_the_circuit_opens_after_consecutive_failures():
+    breaker = open_breaker(reset_seconds=60)
+    assert breaker.state == 'open'
+    assert breaker.allow() is False
+
+
+def test_a_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.failed()
+    breaker.succeeded()
+    assert breaker.failed() is False
+    assert breaker.state == 'closed'
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = open_breaker(reset_seconds=0)
+    assert breaker.state == 'half-open'
+    assert breaker.allow() is True
+    assert breaker.allow() is False
+
+    breaker.succeeded()
+    assert breaker.state == 'closed'
+    assert breaker.allow() is True
+
+
+def test_a_failed_trial_opens_the_circuit_again():
+    breaker = open_breaker(reset_seconds=0)
+    breaker.allow()
+    assert breaker.failed() is True
+    assert breaker.trial_running is False
+    breaker.reset_seconds = 60
+    assert breaker.allow() is False
+
+
+def test_an_abandoned_trial_lets_the_next_call_try():
+    breaker = open_breaker(reset_seconds=0)
+    breaker.allow()
+    breaker.abandoned()
+    assert breaker.state == 'half-open'
+    assert breaker.allow() is True
+
+
+def response(status):
+    return httpx.Response(status, text='body')
+
+
+def guard(**kwargs):
+    kwargs.setdefault('backoff_seconds', 0)
+    return FusionAuthGuard(**kwargs)
+
+
+def test_call_async_retries_server_errors():
+    statuses = iter([503, 500, 200])
+
+    async def send(timeout):
+        return response(next(statuses))
+
+    assert asyncio.run(guard().call_async('entity', send)).status_code == 200
+
+
+def test_call_async_gives_up_after_the_retries():
+    async def send(timeout):
+        raise httpx.ConnectError('refused')
+
+    with pytest.raises(FusionAuthUnavailable) as error:
+        asyncio.run(guard(max_retries=1).call_async('token', send))
+    assert error.value.endpoint == 'token'
+    assert error.value.status is None
+
+
+def test_call_async_does_not_retry_client_errors():
+    calls = []
+
+    async def send(timeout):
+        calls.append(timeout)
+        return response(404)
+
+    with pytest.raises(FusionAuthRequestError) as error:
+        asyncio.run(guard(timeouts={'entity': 2}).call_async('entity', send))
+    assert error.value.status == 404
+    assert calls == [2]
+
+
+def test_call_async_rejects_calls_while_the_circuit_is_open():
+    fusionauth = guard(max_retries=0, failure_threshold=1, reset_seconds=60)
+
+    async def send(timeout):
+        return response(502)
+
+    with pytest.raises(FusionAuthUnavailable):
+        asyncio.run(fusionauth.call_async('search', send))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(fusionauth.call_async('search', send))
+    # other kinds of call have their own circuit
+    assert asyncio.run(fusionauth.call_async('token', lambda timeout: asyncio.sleep(0, response(200)))).status_code == 200
+
+
+def test_a_cancelled_trial_does_not_keep_the_circuit_open():
+    fusionauth = guard(max_retries=0, failure_threshold=1, reset_seconds=0)
+    fusionauth.breaker('entity').failed()
+
+    async def run():
+        started = asyncio.Event()
+
+        async def hang(timeout):
+            started.set()
+            await asyncio.sleep(60)
+
+        trial = asyncio.create_task(fusionauth.call_async('entity', hang))
+        await started.wait()
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        async def send(timeout):
+            return response(200)
+        return await fusionauth.call_async('entity', send)
+
+    assert asyncio.run(run()).status_code == 200
+    assert fusionauth.breaker('entity').state == 'closed'
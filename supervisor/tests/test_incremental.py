@@ -0,0 +1,20 @@
+from agent_registry import AgentConfig
+from incremental import STAGES, agent_digest
+
+DRAFT = STAGES[0]
+AGENT = AgentConfig('client', 'you write posts', 'model-a', 'arn:aws:bedrock-agentcore:us-west-2:0:runtime/draft',
+                    {'requestsperminute': 60})
+
+
+def test_output_shaping_edits_change_the_digest():
+    digest = agent_digest(DRAFT, AGENT)
+    assert agent_digest(DRAFT, AGENT._replace(system_prompt='you write poems')) != digest
+    assert agent_digest(DRAFT, AGENT._replace(model='model-b')) != digest
+    assert agent_digest(DRAFT, AGENT._replace(agentarn='arn:aws:bedrock-agentcore:us-west-2:0:runtime/draft-v2')) != digest
+    assert agent_digest(DRAFT._replace(prompts=['write it shorter']), AGENT) != digest
+
+
+def test_routing_and_rate_limit_edits_keep_the_digest():
+    data = {'requestsperminute': 120, 'burst': 4,
+            'agentarns': {'us-east-1': 'arn:aws:bedrock-agentcore:us-east-1:0:runtime/draft'}}
+    assert agent_digest(DRAFT, AGENT._replace(data=data)) == agent_digest(DRAFT, AGENT)
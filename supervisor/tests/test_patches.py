@@ -0,0 +1,36 @@
+from patches import Edit, apply_edits, parse_edits, strip_code_fence
+
+
+def test_strip_code_fence():
+    assert strip_code_fence('```json\n{"a": 1}\n```') == '{"a": 1}'
+    assert strip_code_fence('  {"a": 1}  ') == '{"a": 1}'
+
+
+def test_parse_edits_accepts_a_list_an_object_or_fenced_json():
+    edits = [Edit('old', 'new')]
+    assert parse_edits([{'anchor': 'old', 'replacement': 'new'}]) == edits
+    assert parse_edits({'edits': [{'anchor': 'old', 'replacement': 'new'}]}) == edits
+    assert parse_edits('```json\n{"edits": [{"anchor": "old", "replacement": "new"}]}\n```') == edits
+
+
+def test_parse_edits_rejects_the_wrong_shape():
+    assert parse_edits('not json') is None
+    assert parse_edits({'edits': 'old'}) is None
+    assert parse_edits([{'anchor': '', 'replacement': 'new'}]) is None
+    assert parse_edits([{'anchor': 'old'}]) is None
+    assert parse_edits(['old']) is None
+
+
+def test_apply_edits_in_order():
+    document, failures = apply_edits('one two three', [Edit('two', '2'), Edit('2 three', '2 3')])
+    assert (document, failures) == ('one 2 3', [])
+
+
+def test_an_empty_replacement_deletes_the_anchor():
+    assert apply_edits('keep drop', [Edit(' drop', '')]) == ('keep', [])
+
+
+def test_anchors_that_are_missing_or_ambiguous_are_reported_and_skipped():
+    document, failures = apply_edits('a b a', [Edit('a', 'x'), Edit('missing', 'y'), Edit('b', 'c')])
+    assert document == 'a c a'
+    assert failures == ["edit 1: anchor found 2 times: 'a'", "edit 2: anchor found 0 times: 'missing'"]
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from region_router import RegionRouter, agent_routes, arn_region
+
+WEST = ('us-west-2', 'arn:aws:bedrock-agentcore:us-west-2:0:runtime/draft')
+EAST = ('us-east-1', 'arn:aws:bedrock-agentcore:us-east-1:0:runtime/draft')
+KIND = ('draftcontent', False)
+
+
+def regions(**behaviour):
+    """
+    A call that, per region, sleeps and then returns or raises the region's outcome
+    """
+    calls = []
+
+    async def call(region, arn, on_chunk):
+        calls.append(region)
+        seconds, outcome = behaviour[region.replace('-', '_')]
+        await asyncio.sleep(seconds)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    call.calls = calls
+    return call
+
+
+def test_agent_routes_put_the_primary_first():
+    data = {'agentarns': {'us-east-1': EAST[1], 'us-west-2': 'arn:aws:bedrock-agentcore:us-west-2:0:runtime/old'}}
+    assert agent_routes(WEST[1], data, 'eu-west-1') == [WEST, EAST]
+    assert agent_routes('not-an-arn', {}, 'eu-west-1') == [('eu-west-1', 'not-an-arn')]
+    assert arn_region(EAST[1]) == 'us-east-1'
+
+
+def test_a_slow_region_is_hedged_after_the_threshold():
+    router = RegionRouter(hedge_seconds=0.05, probe_every=0)
+    call = regions(us_west_2=(1, 'west'), us_east_1=(0, 'east'))
+
+    assert asyncio.run(router.invoke(KIND, [WEST, EAST], call)) == 'east'
+    assert call.calls == ['us-west-2', 'us-east-1']
+    assert router.hedges == 1
+    assert router.wins == {'us-east-1': 1}
+
+
+def test_no_hedge_before_the_threshold_or_when_hedging_is_off():
+    call = regions(us_west_2=(0.05, 'west'), us_east_1=(0, 'east'))
+    assert asyncio.run(RegionRouter(hedge_seconds=1, probe_every=0).invoke(KIND, [WEST, EAST], call)) == 'west'
+    assert asyncio.run(RegionRouter(probe_every=0).invoke(KIND, [WEST, EAST], call)) == 'west'
+    assert call.calls == ['us-west-2', 'us-west-2']
+
+
+def test_the_hedge_delay_comes_from_measured_latency():
+    router = RegionRouter(hedge_seconds=30, min_samples=3, hedge_percentile=1.0)
+    assert router.hedge_delay(KIND, [WEST, EAST]) == 30
+    for latency in (0.1, 0.2, 0.3):
+        router.stats(KIND, 'us-east-1').succeeded(latency)
+    assert router.hedge_delay(KIND, [WEST, EAST]) == pytest.approx(0.3)
+
+
+def test_a_failing_region_is_failed_over():
+    router = RegionRouter(probe_every=0)
+    call = regions(us_west_2=(0, OSError('connection reset')), us_east_1=(0, 'east'))
+
+    assert asyncio.run(router.invoke(KIND, [WEST, EAST], call)) == 'east'
+    assert router.failovers == 1
+    assert router.stats(KIND, 'us-west-2').consecutive_failures == 1
+
+
+def test_the_last_error_is_raised_when_every_region_fails():
+    router = RegionRouter(probe_every=0)
+    call = regions(us_west_2=(0, OSError('west down')), us_east_1=(0, OSError('east down')))
+
+    with pytest.raises(OSError, match='east down'):
+        asyncio.run(router.invoke(KIND, [WEST, EAST], call))
+
+
+def test_a_region_failing_repeatedly_is_tried_last():
+    router = RegionRouter(failure_threshold=2, probe_every=0)
+    call = regions(us_west_2=(0, None), us_east_1=(0, 'east'))
+    for _ in range(2):
+        asyncio.run(router.invoke(KIND, [WEST, EAST], call))
+
+    assert [region for region, _ in router.order(KIND, [WEST, EAST])] == ['us-east-1', 'us-west-2']
+
+
+def test_regions_are_ordered_by_median_latency():
+    router = RegionRouter(probe_every=0)
+    router.stats(KIND, 'us-west-2').succeeded(2.0)
+    router.stats(KIND, 'us-east-1').succeeded(0.5)
+    assert [region for region, _ in router.order(KIND, [WEST, EAST])] == ['us-east-1', 'us-west-2']
+
+
+def test_a_cancelled_loser_is_not_recorded():
+    router = RegionRouter(hedge_seconds=0.02, probe_every=0)
+    call = regions(us_west_2=(1, 'west'), us_east_1=(0.01, 'east'))
+    asyncio.run(router.invoke(KIND, [WEST, EAST], call))
+
+    # the west call was cancelled before it finished, so it leaves no sample and no failure behind
+    assert len(router.stats(KIND, 'us-west-2').latencies) == 0
+    assert router.stats(KIND, 'us-west-2').consecutive_failures == 0
+    assert len(router.stats(KIND, 'us-east-1').latencies) == 1
+
+
+def test_a_streamed_call_commits_to_the_first_region_that_sends_text():
+    router = RegionRouter(hedge_seconds=0.02, probe_every=0)
+    received = []
+
+    async def call(region, arn, on_chunk):
+        if region == 'us-west-2':
+            await asyncio.sleep(0.05)
+            on_chunk('west ')
+            await asyncio.sleep(0.05)
+            return 'west done'
+        await asyncio.sleep(1)
+        on_chunk('east ')
+        return 'east done'
+
+    assert asyncio.run(router.invoke(KIND, [WEST, EAST], call, received.append)) == 'west done'
+    assert received == ['west ']
+    assert len(router.stats(KIND, 'us-east-1').latencies) == 0
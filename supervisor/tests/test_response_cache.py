@@ -0,0 +1,32 @@
+import os
+
+from response_cache import DiskBackend, ResponseCache
+
+
+def test_disk_entries_are_read_back(tmp_path):
+    cache = ResponseCache(DiskBackend(str(tmp_path)))
+    cache.put('key', 'response')
+
+    assert cache.get('key') == 'response'
+    assert cache.get('other') is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_an_entry_evicted_between_read_and_touch_is_a_miss(tmp_path, monkeypatch):
+    backend = DiskBackend(str(tmp_path))
+    backend.put('key', 'response')
+
+    def evicted(path):
+        os.remove(path)
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(os, 'utime', evicted)
+
+    assert backend.get('key') is None
+
+
+def test_empty_responses_are_not_stored(tmp_path):
+    cache = ResponseCache(DiskBackend(str(tmp_path)))
+    cache.put('key', '')
+    cache.put('none', None)
+
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,99 @@
+import asyncio
+import time
+
+import pytest
+
+from scheduler import BATCH, INTERACTIVE, AgentScheduler, TokenBucket
+
+
+def test_a_burst_below_one_still_lets_calls_through():
+    async def run():
+        bucket = TokenBucket(1.0, 0.5)
+        await asyncio.wait_for(bucket.acquire(), 1)
+        return bucket.burst
+
+    assert asyncio.run(run()) == 1
+
+
+def test_calls_past_the_burst_wait_for_a_token():
+    async def run():
+        bucket = TokenBucket(20, 2)
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    # two from the burst, the third waits for 1/20s of refill
+    assert asyncio.run(run()) >= 0.04
+
+
+def test_an_unlimited_bucket_never_waits():
+    async def run():
+        bucket = TokenBucket(None, 0)
+        for _ in range(100):
+            await bucket.acquire()
+        return bucket.queue_depth()
+
+    assert asyncio.run(run()) == 0
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    async def run():
+        bucket = TokenBucket(50, 1)
+        await bucket.acquire()
+        order = []
+
+        async def call(name, priority):
+            await bucket.acquire(priority)
+            order.append(name)
+
+        await asyncio.gather(call('batch 1', BATCH), call('batch 2', BATCH), call('interactive', INTERACTIVE))
+        return order
+
+    assert asyncio.run(run()) == ['interactive', 'batch 1', 'batch 2']
+
+
+def test_throttling_cuts_the_rate_and_successes_win_it_back():
+    bucket = TokenBucket(10, 5)
+    bucket.throttled()
+    assert (bucket.rate, bucket.tokens, bucket.throttles) == (5, 0, 1)
+    for _ in range(5):
+        bucket.throttled()
+    # never below the minimum fraction of the configured rate
+    assert bucket.rate == pytest.approx(0.5)
+
+    for _ in range(100):
+        bucket.succeeded()
+    assert bucket.rate == 10
+
+
+def test_scheduler_limits_come_from_the_entity_data():
+    scheduler = AgentScheduler()
+    assert scheduler.bucket('draftcontent', None).rate is None
+
+    bucket = scheduler.bucket('draftcontent', 'model', {'requestsperminute': 120})
+    assert (bucket.rate, bucket.burst) == (2, 2)
+    assert scheduler.bucket('draftcontent', 'model', {'requestsperminute': '120'}) is bucket
+    assert scheduler.bucket('draftcontent', 'model') is bucket
+    assert scheduler.bucket('draftcontent', 'other model', {'requestsperminute': 120}) is not bucket
+
+
+def test_scheduler_rebuilds_a_bucket_when_the_limits_change():
+    scheduler = AgentScheduler(default_rpm=60)
+    bucket = scheduler.bucket('validatecontent', None, {})
+    assert (bucket.rate, bucket.burst) == (1, 1)
+
+    rebuilt = scheduler.bucket('validatecontent', None, {'requestsperminute': 30, 'burst': 0.2})
+    assert rebuilt is not bucket
+    assert (rebuilt.rate, rebuilt.burst) == (0.5, 1)
+
+
+def test_acquire_records_the_wait():
+    async def run():
+        scheduler = AgentScheduler()
+        await scheduler.acquire('polishcontent', None, {'requestsperminute': 600})
+        return scheduler.metrics()[('polishcontent', None)]
+
+    metrics = asyncio.run(run())
+    assert metrics['requests'] == 1
+    assert metrics['rate_per_minute'] == 600
@@ -0,0 +1,69 @@
+import asyncio
+
+from sections import (SECTION_RETRY_NOTE, group_sections, join_chunks, process_in_sections, seam_problems,
+                      split_sections)
+
+DOCUMENT = "intro\n\n# One\n\nfirst\n\n```\n# not a heading\n```\n\n## Two\n\nsecond\n"
+
+
+def test_split_sections_starts_a_section_at_each_heading_outside_fences():
+    assert split_sections(DOCUMENT) == [
+        "intro\n\n",
+        "# One\n\nfirst\n\n```\n# not a heading\n```\n\n",
+        "## Two\n\nsecond\n",
+    ]
+
+
+def test_split_sections_treats_tilde_fences_like_backticks():
+    assert split_sections("# A\n~~~\n# code\n~~~\n# B\n") == ["# A\n~~~\n# code\n~~~\n", "# B\n"]
+
+
+def test_group_sections_joins_neighbours_up_to_the_fanout():
+    sections = ["a" * 10, "b" * 10, "c" * 10, "d" * 10]
+    assert group_sections(sections, 4) == sections
+    assert group_sections(sections, 2) == ["a" * 10 + "b" * 10, "c" * 10 + "d" * 10]
+    assert len(group_sections(sections * 3, 3)) == 3
+
+
+def test_seam_problems():
+    assert seam_problems("# A\ntext", "# A\nbetter text", "# B\n") == []
+    assert seam_problems("# A\ntext", "  ", None) == ["came back empty"]
+    assert seam_problems("# A\ntext", "# Renamed\ntext", None) == ["lost its leading heading '# A'"]
+    assert seam_problems("# A\ntext", "# A\ntext\n# B\nmore", "# B\nmore") == ["ran on into the next part's heading '# B'"]
+
+
+def test_join_chunks_leaves_one_blank_line_at_each_seam():
+    assert join_chunks(["# A\ntext\n\n\n", "\n# B\ntext"]) == "# A\ntext\n\n# B\ntext\n"
+
+
+def test_process_in_sections_runs_every_chunk_and_keeps_the_order():
+    async def shout(prompt, chunk):
+        await asyncio.sleep(0.01 if chunk.startswith("# One") else 0)
+        return chunk.upper().replace("# ONE", "# One").replace("## TWO", "## Two")
+
+    content, problems = asyncio.run(process_in_sections(DOCUMENT, "", shout, max_fanout=3))
+    assert problems == []
+    assert content == "INTRO\n\n# One\n\nFIRST\n\n```\n# NOT A HEADING\n```\n\n## Two\n\nSECOND\n"
+
+
+def test_a_chunk_that_breaks_its_seams_is_retried_then_kept():
+    prompts = []
+
+    async def lose_headings(prompt, chunk):
+        prompts.append(prompt)
+        if chunk.startswith("## Two") and not prompt.startswith(SECTION_RETRY_NOTE):
+            return "second, without its heading"
+        return "rewritten\n" if chunk.startswith("intro") else chunk.replace("first", "FIRST").replace("second", "SECOND")
+
+    content, problems = asyncio.run(process_in_sections(DOCUMENT, "", lose_headings, max_fanout=3))
+    assert problems == []
+    assert "## Two\n\nSECOND" in content
+    assert sum(prompt.startswith(SECTION_RETRY_NOTE) for prompt in prompts) == 1
+
+    async def always_empty(prompt, chunk):
+        return ""
+
+    content, problems = asyncio.run(process_in_sections(DOCUMENT, "", always_empty, max_fanout=3))
+    assert content == join_chunks(split_sections(DOCUMENT))
+    assert len(problems) == 3
+    assert problems[0] == "part 1 came back empty, kept it unchanged"
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import os
+import stat
+
+import pytest
+
+import token_cache
+from token_cache import CachedToken, TokenCache
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(token_cache.time, 'time', clock)
+    return clock
+
+
+class Grants:
+    """
+    A fetch coroutine function handing out token-1, token-2, ... and counting the grants
+    """
+
+    def __init__(self, expires_in=300, delay=0):
+        self.expires_in = expires_in
+        self.delay = delay
+        self.count = 0
+
+    async def __call__(self):
+        self.count += 1
+        number = self.count
+        await asyncio.sleep(self.delay)
+        return {'access_token': f"token-{number}", 'expires_in': self.expires_in}
+
+
+async def settle(cache):
+    await asyncio.gather(*cache._refresh_tasks.values())
+
+
+def test_refresh_ahead_is_the_smaller_of_the_fixed_and_proportional_windows():
+    assert CachedToken('a', 3600, 0).refresh_at() == 3600 - token_cache.REFRESH_AHEAD_SECONDS
+    assert CachedToken('a', 100, 0).refresh_at() == 100 - 100 * token_cache.REFRESH_AHEAD_FRACTION
+
+
+def test_a_token_is_reused_until_the_refresh_window(clock):
+    async def run():
+        cache = TokenCache()
+        grants = Grants()
+        assert await cache.get_async('client', 'scope', grants) == 'token-1'
+        clock.now += 239
+        assert await cache.get_async('client', 'scope', grants) == 'token-1'
+        await settle(cache)
+        return grants.count
+
+    assert asyncio.run(run()) == 1
+
+
+def test_the_token_is_refreshed_in_the_background_before_it_expires(clock):
+    async def run():
+        cache = TokenCache()
+        grants = Grants()
+        await cache.get_async('client', 'scope', grants)
+        clock.now += 250
+        # inside the refresh window the current token is served while the new one is fetched
+        assert await cache.get_async('client', 'scope', grants) == 'token-1'
+        await settle(cache)
+        assert await cache.get_async('client', 'scope', grants) == 'token-2'
+
+    asyncio.run(run())
+
+
+def test_an_expired_token_is_fetched_again_before_returning(clock):
+    async def run():
+        cache = TokenCache()
+        grants = Grants()
+        await cache.get_async('client', 'scope', grants)
+        clock.now += 300
+        return await cache.get_async('client', 'scope', grants)
+
+    assert asyncio.run(run()) == 'token-2'
+
+
+def test_missing_expires_in_uses_the_default(clock):
+    async def run():
+        cache = TokenCache()
+
+        async def grant():
+            return {'access_token': 'token'}
+        await cache.get_async('client', 'scope', grant)
+        return cache._tokens[('client', 'scope')]
+
+    assert asyncio.run(run()).expires_at == clock.now + token_cache.DEFAULT_EXPIRES_IN
+
+
+def test_concurrent_callers_share_one_grant(clock):
+    async def run():
+        cache = TokenCache()
+        grants = Grants(delay=0.01)
+        tokens = await asyncio.gather(*(cache.get_async('client', 'scope', grants) for _ in range(20)))
+        return set(tokens), grants.count
+
+    assert asyncio.run(run()) == ({'token-1'}, 1)
+
+
+def test_tokens_are_kept_per_client_and_scope(clock):
+    async def run():
+        cache = TokenCache()
+        grants = Grants()
+        return [await cache.get_async(*key, grants) for key in [('client', 'a'), ('client', 'b'), ('client', 'a')]]
+
+    assert asyncio.run(run()) == ['token-1', 'token-2', 'token-1']
+
+
+def test_a_failed_grant_is_not_cached(clock):
+    async def run():
+        cache = TokenCache()
+
+        async def no_grant():
+            return None
+        assert await cache.get_async('client', 'scope', no_grant) is None
+        return await cache.get_async('client', 'scope', Grants())
+
+    assert asyncio.run(run()) == 'token-1'
+
+
+def test_a_failed_background_refresh_keeps_the_token_and_waits_to_retry(clock):
+    async def run():
+        cache = TokenCache()
+        calls = []
+
+        async def fetch():
+            calls.append(clock.now)
+            if len(calls) > 1:
+                raise OSError('fusionauth is down')
+            return {'access_token': 'token-1', 'expires_in': 300}
+
+        await cache.get_async('client', 'scope', fetch)
+        clock.now += 250
+        assert await cache.get_async('client', 'scope', fetch) == 'token-1'
+        await settle(cache)
+        assert await cache.get_async('client', 'scope', fetch) == 'token-1'
+        assert len(calls) == 2
+        clock.now += token_cache.REFRESH_RETRY_SECONDS
+        await cache.get_async('client', 'scope', fetch)
+        await settle(cache)
+        return len(calls)
+
+    assert asyncio.run(run()) == 3
+
+
+def test_a_rejected_token_is_discarded_and_granted_again(clock):
+    async def run():
+        cache = TokenCache()
+        grants = Grants(delay=0.01)
+        rejected = await cache.get_async('client', 'scope', grants)
+
+        # every call that got the 401 discards the token and asks for another; one grant serves them all
+        async def renew():
+            cache.discard(rejected)
+            return await cache.get_async('client', 'scope', grants)
+        renewed = await asyncio.gather(*(renew() for _ in range(5)))
+        # a late 401 for the old token doesn't throw away its replacement
+        cache.discard(rejected)
+        return rejected, set(renewed), await cache.get_async('client', 'scope', grants), grants.count
+
+    assert asyncio.run(run()) == ('token-1', {'token-2'}, 'token-2', 2)
+
+
+def test_tokens_survive_a_restart_in_a_private_file(clock, tmp_path):
+    path = str(tmp_path / 'tokens.json')
+    asyncio.run(TokenCache(path).get_async('client', 'scope', Grants()))
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    async def reload():
+        return await TokenCache(path).get_async('client', 'scope', Grants())
+
+    assert asyncio.run(reload()) == 'token-1'
+    clock.now += 300
+    assert TokenCache(path)._tokens == {}
+
+
+def test_discarding_a_token_removes_it_from_the_file(clock, tmp_path):
+    path = str(tmp_path / 'tokens.json')
+    cache = TokenCache(path)
+    token = asyncio.run(cache.get_async('client', 'scope', Grants()))
+    cache.discard(token)
+    assert TokenCache(path)._tokens == {}
+
+
+def test_malformed_entries_are_skipped_on_load(clock, tmp_path):
+    path = tmp_path / 'tokens.json'
+    good = dict(CachedToken('good', clock.now + 300, clock.now).to_dict(), client_id='client', scope='scope')
+    path.write_text(json.dumps([{'access_token': 'no expiry'}, 'not a dict', good]))
+
+    assert list(TokenCache(str(path))._tokens) == [('client', 'scope')]
+
+
+def test_an_unreadable_file_starts_an_empty_cache(tmp_path):
+    path = tmp_path / 'tokens.json'
+    path.write_text('{not json')
+
+    assert TokenCache(str(path))._tokens == {}
@@ -0,0 +1,23 @@
+from tracing import Span, summarize
+
+
+def span(attributes, duration=1.0):
+    return Span('agentcore.invoke', 'trace', attributes=dict(attributes, stage='draft'), duration=duration)
+
+
+def test_summarize_totals_tokens_per_stage():
+    summary = summarize([span({'input_tokens': 10, 'output_tokens': 5}), span({'input_tokens': 20, 'output_tokens': 7})])
+    assert summary[('draft', 'agentcore.invoke')]['input_tokens'] == 30
+    assert summary[('draft', 'agentcore.invoke')]['output_tokens'] == 12
+
+
+def test_summarize_treats_null_token_counts_as_zero():
+    spans = [Span.from_dict(span({'input_tokens': None, 'output_tokens': 5}).to_dict()), span({'input_tokens': 20, 'output_tokens': None})]
+    summary = summarize(spans)
+    assert summary[('draft', 'agentcore.invoke')]['input_tokens'] == 20
+    assert summary[('draft', 'agentcore.invoke')]['output_tokens'] == 5
+
+
+def test_summarize_leaves_tokens_out_when_no_span_counted_them():
+    summary = summarize([span({'input_tokens': None}), span({})])
+    assert summary[('draft', 'agentcore.invoke')]['input_tokens'] is None
@@ -0,0 +1,24 @@
+from patches import Edit
+from validation_result import ValidationResult, parse_validation_result
+
+
+def test_a_valid_verdict_needs_no_content():
+    assert parse_validation_result('{"verdict": "valid"}') == ValidationResult('valid', [], None, None)
+
+
+def test_an_invalid_verdict_carries_corrected_content_or_edits():
+    corrected = parse_validation_result('{"verdict": "invalid", "issues": ["wrong"], "corrected_content": "fixed"}')
+    assert corrected == ValidationResult('invalid', ['wrong'], 'fixed', None)
+
+    patched = parse_validation_result('{"verdict": "invalid", "issues": [], "edits": [{"anchor": "a", "replacement": "b"}]}')
+    assert patched == ValidationResult('invalid', [], None, [Edit('a', 'b')])
+
+
+def test_replies_that_cannot_be_used_fall_back():
+    # None tells the validation stage to fall back to the separate validate and rewrite calls
+    assert parse_validation_result('') is None
+    assert parse_validation_result('looks fine to me') is None
+    assert parse_validation_result('{"verdict": "maybe"}') is None
+    assert parse_validation_result('{"verdict": "valid", "issues": "none"}') is None
+    assert parse_validation_result('{"verdict": "invalid", "issues": []}') is None
+    assert parse_validation_result('{"verdict": "invalid", "corrected_content": "  "}') is None
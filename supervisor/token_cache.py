@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+from storage import atomic_write_json
+
+# refresh this many seconds (or this fraction of the lifetime, whichever is smaller) before a token expires
+REFRESH_AHEAD_SECONDS = 60
+REFRESH_AHEAD_FRACTION = 0.2
+
+# used when the grant response has no expires_in
+DEFAULT_EXPIRES_IN = 3600
+
+# wait this long after a failed refresh before trying again, while the current token is still valid
+REFRESH_RETRY_SECONDS = 15
+
+
+class CachedToken:
+    def __init__(self, access_token, expires_at, obtained_at):
+        self.access_token = access_token
+        self.expires_at = expires_at
+        self.obtained_at = obtained_at
+
+    def is_valid(self, now=None):
+        now = time.time() if now is None else now
+        return now < self.expires_at
+
+    def refresh_at(self):
+        lifetime = self.expires_at - self.obtained_at
+        return self.expires_at - min(REFRESH_AHEAD_SECONDS, lifetime * REFRESH_AHEAD_FRACTION)
+
+    def to_dict(self):
+        return {
+            "access_token": self.access_token,
+            "expires_at": self.expires_at,
+            "obtained_at": self.obtained_at
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["access_token"], data["expires_at"], data["obtained_at"])
+
+
+class TokenCache:
+    """
+    Cache of client credentials access tokens keyed by (client_id, scope).
+
+    The fetch coroutine function passed to get_async() must return the grant response
+    (a dict with access_token and expires_in) or None. Only one fetch runs per key at a
+    time, and tokens are refreshed in a task on the running event loop shortly before
+    they expire.
+
+    A token whose refresh fails keeps being served until it expires, so a FusionAuth
+    outage shorter than the refresh window goes unnoticed.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._tokens = {}
+        self._async_locks = {}
+        self._refresh_tasks = {}
+        self._refresh_retry_at = {}
+        self._lock = threading.Lock()
+        if self.path:
+            self._load()
+
+    async def get_async(self, client_id, scope, fetch):
+        """
+        Return a valid access token for (client_id, scope), awaiting fetch on a miss
+        """
+        key = (client_id, scope)
+        token = self._tokens.get(key)
+        if token is not None and token.is_valid():
+            now = time.time()
+            if now >= token.refresh_at() and key not in self._refresh_tasks and now >= self._refresh_retry_at.get(key, 0):
+                self._refresh_tasks[key] = asyncio.create_task(self._refresh_async(key, fetch))
+            return token.access_token
+
+        async with self._async_lock(key):
+            token = self._tokens.get(key)
+            if token is not None and token.is_valid():
+                return token.access_token
+            token = self._store(key, await fetch())
+            return token.access_token if token else None
+
+    def discard(self, access_token):
+        """
+        Drop access_token, e.g. after it was rejected, so the next get_async fetches a new one.
+        A token that has already been replaced is left alone.
+        """
+        with self._lock:
+            keys = [key for key, token in self._tokens.items() if token.access_token == access_token]
+            for key in keys:
+                del self._tokens[key]
+        if keys:
+            self._save()
+
+    def _async_lock(self, key):
+        if key not in self._async_locks:
+            self._async_locks[key] = asyncio.Lock()
+        return self._async_locks[key]
+
+    async def _refresh_async(self, key, fetch):
+        try:
+            async with self._async_lock(key):
+                self._store(key, await fetch())
+        except Exception as e:
+            self._refresh_retry_at[key] = time.time() + REFRESH_RETRY_SECONDS
+            print(f"Background token refresh failed, using the current token until it expires: {e}")
+        finally:
+            self._refresh_tasks.pop(key, None)
+
+    def _store(self, key, token_data):
+        if not token_data or not token_data.get('access_token'):
+            return None
+
+        now = time.time()
+        expires_in = token_data.get('expires_in') or DEFAULT_EXPIRES_IN
+        token = CachedToken(token_data['access_token'], now + float(expires_in), now)
+        with self._lock:
+            self._tokens[key] = token
+        self._save()
+        return token
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as file:
+                stored = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable token cache {self.path}: {e}")
+            return
+        now = time.time()
+        for entry in stored if isinstance(stored, list) else []:
+            try:
+                token = CachedToken.from_dict(entry)
+                key = (entry["client_id"], entry["scope"])
+                valid = token.is_valid(now)
+            except (KeyError, TypeError) as e:
+                # a bad entry costs one fresh grant, not the whole cache
+                print(f"Ignoring malformed entry in token cache {self.path}: {e!r}")
+                continue
+            if valid:
+                self._tokens[key] = token
+
+    def _save(self):
+        if not self.path:
+            return
+        with self._lock:
+            entries = [dict(token.to_dict(), client_id=key[0], scope=key[1]) for key, token in self._tokens.items()]
+        # tokens are credentials, keep the file private to the current user
+        atomic_write_json(self.path, entries, private=True)
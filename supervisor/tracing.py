@@ -0,0 +1,357 @@
+import argparse
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import httpx
+
+DEFAULT_OTLP_ENDPOINT = "http://localhost:4318/v1/traces"
+OTLP_BATCH_SIZE = 100
+MAX_SPANS = 100000
+
+# the innermost open span; spans opened inside it (including in tasks it starts) become its children
+current_span = contextvars.ContextVar('current_span', default=None)
+
+
+def new_trace_id():
+    """
+    A 32 hex digit trace id whose first 8 digits are the epoch seconds, so it also maps onto an X-Ray trace id
+    """
+    return f"{int(time.time()):08x}{os.urandom(12).hex()}"
+
+
+def new_span_id():
+    return os.urandom(8).hex()
+
+
+def xray_trace_header(trace_id, parent_id):
+    """
+    The X-Amzn-Trace-Id header value for a trace id from new_trace_id
+    """
+    return f"Root=1-{trace_id[:8]}-{trace_id[8:]};Parent={parent_id};Sampled=1"
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, service='supervisor', span_id=None, start=None, duration=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id or new_span_id()
+        self.parent_id = parent_id
+        self.attributes = attributes or {}
+        self.service = service
+        self.start = start if start is not None else time.time()
+        self.duration = duration
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'service': self.service,
+            'start': self.start,
+            'duration': self.duration,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        span = cls(data['name'], data['trace_id'], data.get('parent_id'), data.get('attributes'),
+                   data.get('service', 'supervisor'), data.get('span_id'), data.get('start'), data.get('duration'))
+        span.error = data.get('error')
+        return span
+
+
+class JsonLinesExporter:
+    """
+    Appends one json object per finished span to a file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps(span.to_dict()) + "\n"
+        with self._lock:
+            with open(self.path, 'a') as file:
+                file.write(line)
+
+    def flush(self):
+        pass
+
+
+class OtlpExporter:
+    """
+    Sends spans to an OpenTelemetry collector as OTLP/HTTP json, in batches, from a background thread
+    """
+
+    def __init__(self, endpoint=DEFAULT_OTLP_ENDPOINT, batch_size=OTLP_BATCH_SIZE):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def export(self, span):
+        self._queue.put(span)
+
+    def flush(self, timeout=5):
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _run(self):
+        with httpx.Client(timeout=5) as client:
+            batch = []
+            while True:
+                item = self._queue.get()
+                if isinstance(item, Span):
+                    batch.append(item)
+                    if len(batch) < self.batch_size:
+                        continue
+                self._send(client, batch)
+                batch = []
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _send(self, client, spans):
+        if not spans:
+            return
+        try:
+            response = client.post(self.endpoint, json=otlp_payload(spans))
+            if response.status_code >= 400:
+                print(f"Error exporting {len(spans)} spans: {response.status_code} {response.text[:200]}")
+        except httpx.HTTPError as e:
+            print(f"Exception occurred exporting spans: {e}")
+
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def otlp_payload(spans):
+    """
+    The OTLP/HTTP json body for a list of spans, grouped by the service that recorded them
+    """
+    services = {}
+    for span in spans:
+        otlp_span = {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': 3 if span.name.startswith('agentcore.') else 1,
+            'startTimeUnixNano': str(int(span.start * 1e9)),
+            'endTimeUnixNano': str(int((span.start + (span.duration or 0)) * 1e9)),
+            'attributes': [{'key': key, 'value': otlp_value(value)} for key, value in span.attributes.items()],
+            'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+        }
+        if span.parent_id:
+            otlp_span['parentSpanId'] = span.parent_id
+        services.setdefault(span.service, []).append(otlp_span)
+    return {'resourceSpans': [
+        {
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service}}]},
+            'scopeSpans': [{'scope': {'name': 'fusionauth-agentcore'}, 'spans': otlp_spans}],
+        }
+        for service, otlp_spans in services.items()
+    ]}
+
+
+class Tracer:
+    """
+    Records timed spans, keeping the most recent in memory for summary() and passing
+    every finished span to the exporters.
+
+    Spans carry a stage attribute, inherited from their parent, so the summary can
+    break timings down per pipeline stage.
+    """
+
+    def __init__(self, exporters=(), max_spans=MAX_SPANS):
+        self.exporters = list(exporters)
+        self.spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    @property
+    def exporting(self):
+        return bool(self.exporters)
+
+    def start(self, name, **attributes):
+        parent = current_span.get()
+        if parent is not None and 'stage' in parent.attributes:
+            attributes.setdefault('stage', parent.attributes['stage'])
+        return Span(
+            name,
+            parent.trace_id if parent is not None else new_trace_id(),
+            parent.span_id if parent is not None else None,
+            {key: value for key, value in attributes.items() if value is not None}
+        )
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """
+        Time the body as a child of the current span, or as the root of a new trace
+        """
+        span = self.start(name, **attributes)
+        token = current_span.set(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = type(e).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            current_span.reset(token)
+            self.finish(span)
+
+    def record(self, name, duration, start=None, **attributes):
+        """
+        Record a span timed by the caller as a child of the current span. start defaults to duration seconds ago.
+        """
+        span = self.start(name, **attributes)
+        span.duration = duration
+        span.start = start if start is not None else time.time() - duration
+        self.finish(span)
+        return span
+
+    def record_remote(self, spans, service):
+        """
+        Record spans reported by another service, such as the agent runtime, under the current span's stage
+        """
+        parent = current_span.get()
+        for data in spans or []:
+            try:
+                span = Span.from_dict(data)
+            except (KeyError, TypeError):
+                continue
+            span.service = service
+            if parent is not None and 'stage' in parent.attributes:
+                span.attributes.setdefault('stage', parent.attributes['stage'])
+            self.finish(span)
+
+    def finish(self, span):
+        with self._lock:
+            self.spans.append(span)
+        for exporter in self.exporters:
+            exporter.export(span)
+
+    def flush(self):
+        for exporter in self.exporters:
+            exporter.flush()
+
+    def summary(self):
+        return format_summary(summarize(self.spans))
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(spans):
+    """
+    Latency percentiles and token totals for each (stage, span name)
+    """
+    durations = {}
+    tokens = {}
+    for span in spans:
+        if span.duration is None:
+            continue
+        key = (span.attributes.get('stage', '-'), span.name)
+        durations.setdefault(key, []).append(span.duration)
+        # spans read back from a file or reported by the agent may carry null counts
+        input_tokens = span.attributes.get('input_tokens')
+        output_tokens = span.attributes.get('output_tokens')
+        if input_tokens is not None or output_tokens is not None:
+            totals = tokens.setdefault(key, [0, 0])
+            totals[0] += input_tokens or 0
+            totals[1] += output_tokens or 0
+
+    summary = {}
+    for key, values in sorted(durations.items()):
+        values.sort()
+        summary[key] = {
+            'count': len(values),
+            'p50': percentile(values, 0.50),
+            'p95': percentile(values, 0.95),
+            'p99': percentile(values, 0.99),
+            'max': values[-1],
+            'input_tokens': tokens[key][0] if key in tokens else None,
+            'output_tokens': tokens[key][1] if key in tokens else None,
+        }
+    return summary
+
+
+def format_summary(summary):
+    if not summary:
+        return "no spans recorded"
+    lines = [f"{'stage':10} {'span':26} {'count':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  tokens in/out"]
+    for (stage, name), metric in summary.items():
+        tokens = f"  {metric['input_tokens']}/{metric['output_tokens']}" if metric['input_tokens'] is not None else ""
+        lines.append(f"{stage:10} {name:26} {metric['count']:6} {metric['p50']:8.3f} {metric['p95']:8.3f} "
+                     f"{metric['p99']:8.3f} {metric['max']:8.3f}{tokens}")
+    return "\n".join(lines)
+
+
+def exporters_from_env():
+    """
+    TRACE_PATH appends spans to a json-lines file; OTLP_ENDPOINT (or OTEL_EXPORTER_OTLP_ENDPOINT) sends them to a collector
+    """
+    exporters = []
+    if os.getenv('TRACE_PATH'):
+        exporters.append(JsonLinesExporter(os.getenv('TRACE_PATH')))
+    otlp_endpoint = os.getenv('OTLP_ENDPOINT')
+    if not otlp_endpoint and os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT'):
+        otlp_endpoint = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT').rstrip('/') + '/v1/traces'
+    if otlp_endpoint:
+        exporters.append(OtlpExporter(otlp_endpoint))
+    return exporters
+
+
+# exporters are added once the environment is loaded, see invoke.py
+tracer = Tracer()
+atexit.register(tracer.flush)
+
+
+def load_spans(path):
+    spans = []
+    with open(path, 'r') as file:
+        for line in file:
+            if line.strip():
+                spans.append(Span.from_dict(json.loads(line)))
+    return spans
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Print per-stage latency percentiles and token usage from a json-lines trace file")
+    parser.add_argument('path', help="file written with TRACE_PATH set")
+    parser.add_argument('--service', help="only include spans from this service, e.g. supervisor or agent")
+    args = parser.parse_args(argv)
+
+    spans = load_spans(args.path)
+    if args.service:
+        spans = [span for span in spans if span.service == args.service]
+    print(format_summary(summarize(spans)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import json
+
+AGENTCORE_ENDPOINT = "https://bedrock-agentcore.{region}.amazonaws.com"
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 5
+# agents can take minutes to write a long post
+DEFAULT_READ_TIMEOUT = 600
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def parse_stream_event(line):
+    """
+    Parse one line of the runtime's server-sent event stream into a dict, or None for non-data lines
+    """
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    if not line.startswith('data:'):
+        return None
+    data = line[len('data:'):].strip()
+    if not data:
+        return None
+    try:
+        event = json.loads(data)
+    except ValueError:
+        return {"delta": data}
+    # the runtime json-encodes whatever the entrypoint yields, so plain strings arrive as json strings
+    return event if isinstance(event, dict) else {"delta": str(event)}
@@ -0,0 +1,48 @@
+import json
+from collections import namedtuple
+
+from patches import parse_edits, strip_code_fence
+
+VERDICTS = ('valid', 'invalid')
+
+ValidationResult = namedtuple('ValidationResult', ['verdict', 'issues', 'corrected_content', 'edits'])
+
+
+def parse_validation_result(text):
+    """
+    Parse the validation agent's structured reply into a ValidationResult.
+
+    Returns None if the reply is not json or does not match the expected shape:
+    verdict is "valid" or "invalid", issues is a list of strings, and when the verdict
+    is "invalid" there is either a non-empty corrected_content string or a non-empty
+    list of edits.
+    """
+    if not text:
+        return None
+
+    try:
+        data = json.loads(strip_code_fence(text))
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    verdict = data.get('verdict')
+    if verdict not in VERDICTS:
+        return None
+
+    issues = data.get('issues', [])
+    if not isinstance(issues, list) or not all(isinstance(issue, str) for issue in issues):
+        return None
+
+    if verdict == 'valid':
+        return ValidationResult(verdict, issues, None, None)
+
+    corrected_content = data.get('corrected_content')
+    if isinstance(corrected_content, str) and corrected_content.strip():
+        return ValidationResult(verdict, issues, corrected_content, None)
+
+    edits = parse_edits(data.get('edits'))
+    if edits:
+        return ValidationResult(verdict, issues, None, edits)
+    return None